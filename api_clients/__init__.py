@@ -1,20 +1,27 @@
+import threading
 from typing import Dict, Any, Optional
 from api_clients.binance_client import BinanceClient
 from api_clients.finnhub_client import FinnhubClient
 from api_clients.metals_api_client import MetalsAPIClient
+from api_clients.circuit_breaker import get_breaker, all_breakers, CircuitOpenError
 from config.database import get_connection
 
 class APIClientFactory:
     """API 客户端工厂，管理 API key 和客户端实例"""
     
     _instances: Dict[str, Any] = {}
+    _lock = threading.Lock()
     
     @classmethod
     def get_client(cls, api_name: str) -> Any:
         """获取或创建 API 客户端"""
-        if api_name not in cls._instances:
-            cls._instances[api_name] = cls._create_client(api_name)
-        return cls._instances[api_name]
+        client = cls._instances.get(api_name)
+        if client is None:
+            with cls._lock:
+                if api_name not in cls._instances:
+                    cls._instances[api_name] = cls._create_client(api_name)
+                client = cls._instances[api_name]
+        return client
     
     @classmethod
     def _create_client(cls, api_name: str) -> Any:
@@ -22,38 +29,47 @@ class APIClientFactory:
         conn = get_connection()
         cursor = conn.cursor()
         cursor.execute(
-            'SELECT api_key FROM api_configs WHERE api_name = ? AND status = 1',
+            'SELECT api_key, rate_limit FROM api_configs WHERE api_name = ? AND status = 1',
             (api_name,)
         )
         row = cursor.fetchone()
-        conn.close()
         
         api_key = row[0] if row else None
+        # 每分钟配额，用于该数据源共享的令牌桶
+        rate_limit = row[1] if row else None
         
         if api_name == 'binance':
-            return BinanceClient(api_key)
+            return BinanceClient(api_key, rate_limit)
         elif api_name == 'finnhub':
             if not api_key:
                 raise ValueError("Finnhub API key is required")
-            return FinnhubClient(api_key)
+            return FinnhubClient(api_key, rate_limit)
         elif api_name == 'metals-api':
             if not api_key:
                 raise ValueError("Metals-API key is required")
-            return MetalsAPIClient(api_key)
+            return MetalsAPIClient(api_key, rate_limit)
         else:
             raise ValueError(f"Unknown API: {api_name}")
     
+    @staticmethod
+    def is_available(api_name: str) -> bool:
+        """数据源当前是否放行请求（熔断中且未到探测时间时为 False）"""
+        return get_breaker(api_name).available()
+    
+    @staticmethod
+    def health() -> Dict[str, Dict[str, Any]]:
+        """各数据源的熔断状态：state / consecutive_failures / retry_in（秒）"""
+        return {name: breaker.snapshot() for name, breaker in sorted(all_breakers().items())}
+    
     @classmethod
     def set_api_key(cls, api_name: str, api_key: str):
         """设置 API key"""
         conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            'UPDATE api_configs SET api_key = ?, updated_at = CURRENT_TIMESTAMP WHERE api_name = ?',
-            (api_key, api_name)
-        )
-        conn.commit()
-        conn.close()
+        with conn:
+            conn.execute(
+                'UPDATE api_configs SET api_key = ?, updated_at = CURRENT_TIMESTAMP WHERE api_name = ?',
+                (api_key, api_name)
+            )
         
         # 清除缓存，下次重新创建
         if api_name in cls._instances:
@@ -1,24 +1,181 @@
-import requests
+import os
+import random
 import time
-from typing import Optional, Dict, Any
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import requests
+from typing import Optional, Dict, Any, List
+from .rate_limiter import get_limiter
+from .circuit_breaker import get_breaker, CircuitOpenError
+from .latency import get_latency_tracker, DEFAULT_TIMEOUT
+from config import clock
+from config.metrics import (
+    API_REQUEST_SECONDS, API_REQUESTS_TOTAL, RATE_LIMIT_WAIT_SECONDS, API_RETRIES_TOTAL, API_HEDGED_REQUESTS_TOTAL
+)
+
+# 连接错误、超时、5xx 的最多重试次数（每次重试需要限速器有余量，否则直接失败）
+MAX_RETRIES = int(os.getenv('MARKET_MONITOR_API_RETRIES', '2'))
+# 重试退避：第 n 次重试前随机等待 [0, min(RETRY_BACKOFF * 2^n, RETRY_BACKOFF_MAX)) 秒
+RETRY_BACKOFF = 0.2
+RETRY_BACKOFF_MAX = 2.0
+
+# 对冲请求时主请求和对冲请求都在该线程池中执行
+_request_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix='api-request')
 
 class BaseAPIClient:
     """API客户端基类"""
     
-    def __init__(self, api_name: str, base_url: str, api_key: Optional[str] = None):
+    # 是否原生支持一次请求获取多个标的
+    supports_batch = False
+    # 录制原始响应（api_clients.recording.Recorder），为 None 时不录制
+    recorder = None
+    
+    def __init__(self, api_name: str, base_url: str, api_key: Optional[str] = None,
+                 rate_limit: Optional[int] = None):
         self.api_name = api_name
         self.base_url = base_url
         self.api_key = api_key
         self.session = requests.Session()
-        self.last_request_time = 0
+        # 同一数据源的所有实例共享令牌桶，配额来自 api_configs.rate_limit
+        self.limiter = get_limiter(api_name, rate_limit)
+        # 同一数据源共享熔断器，数据源故障时请求直接失败，不再等超时和限速
+        self.breaker = get_breaker(api_name)
+        # 同一数据源共享各接口的耗时分位数，用于自适应超时和对冲请求
+        self.latency = get_latency_tracker(api_name)
+    
+    def _rate_limit(self, weight: float = 1):
+        """按请求权重获取令牌，有余量时不等待"""
+        waited = self.limiter.acquire(weight)
+        RATE_LIMIT_WAIT_SECONDS.observe(waited, provider=self.api_name)
+    
+    def _get(self, path: str, params: Dict[str, Any], weight: float = 1) -> Any:
+        """
+        发送限速的 GET 请求，根据响应头校正配额，返回解析后的 JSON
+        熔断中直接抛出 CircuitOpenError（不占用限速配额）
+        """
+        if not self.breaker.allow_request():
+            raise CircuitOpenError(f"{self.api_name} circuit open, retry in {self.breaker.retry_in():.0f}s")
+        
+        requested_at = clock.timestamp()
+        try:
+            self._rate_limit(weight)
+            data = self._request_with_retries(path, params, weight)
+        except Exception as e:
+            if self._is_provider_failure(e):
+                if self.breaker.record_failure():
+                    # 断开时换一个会话，丢弃连接池中可能已失效的连接
+                    self.session.close()
+                    self.session = requests.Session()
+            else:
+                self.breaker.record_success()
+            if self.recorder is not None:
+                self.recorder.record(self.api_name, path, params, requested_at, error=str(e))
+            raise
+        self.breaker.record_success()
+        if self.recorder is not None:
+            self.recorder.record(self.api_name, path, params, requested_at, data=data)
+        return data
     
-    def _rate_limit(self, min_interval: float = 0.5):
-        """简单的速率限制"""
-        elapsed = time.time() - self.last_request_time
-        if elapsed < min_interval:
-            time.sleep(min_interval - elapsed)
-        self.last_request_time = time.time()
+    def _request_with_retries(self, path: str, params: Dict[str, Any], weight: float = 1) -> Any:
+        """
+        连接错误、超时、5xx 时按带随机抖动的指数退避重试
+        只在数据源此前正常时重试（连续失败时交给熔断器），且只用限速器的余量（try_acquire），
+        配额紧张时直接失败，不与正常请求争抢配额
+        """
+        attempt = 0
+        while True:
+            try:
+                return self._request_hedged(path, params, weight)
+            except Exception as e:
+                if attempt >= MAX_RETRIES or not self._is_retryable(e) or not self.breaker.healthy():
+                    raise
+                time.sleep(random.uniform(0, min(RETRY_BACKOFF * 2 ** attempt, RETRY_BACKOFF_MAX)))
+                if not self.limiter.try_acquire(weight):
+                    raise
+                attempt += 1
+                API_RETRIES_TOTAL.inc(provider=self.api_name, endpoint=path)
+    
+    def _request_hedged(self, path: str, params: Dict[str, Any], weight: float = 1) -> Any:
+        """
+        请求超过该接口 p95 耗时仍未返回时，在限速器有余量的前提下再发一个相同的请求，取先成功的结果
+        样本不足或未启用对冲时直接请求
+        """
+        timeout = self.latency.timeout(path)
+        hedge_delay = self.latency.hedge_delay(path)
+        if hedge_delay is None:
+            return self._request(path, params, timeout)
+        
+        primary = _request_executor.submit(self._request, path, params, timeout)
+        done, _ = wait([primary], timeout=hedge_delay)
+        if done or not self.limiter.try_acquire(weight):
+            return primary.result()
+        
+        hedge = _request_executor.submit(self._request, path, params, timeout)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    API_HEDGED_REQUESTS_TOTAL.inc(provider=self.api_name, endpoint=path,
+                                                  winner='hedge' if future is hedge else 'primary')
+                    return future.result()
+                error = future.exception()
+        API_HEDGED_REQUESTS_TOTAL.inc(provider=self.api_name, endpoint=path, winner='none')
+        raise error
+    
+    @staticmethod
+    def _is_retryable(error: Exception) -> bool:
+        """可以重试的失败：连接错误、超时、5xx（429 由限速器暂停，不重试）"""
+        if isinstance(error, requests.HTTPError) and error.response is not None:
+            return error.response.status_code >= 500
+        return isinstance(error, requests.RequestException)
+    
+    @staticmethod
+    def is_rejected(error: Exception) -> bool:
+        """请求本身被拒绝（429 以外的 4xx，如参数中有不存在的标的），换个请求可能成功"""
+        if isinstance(error, requests.HTTPError) and error.response is not None:
+            status = error.response.status_code
+            return 400 <= status < 500 and status != 429
+        return False
+    
+    @staticmethod
+    def _is_provider_failure(error: Exception) -> bool:
+        """是否说明数据源不可用：连接失败、超时、5xx、429；其他 4xx（如标的不存在）不计入熔断"""
+        return not BaseAPIClient.is_rejected(error)
+    
+    def _request(self, path: str, params: Dict[str, Any], timeout: float = DEFAULT_TIMEOUT) -> Any:
+        """发送 GET 请求并记录耗时和状态码；成功和超时的耗时计入该接口的分位数统计"""
+        started = time.perf_counter()
+        status = 'error'
+        try:
+            response = self.session.get(f"{self.base_url}{path}", params=params, timeout=timeout)
+            status = str(response.status_code)
+        except requests.Timeout:
+            self.latency.observe(path, time.perf_counter() - started)
+            raise
+        finally:
+            API_REQUEST_SECONDS.observe(time.perf_counter() - started, provider=self.api_name, endpoint=path)
+            API_REQUESTS_TOTAL.inc(provider=self.api_name, endpoint=path, status=status)
+        self.limiter.update_from_response(response.status_code, response.headers)
+        response.raise_for_status()
+        data = response.json()
+        self.latency.observe(path, time.perf_counter() - started)
+        return data
     
     def get_price(self, symbol: str) -> Dict[str, Any]:
         """获取价格，子类必须实现"""
         raise NotImplementedError
+    
+    def get_prices(self, symbols: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        批量获取价格，返回 symbol -> 行情数据
+        默认逐个调用 get_price，获取失败的标的不出现在结果中；
+        支持批量接口的子类应覆盖此方法并将 supports_batch 设为 True
+        """
+        results = {}
+        for symbol in symbols:
+            try:
+                results[symbol] = self.get_price(symbol)
+            except Exception:
+                continue
+        return results
@@ -1,48 +1,75 @@
-import requests
+import json
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List
 from .base_client import BaseAPIClient
 
 class BinanceClient(BaseAPIClient):
     """Binance API 客户端 - 用于加密货币"""
     
-    def __init__(self, api_key: Optional[str] = None):
-        super().__init__('binance', 'https://api.binance.com', api_key)
+    supports_batch = True
+    
+    def __init__(self, api_key: Optional[str] = None, rate_limit: Optional[int] = None):
+        super().__init__('binance', 'https://api.binance.com', api_key, rate_limit)
+    
+    @staticmethod
+    def _ticker_weight(count: int) -> int:
+        """24hr ticker 的请求权重（随标的数量分档）"""
+        if count <= 20:
+            return 2
+        if count <= 100:
+            return 40
+        return 80
     
     def get_price(self, symbol: str) -> Dict[str, Any]:
         """
         获取最新价格
         symbol: 如 BTCUSDT, ETHUSDT
         """
-        self._rate_limit(0.1)  # Binance 限制较宽松
-        
-        url = f"{self.base_url}/api/v3/ticker/24hr"
         params = {'symbol': symbol}
+        data = self._get('/api/v3/ticker/24hr', params, weight=self._ticker_weight(1))
+        return self._parse_ticker(data)
+    
+    def get_prices(self, symbols: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        批量获取最新价格，一次请求返回所有标的
+        symbols: 如 ['BTCUSDT', 'ETHUSDT']
+        """
+        if not symbols:
+            return {}
         
-        response = self.session.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
+        params = {'symbols': json.dumps(list(symbols), separators=(',', ':'))}
+        tickers = self._get('/api/v3/ticker/24hr', params, weight=self._ticker_weight(len(symbols)))
         
+        results = {}
+        for data in tickers:
+            item = self._parse_ticker(data)
+            results[item['symbol']] = item
+        return results
+    
+    def _parse_ticker(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """解析 24hr ticker 数据"""
         # Binance 返回的是24小时统计数据
         return {
-            'symbol': symbol,
+            'symbol': data['symbol'],
             'price': float(data['lastPrice']),
             'volume': float(data['volume']),
             'market_time': datetime.fromtimestamp(data['closeTime'] / 1000),
             'source_api': 'binance'
         }
     
-    def get_kline(self, symbol: str, interval: str = '1m', limit: int = 1) -> list:
-        """获取K线数据"""
-        self._rate_limit(0.1)
-        
-        url = f"{self.base_url}/api/v3/klines"
+    def get_kline(self, symbol: str, interval: str = '1m', limit: int = 1,
+                  start_time: Optional[int] = None, end_time: Optional[int] = None) -> list:
+        """
+        获取K线数据
+        start_time / end_time: 开盘时间范围（毫秒时间戳，含端点），用于分页拉取历史
+        """
         params = {
             'symbol': symbol,
             'interval': interval,
             'limit': limit
         }
-        
-        response = self.session.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        return response.json()
+        if start_time is not None:
+            params['startTime'] = start_time
+        if end_time is not None:
+            params['endTime'] = end_time
+        return self._get('/api/v3/klines', params, weight=2)
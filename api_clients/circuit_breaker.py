@@ -0,0 +1,119 @@
+import os
+import threading
+import time
+from typing import Any, Dict
+
+from config.metrics import CIRCUIT_TRANSITIONS_TOTAL
+
+# 连续失败多少次后断开
+FAILURE_THRESHOLD = int(os.getenv('MARKET_MONITOR_CIRCUIT_FAILURES', '5'))
+# 断开后多久放行一个探测请求（秒）
+RECOVERY_SECONDS = float(os.getenv('MARKET_MONITOR_CIRCUIT_RECOVERY_SECONDS', '30'))
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """数据源熔断中，请求未发出"""
+
+
+class CircuitBreaker:
+    """
+    数据源熔断器（线程安全）
+    closed:    正常放行，连续失败 failure_threshold 次后转为 open
+    open:      直接拒绝，recovery_seconds 后转为 half_open
+    half_open: 只放行一个探测请求，成功恢复 closed，失败回到 open 并重新计时；探测期间其他请求仍被拒绝
+    """
+
+    def __init__(self, name: str, failure_threshold: int = FAILURE_THRESHOLD,
+                 recovery_seconds: float = RECOVERY_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_seconds = recovery_seconds
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+    def _transition(self, state: str):
+        self.state = state
+        CIRCUIT_TRANSITIONS_TOTAL.inc(provider=self.name, state=state)
+
+    def healthy(self) -> bool:
+        """closed 且最近一次请求成功"""
+        with self._lock:
+            return self.state == CLOSED and self.failures == 0
+
+    def available(self) -> bool:
+        """当前是否会放行请求（不占用探测名额），用于整组请求前快速判断"""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                return time.monotonic() - self.opened_at >= self.recovery_seconds
+            return not self._probing
+
+    def allow_request(self) -> bool:
+        """请求前调用；返回 False 时不应发出请求"""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.recovery_seconds:
+                    return False
+                self._transition(HALF_OPEN)
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+            if self.state != CLOSED:
+                self._transition(CLOSED)
+
+    def record_failure(self) -> bool:
+        """记录一次失败，返回是否因此断开"""
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self._probing = False
+                self.opened_at = time.monotonic()
+                self._transition(OPEN)
+                return True
+            return False
+
+    def retry_in(self) -> float:
+        """距离下次放行探测请求的秒数（未断开时为 0）"""
+        with self._lock:
+            if self.state != OPEN:
+                return 0.0
+            return max(0.0, self.recovery_seconds - (time.monotonic() - self.opened_at))
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            state, failures = self.state, self.failures
+        return {'state': state, 'consecutive_failures': failures, 'retry_in': round(self.retry_in(), 1)}
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(api_name: str) -> CircuitBreaker:
+    """获取数据源共享的熔断器（同一 api_name 的所有客户端实例共用）"""
+    with _breakers_lock:
+        breaker = _breakers.get(api_name)
+        if breaker is None:
+            breaker = _breakers[api_name] = CircuitBreaker(api_name)
+        return breaker
+
+
+def all_breakers() -> Dict[str, CircuitBreaker]:
+    with _breakers_lock:
+        return dict(_breakers)
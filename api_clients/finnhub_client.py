@@ -1,37 +1,30 @@
-import requests
-from datetime import datetime
 from typing import Dict, Any, Optional
+from config import clock
 from .base_client import BaseAPIClient
 
 class FinnhubClient(BaseAPIClient):
     """Finnhub API 客户端 - 用于美股指数和ETF"""
     
-    def __init__(self, api_key: str):
-        super().__init__('finnhub', 'https://finnhub.io/api/v1', api_key)
+    def __init__(self, api_key: str, rate_limit: Optional[int] = None):
+        super().__init__('finnhub', 'https://finnhub.io/api/v1', api_key, rate_limit)
     
     def get_price(self, symbol: str) -> Dict[str, Any]:
         """
         获取最新价格
         symbol: 如 ^GSPC, ^DJI, ^IXIC, USO
         """
-        self._rate_limit(1.0)  # 免费版 60 calls/min
-        
-        url = f"{self.base_url}/quote"
         params = {
             'symbol': symbol,
             'token': self.api_key
         }
-        
-        response = self.session.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
+        data = self._get('/quote', params)  # 免费版 60 calls/min
         
         # Finnhub 返回的是当前报价
         return {
             'symbol': symbol,
             'price': data['c'],  # 当前价格
             'volume': data.get('v'),  # 成交量
-            'market_time': datetime.now(),  # Finnhub 不返回精确时间戳
+            'market_time': clock.now(),  # Finnhub 不返回精确时间戳
             'source_api': 'finnhub',
             'open': data['o'],
             'high': data['h'],
@@ -41,14 +34,8 @@ class FinnhubClient(BaseAPIClient):
     
     def get_company_profile(self, symbol: str) -> Dict[str, Any]:
         """获取公司信息"""
-        self._rate_limit(1.0)
-        
-        url = f"{self.base_url}/stock/profile2"
         params = {
             'symbol': symbol,
             'token': self.api_key
         }
-        
-        response = self.session.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        return response.json()
+        return self._get('/stock/profile2', params)
@@ -0,0 +1,111 @@
+import os
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+# 没有足够样本时的请求超时（秒），也是自适应超时的上限
+DEFAULT_TIMEOUT = float(os.getenv('MARKET_MONITOR_API_TIMEOUT', '10'))
+# 自适应超时的下限（秒）
+MIN_TIMEOUT = 1.0
+# 超时 = p99 * TIMEOUT_FACTOR
+TIMEOUT_FACTOR = 3.0
+# 请求超过该分位数的耗时仍未返回时发出对冲请求
+HEDGE_QUANTILE = 0.95
+# 对冲请求的最小等待（秒），避免延迟极低的接口几乎每次都对冲
+MIN_HEDGE_DELAY = 0.05
+# 是否启用对冲请求
+HEDGING_ENABLED = os.getenv('MARKET_MONITOR_API_HEDGING', '1') != '0'
+# 每个接口保留的最近耗时样本数
+WINDOW_SIZE = 256
+# 样本数达到多少后才按分位数调整超时、发出对冲请求
+MIN_SAMPLES = 20
+
+
+class EndpointLatency:
+    """单个接口最近 WINDOW_SIZE 次请求的耗时，分位数在样本变化后首次查询时排序计算"""
+
+    __slots__ = ('samples', '_sorted')
+
+    def __init__(self):
+        self.samples: Deque[float] = deque(maxlen=WINDOW_SIZE)
+        self._sorted: Optional[List[float]] = None
+
+    def observe(self, seconds: float):
+        self.samples.append(seconds)
+        self._sorted = None
+
+    def quantile(self, q: float) -> Optional[float]:
+        if len(self.samples) < MIN_SAMPLES:
+            return None
+        if self._sorted is None:
+            self._sorted = sorted(self.samples)
+        return self._sorted[min(int(q * len(self._sorted)), len(self._sorted) - 1)]
+
+
+class LatencyTracker:
+    """
+    数据源各接口的请求耗时分位数（线程安全）
+    成功请求记录实际耗时，超时的请求按超时时长记录，接口变慢时超时随之放宽（不超过 DEFAULT_TIMEOUT）
+    """
+
+    def __init__(self, api_name: str):
+        self.api_name = api_name
+        self._lock = threading.Lock()
+        self._endpoints: Dict[str, EndpointLatency] = {}
+
+    def observe(self, endpoint: str, seconds: float):
+        with self._lock:
+            latency = self._endpoints.get(endpoint)
+            if latency is None:
+                latency = self._endpoints[endpoint] = EndpointLatency()
+            latency.observe(seconds)
+
+    def quantile(self, endpoint: str, q: float) -> Optional[float]:
+        """最近请求耗时的 q 分位数，样本不足时返回 None"""
+        with self._lock:
+            latency = self._endpoints.get(endpoint)
+            return latency.quantile(q) if latency is not None else None
+
+    def timeout(self, endpoint: str) -> float:
+        """请求超时：p99 * TIMEOUT_FACTOR，限制在 [MIN_TIMEOUT, DEFAULT_TIMEOUT]"""
+        p99 = self.quantile(endpoint, 0.99)
+        if p99 is None:
+            return DEFAULT_TIMEOUT
+        return min(max(p99 * TIMEOUT_FACTOR, MIN_TIMEOUT), DEFAULT_TIMEOUT)
+
+    def hedge_delay(self, endpoint: str) -> Optional[float]:
+        """发出对冲请求前的等待时间，未启用对冲或样本不足时返回 None"""
+        if not HEDGING_ENABLED:
+            return None
+        expected = self.quantile(endpoint, HEDGE_QUANTILE)
+        if expected is None:
+            return None
+        return max(expected, MIN_HEDGE_DELAY)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """各接口的样本数、p50 / p95 / p99 与当前超时"""
+        with self._lock:
+            endpoints = list(self._endpoints)
+        return {
+            endpoint: {
+                'samples': len(self._endpoints[endpoint].samples),
+                'p50': self.quantile(endpoint, 0.5),
+                'p95': self.quantile(endpoint, 0.95),
+                'p99': self.quantile(endpoint, 0.99),
+                'timeout': self.timeout(endpoint),
+            }
+            for endpoint in endpoints
+        }
+
+
+_trackers: Dict[str, LatencyTracker] = {}
+_trackers_lock = threading.Lock()
+
+
+def get_latency_tracker(api_name: str) -> LatencyTracker:
+    """获取数据源共享的耗时统计（同一 api_name 的所有客户端实例共用）"""
+    with _trackers_lock:
+        tracker = _trackers.get(api_name)
+        if tracker is None:
+            tracker = _trackers[api_name] = LatencyTracker(api_name)
+        return tracker
@@ -1,13 +1,14 @@
-import requests
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List
 from .base_client import BaseAPIClient
 
 class MetalsAPIClient(BaseAPIClient):
     """Metals-API 客户端 - 用于贵金属价格"""
     
-    def __init__(self, api_key: str):
-        super().__init__('metals-api', 'https://metals-api.com/api', api_key)
+    supports_batch = True
+    
+    def __init__(self, api_key: str, rate_limit: Optional[int] = None):
+        super().__init__('metals-api', 'https://metals-api.com/api', api_key, rate_limit)
     
     def get_price(self, symbol: str) -> Dict[str, Any]:
         """
@@ -15,52 +16,54 @@ class MetalsAPIClient(BaseAPIClient):
         symbol: XAU(黄金), XAG(白银), XPT(铂金), XPD(钯金)
         返回价格单位为 美元/盎司
         """
-        self._rate_limit(1.0)  # 免费版限制
-        
-        url = f"{self.base_url}/latest"
+        return self._fetch_latest([symbol])[symbol]
+    
+    def get_prices(self, symbols: List[str]) -> Dict[str, Dict[str, Any]]:
+        """批量获取最新贵金属价格，symbols 以逗号拼接后一次请求"""
+        if not symbols:
+            return {}
+        return self._fetch_latest(symbols)
+    
+    def _fetch_latest(self, symbols: List[str]) -> Dict[str, Dict[str, Any]]:
+        """请求 /latest 并解析多个标的的价格"""
         params = {
             'access_key': self.api_key,
             'base': 'USD',
-            'symbols': symbol
+            'symbols': ','.join(symbols)
         }
-        
-        response = self.session.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
+        data = self._get('/latest', params)
         
         if not data.get('success'):
             raise Exception(f"API error: {data.get('error', 'Unknown')}")
         
-        # Metals-API 返回的是 1/USD 格式，需要转换
-        # 例如黄金 0.0005 表示 1/0.0005 = 2000 USD/oz
-        rate = data['rates'].get(symbol)
-        if rate:
-            price = 1 / float(rate)
-        else:
-            price = 0
-        
-        return {
-            'symbol': symbol,
-            'price': price,
-            'volume': None,  # Metals-API 不提供成交量
-            'market_time': datetime.fromtimestamp(data['timestamp']),
-            'source_api': 'metals-api'
-        }
+        market_time = datetime.fromtimestamp(data['timestamp'])
+        results = {}
+        for symbol in symbols:
+            # Metals-API 返回的是 1/USD 格式，需要转换
+            # 例如黄金 0.0005 表示 1/0.0005 = 2000 USD/oz
+            rate = data['rates'].get(symbol)
+            if rate:
+                price = 1 / float(rate)
+            else:
+                price = 0
+            
+            results[symbol] = {
+                'symbol': symbol,
+                'price': price,
+                'volume': None,  # Metals-API 不提供成交量
+                'market_time': market_time,
+                'source_api': 'metals-api'
+            }
+        return results
     
     def get_historical(self, symbol: str, date: str) -> Dict[str, Any]:
         """
         获取历史价格
         date: YYYY-MM-DD 格式
         """
-        self._rate_limit(1.0)
-        
-        url = f"{self.base_url}/{date}"
         params = {
             'access_key': self.api_key,
             'base': 'USD',
             'symbols': symbol
         }
-        
-        response = self.session.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        return response.json()
+        return self._get(f'/{date}', params)
@@ -0,0 +1,133 @@
+import threading
+import time
+from typing import Dict, Optional, Mapping
+
+# api_configs 中没有配置时的默认速率（每分钟请求数 / 权重）
+DEFAULT_RATE_LIMITS = {
+    'binance': 1200,
+    'finnhub': 60,
+    'metals-api': 60,
+}
+FALLBACK_RATE_LIMIT = 60
+
+
+class TokenBucket:
+    """
+    令牌桶限速器（线程安全）
+    容量为每分钟配额，按配额/60 每秒匀速补充；
+    有余量时立即返回，不足时预支令牌并只等待欠额对应的时间，
+    并发调用者因此按到达顺序排队而不会同时冲出去
+    """
+
+    def __init__(self, rate_per_minute: float):
+        self._lock = threading.Lock()
+        self.configure(rate_per_minute)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        # 服务端要求暂停（429 / Retry-After / 配额用尽）时的解禁时间
+        self.blocked_until = 0.0
+
+    def configure(self, rate_per_minute: float):
+        """调整配额（每分钟）"""
+        rate_per_minute = max(float(rate_per_minute), 1.0)
+        with self._lock:
+            self.capacity = rate_per_minute
+            self.refill_rate = rate_per_minute / 60.0
+            if getattr(self, 'tokens', None) is not None:
+                self.tokens = min(self.tokens, self.capacity)
+
+    def _refill(self, now: float):
+        elapsed = now - self.updated_at
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_rate)
+            self.updated_at = now
+
+    def acquire(self, weight: float = 1) -> float:
+        """获取 weight 个令牌，必要时阻塞，返回实际等待秒数"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= weight
+            wait = 0.0
+            if self.tokens < 0:
+                wait = -self.tokens / self.refill_rate
+            wait = max(wait, self.blocked_until - now)
+
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def try_acquire(self, weight: float = 1) -> bool:
+        """有余量时获取令牌并返回 True，否则不等待直接返回 False"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now < self.blocked_until or self.tokens < weight:
+                return False
+            self.tokens -= weight
+            return True
+
+    def set_remaining(self, remaining: float):
+        """按服务端返回的剩余配额校正（只会调低）"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.tokens, float(remaining))
+
+    def block_for(self, seconds: float):
+        """暂停发放令牌 seconds 秒"""
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def update_from_response(self, status_code: int, headers: Mapping[str, str]):
+        """
+        根据响应头自适应调整
+        - Binance: X-MBX-USED-WEIGHT-1M / X-MBX-USED-WEIGHT 为本分钟已用权重
+        - Finnhub 等: X-Ratelimit-Remaining / X-Ratelimit-Reset
+        - 429 / 418: Retry-After 秒数内暂停
+        """
+        used = headers.get('X-MBX-USED-WEIGHT-1M') or headers.get('X-MBX-USED-WEIGHT')
+        if used is not None:
+            try:
+                self.set_remaining(self.capacity - float(used))
+            except ValueError:
+                pass
+
+        remaining = headers.get('X-Ratelimit-Remaining')
+        if remaining is not None:
+            try:
+                self.set_remaining(float(remaining))
+                reset = headers.get('X-Ratelimit-Reset')
+                if float(remaining) <= 0 and reset is not None:
+                    self.block_for(float(reset) - time.time())
+            except ValueError:
+                pass
+
+        if status_code in (418, 429):
+            retry_after = headers.get('Retry-After')
+            try:
+                self.block_for(float(retry_after) if retry_after is not None else 60.0)
+            except ValueError:
+                self.block_for(60.0)
+
+
+_limiters: Dict[str, TokenBucket] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(api_name: str, rate_per_minute: Optional[float] = None) -> TokenBucket:
+    """
+    获取数据源共享的限速器（同一 api_name 的所有客户端实例共用一个令牌桶）
+    rate_per_minute: 来自 api_configs.rate_limit，传入时更新配额
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(api_name)
+        if limiter is None:
+            if rate_per_minute is None:
+                rate_per_minute = DEFAULT_RATE_LIMITS.get(api_name, FALLBACK_RATE_LIMIT)
+            limiter = TokenBucket(rate_per_minute)
+            _limiters[api_name] = limiter
+            return limiter
+
+    if rate_per_minute is not None and rate_per_minute != limiter.capacity:
+        limiter.configure(rate_per_minute)
+    return limiter
@@ -0,0 +1,168 @@
+"""
+数据源响应的录制与回放
+录制：BaseAPIClient.recorder 设为 Recorder 后，每次 _get 的原始 JSON 响应（或错误）连同请求时间
+追加到 gzip 压缩的 JSON Lines 文件，API key 类参数不落盘；
+回放：Replay*Client 继承真实客户端，只替换 _get，按当前（模拟）时钟取出同一请求的录制响应，
+解析和批量请求逻辑仍走真实代码
+"""
+
+import gzip
+import json
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import requests
+
+from config import clock
+from api_clients import APIClientFactory
+from api_clients.binance_client import BinanceClient
+from api_clients.finnhub_client import FinnhubClient
+from api_clients.metals_api_client import MetalsAPIClient
+
+# 不写入录制文件、也不参与请求匹配的参数
+SECRET_PARAMS = ('token', 'access_key', 'apikey', 'api_key')
+# 每写入多少条刷一次盘（进程被杀时最多丢这么多条）
+FLUSH_EVERY = 100
+# 回放时请求与录制时间允许的偏差（秒）：录制时请求可能因限速晚于调度时刻发出
+DEFAULT_LOOKAHEAD = 60.0
+
+
+def _public_params(params: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: value for key, value in params.items() if key.lower() not in SECRET_PARAMS}
+
+
+def request_key(api_name: str, path: str, params: Dict[str, Any]) -> str:
+    """请求的匹配键：数据源 + 路径 + 去掉密钥后的参数"""
+    return f"{api_name} {path} " + json.dumps(_public_params(params), sort_keys=True,
+                                              separators=(',', ':'), default=str)
+
+
+class Recorder:
+    """把数据源响应追加写入录制文件，可在多个线程中共用"""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # 追加模式每次打开新增一个 gzip member，读取时自动拼接
+        self._file = gzip.open(self.path, 'at', encoding='utf-8')
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def record(self, api_name: str, path: str, params: Dict[str, Any], requested_at: float,
+               data: Any = None, error: Optional[str] = None):
+        item = {'t': round(requested_at, 3), 'api': api_name, 'path': path,
+                'params': _public_params(params)}
+        if error is not None:
+            item['error'] = error
+        else:
+            item['data'] = data
+        line = json.dumps(item, separators=(',', ':'), ensure_ascii=False, default=str)
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(line + '\n')
+            self.count += 1
+            if self.count % FLUSH_EVERY == 0:
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class Recording:
+    """加载后的录制文件，按请求键索引，每个键的响应按请求时间排序"""
+
+    def __init__(self, items: List[Dict[str, Any]]):
+        self._times: Dict[str, List[float]] = defaultdict(list)
+        self._items: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for item in sorted(items, key=lambda item: item['t']):
+            key = request_key(item['api'], item['path'], item['params'])
+            self._times[key].append(item['t'])
+            self._items[key].append(item)
+        self.count = len(items)
+        self.start: Optional[float] = min(item['t'] for item in items) if items else None
+        self.end: Optional[float] = max(item['t'] for item in items) if items else None
+
+    @classmethod
+    def load(cls, path: str) -> 'Recording':
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            return cls([json.loads(line) for line in f if line.strip()])
+
+    def lookup(self, api_name: str, path: str, params: Dict[str, Any], now: float,
+               lookahead: float = DEFAULT_LOOKAHEAD) -> Optional[Dict[str, Any]]:
+        """
+        取 now 时刻发出的请求对应的录制响应：
+        优先取 [now, now + lookahead) 内最早的一条，其次取 (now - lookahead, now) 内最晚的一条，都没有返回 None
+        """
+        key = request_key(api_name, path, params)
+        times = self._times.get(key)
+        if not times:
+            return None
+        i = bisect_left(times, now)
+        if i < len(times) and times[i] < now + lookahead:
+            return self._items[key][i]
+        if i > 0 and times[i - 1] > now - lookahead:
+            return self._items[key][i - 1]
+        return None
+
+
+class ReplayTransport:
+    """回放请求：不限速、不访问网络；录制时失败的请求回放时同样失败"""
+
+    def setup_replay(self, recording: Recording, lookahead: float = DEFAULT_LOOKAHEAD):
+        self.recording = recording
+        self.lookahead = lookahead
+        self.replay_lock = threading.Lock()
+        self.replay_stats = {'hits': 0, 'misses': 0, 'errors': 0}
+
+    def _get(self, path: str, params: Dict[str, Any], weight: float = 1) -> Any:
+        item = self.recording.lookup(self.api_name, path, params, clock.timestamp(), self.lookahead)
+        with self.replay_lock:
+            if item is None:
+                self.replay_stats['misses'] += 1
+            elif 'error' in item:
+                self.replay_stats['errors'] += 1
+            else:
+                self.replay_stats['hits'] += 1
+        if item is None:
+            raise requests.ConnectionError(f"No recorded response for {self.api_name} {path} at {clock.now()}")
+        if 'error' in item:
+            raise requests.ConnectionError(f"Recorded error: {item['error']}")
+        return item['data']
+
+
+class ReplayBinanceClient(ReplayTransport, BinanceClient):
+    def __init__(self, recording: Recording, lookahead: float = DEFAULT_LOOKAHEAD):
+        BinanceClient.__init__(self)
+        self.setup_replay(recording, lookahead)
+
+
+class ReplayFinnhubClient(ReplayTransport, FinnhubClient):
+    def __init__(self, recording: Recording, lookahead: float = DEFAULT_LOOKAHEAD):
+        FinnhubClient.__init__(self, 'replay')
+        self.setup_replay(recording, lookahead)
+
+
+class ReplayMetalsAPIClient(ReplayTransport, MetalsAPIClient):
+    def __init__(self, recording: Recording, lookahead: float = DEFAULT_LOOKAHEAD):
+        MetalsAPIClient.__init__(self, 'replay')
+        self.setup_replay(recording, lookahead)
+
+
+def install_replay_clients(recording: Recording,
+                           lookahead: float = DEFAULT_LOOKAHEAD) -> Dict[str, ReplayTransport]:
+    """创建三个数据源的回放客户端并注册到 APIClientFactory，返回 api_name -> 客户端"""
+    clients = {
+        'binance': ReplayBinanceClient(recording, lookahead),
+        'finnhub': ReplayFinnhubClient(recording, lookahead),
+        'metals-api': ReplayMetalsAPIClient(recording, lookahead),
+    }
+    with APIClientFactory._lock:
+        APIClientFactory._instances.update(clients)
+    return clients
@@ -5,118 +5,315 @@
 """
 
 import sys
+import threading
+import time
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import List, Optional, Dict, Any
+from typing import Callable, List, Optional, Dict, Any, Tuple, Iterator
 
 sys.path.insert(0, '/Users/yuchao/.openclaw/workspace/market_monitor')
 
+from config import clock
 from config.logger import setup_logger
 from models.symbol import Symbol
 from models.market_data import MarketDataRepository
+from models.backfill_checkpoint import BackfillCheckpoint, BackfillCheckpointRepository
 from api_clients.binance_client import BinanceClient
 
 logger = setup_logger('backfill')
 
+KLINE_INTERVAL = '5m'
+KLINE_INTERVAL_MS = 5 * 60 * 1000
+# Binance 单次最多返回 1000 条K线
+PAGE_SIZE = 1000
+# 单个标的同时拉取的页数（实际请求速率由 binance 共享令牌桶控制）
+PAGE_CONCURRENCY = 4
+# 同时补充的标的数
+SYMBOL_CONCURRENCY = 4
+# 中间缺口的检查范围
+GAP_REPAIR_DAYS = 3
+
 class BackfillService:
     """历史数据补充服务"""
     
-    def __init__(self):
+    def __init__(self, binance: Optional[BinanceClient] = None):
+        """binance: K 线数据客户端，默认新建 BinanceClient（基准测试时传入替身）"""
         self.repo = MarketDataRepository()
-        self.binance = BinanceClient()
+        self.binance = binance or BinanceClient()
+        BackfillCheckpointRepository.init_table()
+        self._lock = threading.Lock()
+        self.stats = {'rows': 0, 'pages': 0, 'seconds': 0.0}
     
     def get_last_record_time(self, symbol_id: int) -> Optional[datetime]:
         """获取标的最近记录时间"""
-        conn = sqlite3.connect('/Users/yuchao/.openclaw/workspace/market_monitor/data/market_monitor.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT MAX(market_time) FROM market_data WHERE symbol_id = ?
-        ''', (symbol_id,))
-        row = cursor.fetchone()
-        conn.close()
-        
-        if row and row[0]:
-            return datetime.fromisoformat(row[0]) if isinstance(row[0], str) else row[0]
-        return None
+        return self.repo.get_last_market_time(symbol_id)
+    
+    def needs_tail_backfill(self, symbol: Symbol, last_time: Optional[datetime]) -> bool:
+        """backfill_symbol 是否会补充尾部缺口（有未完成的进度，或最近记录早于 5 分钟前）"""
+        if not symbol.backfill_enabled or symbol.data_source != 'binance':
+            return False
+        if BackfillCheckpointRepository.get(symbol.symbol_id):
+            return True
+        return last_time is not None and clock.now() - last_time >= timedelta(minutes=5)
+    
+    def snapshot_last_times(self) -> Dict[int, Optional[datetime]]:
+        """
+        记录各标的当前的最近记录时间
+        后台 backfill 与实时接入同时运行时，需在实时接入写入第一条数据前调用，
+        否则新写入的数据会让尾部缺口看起来已经补齐
+        """
+        return {symbol.symbol_id: self.get_last_record_time(symbol.symbol_id)
+                for symbol in self.repo.get_active_symbols()}
+    
+    @staticmethod
+    def _to_ms(dt: datetime) -> int:
+        return int(dt.timestamp() * 1000)
+    
+    @staticmethod
+    def plan_pages(start_ms: int, end_ms: int) -> List[Tuple[int, int]]:
+        """把 [start_ms, end_ms] 按每页 PAGE_SIZE 根K线切分"""
+        pages = []
+        page_start = start_ms
+        while page_start <= end_ms:
+            page_end = min(page_start + PAGE_SIZE * KLINE_INTERVAL_MS - 1, end_ms)
+            pages.append((page_start, page_end))
+            page_start = page_end + 1
+        return pages
+    
+    def fetch_page(self, symbol: Symbol, page: Tuple[int, int],
+                   source_api: str = 'binance_backfill') -> List[Dict[str, Any]]:
+        """拉取一页K线并转换为行情记录"""
+        page_start, page_end = page
+        klines = self.binance.get_kline(
+            symbol.symbol_code, interval=KLINE_INTERVAL, limit=PAGE_SIZE,
+            start_time=page_start, end_time=page_end
+        )
+        
+        rows = []
+        for kline in klines:
+            # Binance Kline 格式: [open_time, open, high, low, close, volume, close_time, ...]
+            if not page_start <= kline[0] <= page_end:
+                continue
+            rows.append({
+                'symbol_id': symbol.symbol_id,
+                'market_time': datetime.fromtimestamp(kline[0] / 1000),
+                'price': float(kline[4]),
+                'volume': float(kline[5]),
+                'source_api': source_api
+            })
+        return rows
+    
+    def iter_pages(self, symbol: Symbol, pages: List[Tuple[int, int]],
+                   source_api: str = 'binance_backfill') -> Iterator[Tuple[Tuple[int, int], List[Dict[str, Any]]]]:
+        """
+        并发拉取多页K线，按页顺序逐页返回 (page, rows)
+        同时在途的页数不超过 PAGE_CONCURRENCY * 2，写完一页再提交下一页
+        """
+        with ThreadPoolExecutor(max_workers=PAGE_CONCURRENCY,
+                                thread_name_prefix=f"backfill-{symbol.symbol_code}") as executor:
+            page_iter = iter(pages)
+            pending = deque()
+            
+            def submit_next():
+                page = next(page_iter, None)
+                if page is not None:
+                    pending.append((page, executor.submit(self.fetch_page, symbol, page, source_api)))
+            
+            for _ in range(PAGE_CONCURRENCY * 2):
+                submit_next()
+            
+            while pending:
+                page, future = pending.popleft()
+                rows = future.result()
+                with self._lock:
+                    self.stats['pages'] += 1
+                yield page, rows
+                submit_next()
+    
+    def run_checkpoint(self, symbol: Symbol, checkpoint: BackfillCheckpoint) -> int:
+        """
+        从 checkpoint.done_until 补到 checkpoint.range_end
+        多页并发拉取，按页顺序写入；每页的行情和进度在同一事务提交，
+        中断后从最后提交的页之后续传，不会重复写入
+        """
+        pages = self.plan_pages(checkpoint.done_until, checkpoint.range_end)
+        count = 0
+        
+        for page, rows in self.iter_pages(symbol, pages):
+            checkpoint.done_until = page[1] + 1
+            self.repo.save_many(
+                rows, extra_statements=[BackfillCheckpointRepository.save_statement(checkpoint)]
+            )
+            count += len(rows)
+        
+        BackfillCheckpointRepository.delete(symbol.symbol_id)
+        return count
     
-    def backfill_symbol(self, symbol: Symbol) -> int:
+    @staticmethod
+    def plan_gap_pages(gaps: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
         """
-        补充单个标的的历史数据
+        把缺失的时间桶区间合并成请求页（毫秒范围）
+        相近的小缺口合并进同一页，每页跨度不超过 PAGE_SIZE 个桶
+        """
+        bucket_ms = KLINE_INTERVAL_MS
+        pages = []
+        page_start = page_end = None
+        for gap_start, gap_end in gaps:
+            bucket = gap_start
+            while bucket <= gap_end:
+                if page_start is None:
+                    page_start = bucket
+                elif bucket > page_start + PAGE_SIZE - 1:
+                    pages.append((page_start * bucket_ms, (page_end + 1) * bucket_ms - 1))
+                    page_start = bucket
+                page_end = min(gap_end, page_start + PAGE_SIZE - 1)
+                bucket = page_end + 1
+        if page_start is not None:
+            pages.append((page_start * bucket_ms, (page_end + 1) * bucket_ms - 1))
+        return pages
+    
+    def repair_gaps(self, symbol: Symbol, start_time: datetime, end_time: datetime) -> int:
+        """
+        修复 [start_time, end_time] 内的中间缺口
+        只拉取包含缺失时间桶的页，并且只写入缺失桶的数据，工作量与缺失数据量成正比
         返回补充的数据条数
         """
-        if not symbol.backfill_enabled:
-            logger.info(f"{symbol.symbol_code}: backfill not enabled")
+        gaps = self.repo.find_gaps([symbol.symbol_id], start_time, end_time,
+                                   bucket_seconds=KLINE_INTERVAL_MS // 1000)[symbol.symbol_id]
+        if not gaps:
             return 0
         
-        if symbol.data_source != 'binance':
-            logger.info(f"{symbol.symbol_code}: only binance supports backfill")
-            return 0
+        missing = sum(gap_end - gap_start + 1 for gap_start, gap_end in gaps)
+        logger.info(f"{symbol.symbol_code}: found {len(gaps)} gaps ({missing} buckets) since {start_time}")
         
-        # 获取最近记录时间
-        last_time = self.get_last_record_time(symbol.symbol_id)
-        if not last_time:
-            logger.info(f"{symbol.symbol_code}: no existing data, skip backfill")
-            return 0
+        gap_starts = [gap_start for gap_start, _ in gaps]
+        
+        def in_gap(row: Dict[str, Any]) -> bool:
+            bucket = self._to_ms(row['market_time']) // KLINE_INTERVAL_MS
+            i = bisect_right(gap_starts, bucket) - 1
+            return i >= 0 and bucket <= gaps[i][1]
         
-        now = datetime.now()
+        count = 0
+        for _, rows in self.iter_pages(symbol, self.plan_gap_pages(gaps), 'binance_repair'):
+            count += self.repo.save_many([row for row in rows if in_gap(row)])
         
-        # 如果最近记录在5分钟内，不需要补充
-        if now - last_time < timedelta(minutes=5):
-            logger.info(f"{symbol.symbol_code}: data is up to date ({last_time})")
+        logger.info(f"{symbol.symbol_code}: repaired {count} records")
+        return count
+    
+    def _repair_recent(self, symbol: Symbol) -> int:
+        """修复最近 GAP_REPAIR_DAYS 天的中间缺口（不含尚未收盘的当前时间桶）"""
+        end_time = clock.now() - timedelta(milliseconds=KLINE_INTERVAL_MS)
+        try:
+            return self.repair_gaps(symbol, end_time - timedelta(days=GAP_REPAIR_DAYS), end_time)
+        except Exception as e:
+            logger.error(f"{symbol.symbol_code}: gap repair failed - {e}")
+            return 0
+    
+    def backfill_symbol(self, symbol: Symbol, last_time: Optional[datetime] = None) -> int:
+        """
+        补充单个标的的历史数据（按 startTime/endTime 分页，缺口长度不限），
+        然后修复最近几天的中间缺口
+        last_time: 尾部缺口的起点，默认取当前最近记录时间
+        返回补充的数据条数
+        """
+        if not symbol.backfill_enabled:
+            logger.info(f"{symbol.symbol_code}: backfill not enabled")
             return 0
         
-        logger.info(f"{symbol.symbol_code}: backfilling from {last_time} to {now}")
+        if symbol.data_source != 'binance':
+            logger.info(f"{symbol.symbol_code}: only binance supports backfill")
+            return 0
         
-        try:
-            # 计算需要获取的K线数量（每5分钟一条）
-            minutes_diff = int((now - last_time).total_seconds() / 60)
-            limit = min(minutes_diff // 5 + 1, 1000)  # Binance 限制最多1000条
+        # 有未完成的进度则续传
+        checkpoint = BackfillCheckpointRepository.get(symbol.symbol_id)
+        if checkpoint:
+            logger.info(
+                f"{symbol.symbol_code}: resuming backfill from "
+                f"{datetime.fromtimestamp(checkpoint.done_until / 1000)} to "
+                f"{datetime.fromtimestamp(checkpoint.range_end / 1000)}"
+            )
+        else:
+            # 获取最近记录时间
+            if last_time is None:
+                last_time = self.get_last_record_time(symbol.symbol_id)
+            if not last_time:
+                logger.info(f"{symbol.symbol_code}: no existing data, skip backfill")
+                return 0
             
-            # 获取K线数据
-            klines = self.binance.get_kline(symbol.symbol_code, interval='5m', limit=limit)
+            now = clock.now()
             
-            count = 0
-            for kline in klines:
-                # Binance Kline 格式: [open_time, open, high, low, close, volume, close_time, ...]
-                open_time = datetime.fromtimestamp(kline[0] / 1000)
-                close_price = float(kline[4])
-                volume = float(kline[5])
-                
-                # 只补充缺失的数据（时间戳大于最后记录时间）
-                if open_time > last_time:
-                    self.repo.save_market_data(
-                        symbol_id=symbol.symbol_id,
-                        market_time=open_time,
-                        price=close_price,
-                        volume=volume,
-                        source_api='binance_backfill'
-                    )
-                    count += 1
+            # 如果最近记录在5分钟内，不需要补充尾部，只检查中间缺口
+            if now - last_time < timedelta(minutes=5):
+                logger.info(f"{symbol.symbol_code}: data is up to date ({last_time})")
+                return self._repair_recent(symbol)
             
-            logger.info(f"{symbol.symbol_code}: backfilled {count} records")
-            return count
+            logger.info(f"{symbol.symbol_code}: backfilling from {last_time} to {now}")
             
+            # 只补充缺失的数据（开盘时间大于最后记录时间）
+            last_ms = self._to_ms(last_time)
+            checkpoint = BackfillCheckpoint(
+                symbol_id=symbol.symbol_id,
+                range_start=last_ms,
+                range_end=self._to_ms(now),
+                done_until=last_ms + 1
+            )
+            BackfillCheckpointRepository.save(checkpoint)
+        
+        started = time.monotonic()
+        try:
+            count = self.run_checkpoint(symbol, checkpoint)
         except Exception as e:
-            logger.error(f"{symbol.symbol_code}: backfill failed - {e}")
+            logger.error(f"{symbol.symbol_code}: backfill failed - {e}, will resume from checkpoint")
             return 0
+        count += self._repair_recent(symbol)
+        elapsed = time.monotonic() - started
+        
+        with self._lock:
+            self.stats['rows'] += count
+        rate = count / elapsed if elapsed > 0 else 0.0
+        logger.info(f"{symbol.symbol_code}: backfilled {count} records in {elapsed:.2f}s ({rate:.0f} rows/s)")
+        return count
     
-    def backfill_all(self) -> Dict[str, int]:
-        """补充所有启用 backfill 的标的数据"""
+    def backfill_all(self, last_times: Optional[Dict[int, Optional[datetime]]] = None,
+                     on_symbol_done: Optional[Callable[[Symbol], None]] = None) -> Dict[str, int]:
+        """
+        补充所有启用 backfill 的标的数据（多个标的并发）
+        last_times: snapshot_last_times 的结果，各标的尾部缺口的起点
+        on_symbol_done: 每个标的补充结束（无论成功与否）后调用
+        """
         logger.info("Starting backfill service...")
         
         symbols = self.repo.get_active_symbols()
+        last_times = last_times or {}
         results = {}
         
-        for symbol in symbols:
-            count = self.backfill_symbol(symbol)
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=SYMBOL_CONCURRENCY, thread_name_prefix="backfill") as executor:
+            def run(symbol: Symbol) -> int:
+                try:
+                    return self.backfill_symbol(symbol, last_times.get(symbol.symbol_id))
+                finally:
+                    if on_symbol_done is not None:
+                        on_symbol_done(symbol)
+            
+            counts = list(executor.map(run, symbols))
+        elapsed = time.monotonic() - started
+        
+        for symbol, count in zip(symbols, counts):
             if count > 0:
                 results[symbol.symbol_code] = count
         
-        logger.info(f"Backfill completed: {results}")
+        with self._lock:
+            self.stats['seconds'] += elapsed
+            total = sum(counts)
+        rate = total / elapsed if elapsed > 0 else 0.0
+        logger.info(f"Backfill completed: {results} ({total} rows in {elapsed:.2f}s, {rate:.0f} rows/s)")
         return results
 
 
 if __name__ == '__main__':
-    import sqlite3
     service = BackfillService()
     results = service.backfill_all()
     print(f"Backfill results: {results}")
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+预警规则回测
+用数据库中的历史行情按 check_symbol 的语义重放预警规则（5 分钟固定阈值，30 分钟 / 2 小时 (1+n)*x 递增阈值及计数器过期），
+在进程池中评估一组参数（阈值、窗口、过期时间），输出每组参数的预警次数和预警时间分布
+
+每个标的的各窗口涨跌幅对整段历史一次算好；递增阈值不低于 x，只有某个窗口涨跌幅达到 x 的点才可能触发，
+所以有状态的逐点判断只在这些候选点上进行。计数器过期只影响下一次判断，延后到候选点处理结果相同
+
+用法（在项目根目录）：
+    python3 backtest.py --days 365 --thresholds 0.005,0.01,0.02 --windows 5/30/120,5/60/240 \\
+        --expiry 30/120,60/240 --output backtest.json
+"""
+
+import sys
+import argparse
+import itertools
+import json
+import os
+import statistics
+import time
+from bisect import bisect_right
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, asdict
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+sys.path.insert(0, '/Users/yuchao/.openclaw/workspace/market_monitor')
+
+from config import clock
+from config.logger import setup_logger
+from models.symbol import Symbol, DEFAULT_ALERT_THRESHOLD
+from models.market_data import MarketDataRepository
+from volatility_detector import WINDOWS
+
+try:
+    import numpy as np
+except ImportError:  # 未安装 numpy 时逐点计算涨跌幅，结果相同
+    np = None
+
+logger = setup_logger('backtest')
+
+# 默认计数器过期时间（分钟），与 check_symbol 一致
+DEFAULT_EXPIRY = (30, 120)
+
+
+@dataclass(frozen=True)
+class RuleConfig:
+    """一组回测参数"""
+    threshold: Optional[float] = None  # 预警阈值，None 表示使用各标的的 alert_threshold
+    windows: Tuple[int, int, int] = WINDOWS  # 固定阈值窗口、两个递增阈值窗口（分钟）
+    expiry: Tuple[int, int] = DEFAULT_EXPIRY  # 两个递增阈值窗口的计数器过期时间（分钟）
+
+
+def build_grid(thresholds: Sequence[Optional[float]], windows: Sequence[Tuple[int, int, int]],
+               expiries: Sequence[Tuple[int, int]]) -> List[RuleConfig]:
+    """参数网格：阈值 × 窗口 × 过期时间"""
+    return [RuleConfig(t, w, e) for t, w, e in itertools.product(thresholds, windows, expiries)]
+
+
+def compute_changes(times: Sequence[float], prices: Sequence[float], window_minutes: int):
+    """
+    每个点相对 window_minutes 分钟前（as-of，含端点）价格的涨跌幅
+    没有更早的价格或更早的价格为 0 时为 0，与 VolatilityDetector.calculate_change 一致
+    """
+    window = window_minutes * 60
+    if np is not None:
+        times = np.asarray(times, dtype=float)
+        prices = np.asarray(prices, dtype=float)
+        idx = np.searchsorted(times, times - window, side='right') - 1
+        past = prices[np.maximum(idx, 0)]
+        valid = (idx >= 0) & (past != 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(valid, (prices - past) / np.where(valid, past, 1.0), 0.0)
+
+    changes = []
+    for t, price in zip(times, prices):
+        i = bisect_right(times, t - window) - 1
+        past = prices[i] if i >= 0 else None
+        changes.append(0.0 if not past else (price - past) / past)
+    return changes
+
+
+def candidate_points(times, changes, threshold: float) -> List[Tuple[float, float, float, float]]:
+    """任一窗口涨跌幅绝对值达到 threshold 的点，返回 (时间戳, 短/中/长窗口涨跌幅)"""
+    if np is not None:
+        hit = np.zeros(len(times), dtype=bool)
+        for values in changes:
+            hit |= np.abs(values) >= threshold
+        points = np.flatnonzero(hit)
+        return list(zip(times[points].tolist(), *(values[points].tolist() for values in changes)))
+    return [
+        row for row in zip(times, *changes)
+        if any(abs(v) >= threshold for v in row[1:])
+    ]
+
+
+def run_rules(points: Sequence[Tuple[float, float, float, float]], threshold: float,
+              expiry: Tuple[int, int]) -> List[Tuple[float, str, bool, bool, bool]]:
+    """
+    在候选点上逐点执行 check_symbol 的判断和计数器更新
+    返回触发的预警 (时间戳, 方向, 短窗口触发, 中窗口触发, 长窗口触发)
+    """
+    expiry_mid, expiry_long = expiry[0] * 60, expiry[1] * 60
+    n1 = n2 = m1 = m2 = 0
+    last_mid = last_long = None
+    alerts = []
+    for now, c_short, c_mid, c_long in points:
+        # 计数器过期
+        if last_mid is not None and now - last_mid > expiry_mid:
+            n1 = n2 = 0
+        if last_long is not None and now - last_long > expiry_long:
+            m1 = m2 = 0
+
+        triggered_short = abs(c_short) >= threshold
+        mid_up = c_mid >= (1 + n1) * threshold
+        mid_down = abs(c_mid) >= (1 + n2) * threshold and c_mid < 0
+        long_up = c_long >= (1 + m1) * threshold
+        long_down = abs(c_long) >= (1 + m2) * threshold and c_long < 0
+
+        if mid_up:
+            n1, n2, last_mid = n1 + 1, 0, now
+        elif mid_down:
+            n1, n2, last_mid = 0, n2 + 1, now
+        if long_up:
+            m1, m2, last_long = m1 + 1, 0, now
+        elif long_down:
+            m1, m2, last_long = 0, m2 + 1, now
+
+        triggered_mid = mid_up or mid_down
+        triggered_long = long_up or long_down
+        if triggered_short or triggered_mid or triggered_long:
+            direction = 'up' if c_short >= 0 else 'down'
+            alerts.append((now, direction, triggered_short, triggered_mid, triggered_long))
+    return alerts
+
+
+# 工作进程中的历史行情：symbol_id -> (时间戳, 价格)
+_series: Dict[int, Tuple[Any, Any]] = {}
+
+
+def _init_worker(series: Dict[int, Tuple[Any, Any]]):
+    global _series
+    _series = series
+
+
+def _evaluate(symbol_id: int, symbol_threshold: float, windows: Tuple[int, int, int],
+              configs: List[RuleConfig]) -> List[Tuple[RuleConfig, list, float]]:
+    """单个标的、同一组窗口下的所有参数，涨跌幅只算一次"""
+    times, prices = _series[symbol_id]
+    changes = [compute_changes(times, prices, minutes) for minutes in windows]
+    results = []
+    for config in configs:
+        started = time.perf_counter()
+        threshold = symbol_threshold if config.threshold is None else config.threshold
+        points = candidate_points(times, changes, threshold)
+        alerts = run_rules(points, threshold, config.expiry)
+        results.append((config, alerts, time.perf_counter() - started))
+    return results
+
+
+def load_series(symbols: List[Symbol], start_time: datetime,
+                end_time: datetime) -> Dict[int, Tuple[Any, Any]]:
+    series = {}
+    for symbol in symbols:
+        times, prices = MarketDataRepository.get_price_series(symbol.symbol_id, start_time, end_time)
+        if not times:
+            continue
+        if np is not None:
+            series[symbol.symbol_id] = (np.array(times), np.array(prices))
+        else:
+            series[symbol.symbol_id] = (times, prices)
+    return series
+
+
+def summarize(config: RuleConfig, alerts_by_symbol: Dict[str, list], eval_seconds: float,
+              days: float) -> Dict[str, Any]:
+    """一组参数的预警次数和时间分布"""
+    all_alerts = sorted(alert for alerts in alerts_by_symbol.values() for alert in alerts)
+    gaps = [
+        (b[0] - a[0]) / 60
+        for alerts in alerts_by_symbol.values()
+        for a, b in zip(alerts, alerts[1:])
+    ]
+    per_day = Counter(datetime.fromtimestamp(alert[0]).date() for alert in all_alerts)
+    short, mid, long = config.windows
+    return {
+        'config': asdict(config),
+        'alerts': len(all_alerts),
+        'by_window': {
+            f'{short}m': sum(1 for a in all_alerts if a[2]),
+            f'{mid}m': sum(1 for a in all_alerts if a[3]),
+            f'{long}m': sum(1 for a in all_alerts if a[4]),
+        },
+        'by_direction': dict(Counter(a[1] for a in all_alerts)),
+        'per_symbol': {code: len(alerts) for code, alerts in alerts_by_symbol.items()},
+        'alerts_per_day': len(all_alerts) / days if days > 0 else None,
+        'max_alerts_per_day': max(per_day.values()) if per_day else 0,
+        'median_gap_minutes': statistics.median(gaps) if gaps else None,
+        'first_alert': datetime.fromtimestamp(all_alerts[0][0]).isoformat() if all_alerts else None,
+        'last_alert': datetime.fromtimestamp(all_alerts[-1][0]).isoformat() if all_alerts else None,
+        'eval_seconds': eval_seconds,
+    }
+
+
+def backtest(configs: List[RuleConfig], start_time: datetime, end_time: datetime,
+             symbol_codes: Optional[List[str]] = None, workers: Optional[int] = None) -> Dict[str, Any]:
+    """
+    回测一组参数
+    按 (标的, 窗口) 拆分任务分给进程池，workers 为 1 时在当前进程中执行
+    """
+    symbols = MarketDataRepository().get_active_symbols()
+    if symbol_codes:
+        symbols = [s for s in symbols if s.symbol_code in symbol_codes]
+
+    started = time.perf_counter()
+    series = load_series(symbols, start_time, end_time)
+    load_seconds = time.perf_counter() - started
+    symbols = [s for s in symbols if s.symbol_id in series]
+    logger.info(f"Loaded {sum(len(t) for t, _ in series.values())} points for {len(symbols)} symbols "
+                f"in {load_seconds:.1f}s")
+
+    by_windows: Dict[Tuple[int, int, int], List[RuleConfig]] = defaultdict(list)
+    for config in configs:
+        by_windows[config.windows].append(config)
+    tasks = [
+        (s.symbol_id, DEFAULT_ALERT_THRESHOLD if s.alert_threshold is None else s.alert_threshold, windows, group)
+        for s in symbols
+        for windows, group in by_windows.items()
+    ]
+    codes = {s.symbol_id: s.symbol_code for s in symbols}
+
+    workers = workers or os.cpu_count() or 1
+    started = time.perf_counter()
+    if workers == 1:
+        _init_worker(series)
+        outputs = [_evaluate(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(series,)) as executor:
+            outputs = list(executor.map(_evaluate, *zip(*tasks))) if tasks else []
+    eval_seconds = time.perf_counter() - started
+
+    alerts: Dict[RuleConfig, Dict[str, list]] = defaultdict(dict)
+    seconds: Dict[RuleConfig, float] = defaultdict(float)
+    for task, output in zip(tasks, outputs):
+        for config, symbol_alerts, elapsed in output:
+            alerts[config][codes[task[0]]] = symbol_alerts
+            seconds[config] += elapsed
+
+    days = (end_time - start_time).total_seconds() / 86400
+    return {
+        'meta': {
+            'start': start_time.isoformat(),
+            'end': end_time.isoformat(),
+            'symbols': [s.symbol_code for s in symbols],
+            'points': sum(len(t) for t, _ in series.values()),
+            'configs': len(configs),
+            'workers': workers,
+            'load_seconds': load_seconds,
+            'eval_seconds': eval_seconds,
+        },
+        'results': [summarize(config, alerts[config], seconds[config], days) for config in configs],
+    }
+
+
+def parse_thresholds(value: str) -> List[Optional[float]]:
+    """逗号分隔，symbol 表示使用各标的的 alert_threshold"""
+    thresholds = []
+    for item in value.split(','):
+        item = item.strip()
+        if item == 'symbol':
+            thresholds.append(None)
+            continue
+        threshold = float(item)
+        if threshold <= 0:
+            raise argparse.ArgumentTypeError(f"threshold must be positive: {item}")
+        thresholds.append(threshold)
+    return thresholds
+
+
+def parse_tuples(size: int):
+    """逗号分隔的多组参数，每组用 / 分隔，如 5/30/120,5/60/240"""
+    def parse(value: str) -> List[tuple]:
+        groups = []
+        for item in value.split(','):
+            parts = tuple(int(part) for part in item.strip().split('/'))
+            if len(parts) != size or min(parts) <= 0:
+                raise argparse.ArgumentTypeError(f"expected {size} positive minutes separated by '/': {item}")
+            groups.append(parts)
+        return groups
+    return parse
+
+
+def main(argv: List[str] = None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description='Backtest alert rules over stored market data')
+    parser.add_argument('--days', type=float, default=365, help='回测最近多少天')
+    parser.add_argument('--start', help='回测起点（ISO 时间），优先于 --days')
+    parser.add_argument('--end', help='回测终点（ISO 时间），默认当前时间')
+    parser.add_argument('--thresholds', type=parse_thresholds, default=[None],
+                        help='阈值列表，如 0.005,0.01,symbol；symbol 表示各标的自己的 alert_threshold')
+    parser.add_argument('--windows', type=parse_tuples(3), default=[WINDOWS],
+                        help='窗口组合（分钟），如 5/30/120,5/60/240')
+    parser.add_argument('--expiry', type=parse_tuples(2), default=[DEFAULT_EXPIRY],
+                        help='计数器过期时间组合（分钟），如 30/120,60/240')
+    parser.add_argument('--symbols', help='只回测这些标的（逗号分隔）')
+    parser.add_argument('--workers', type=int, help='进程数，默认 CPU 核数')
+    parser.add_argument('--output', help='结果 JSON 路径，默认输出到标准输出')
+    args = parser.parse_args(argv)
+
+    end_time = datetime.fromisoformat(args.end) if args.end else clock.now()
+    start_time = datetime.fromisoformat(args.start) if args.start else end_time - timedelta(days=args.days)
+    configs = build_grid(args.thresholds, args.windows, args.expiry)
+    logger.info(f"Backtesting {len(configs)} configurations from {start_time} to {end_time}")
+
+    results = backtest(configs, start_time, end_time,
+                       args.symbols.split(',') if args.symbols else None, args.workers)
+    logger.info(f"Backtest finished in {results['meta']['eval_seconds']:.1f}s")
+
+    output = json.dumps(results, indent=2, ensure_ascii=False, default=str)
+    if args.output:
+        Path(args.output).write_text(output + '\n', encoding='utf-8')
+    else:
+        print(output)
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""
+基准测试用的数据源替身
+继承真实客户端，只替换 _get：按配置的延迟和错误率模拟网络请求，返回与真实接口格式一致的数据，
+因此解析、批量请求和限速逻辑都走真实代码
+"""
+
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import requests
+
+from api_clients import APIClientFactory
+from api_clients.binance_client import BinanceClient
+from api_clients.finnhub_client import FinnhubClient
+from api_clients.metals_api_client import MetalsAPIClient
+
+# 不限速时使用的每分钟配额
+UNLIMITED_RATE = 10 ** 9
+
+
+class FakeTransport:
+    """
+    模拟请求：延迟服从均值 latency、标准差 jitter 的正态分布（不小于 0），
+    以 error_rate 的概率抛出连接错误
+    """
+
+    def setup_fake(self, latency: float = 0.05, jitter: float = 0.01,
+                   error_rate: float = 0.0, seed: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.prices: Dict[str, float] = {}
+        self.fake_lock = threading.Lock()
+        self.fake_stats = {'requests': 0, 'errors': 0}
+
+    def next_price(self, symbol: str, base: float = 100.0) -> float:
+        """按随机游走给出标的的下一个价格"""
+        with self.fake_lock:
+            price = self.prices.get(symbol, base)
+            price *= 1 + self.random.gauss(0, 0.002)
+            self.prices[symbol] = price
+            return price
+
+    def _get(self, path: str, params: Dict[str, Any], weight: float = 1) -> Any:
+        self._rate_limit(weight)
+        with self.fake_lock:
+            self.fake_stats['requests'] += 1
+            delay = max(self.random.gauss(self.latency, self.jitter), 0.0)
+            failed = self.random.random() < self.error_rate
+            if failed:
+                self.fake_stats['errors'] += 1
+        time.sleep(delay)
+        if failed:
+            raise requests.ConnectionError(f"injected error for {self.api_name} {path}")
+        return self.respond(path, params)
+
+    def respond(self, path: str, params: Dict[str, Any]) -> Any:
+        raise NotImplementedError
+
+
+class FakeBinanceClient(FakeTransport, BinanceClient):
+    """Binance 替身：24hr ticker（单个 / 批量）和 K 线"""
+
+    def __init__(self, rate_limit: Optional[int] = UNLIMITED_RATE, **fake_options):
+        BinanceClient.__init__(self, None, rate_limit)
+        self.setup_fake(**fake_options)
+
+    def _ticker(self, symbol: str) -> Dict[str, Any]:
+        return {
+            'symbol': symbol,
+            'lastPrice': f"{self.next_price(symbol):.8f}",
+            'volume': f"{self.random.uniform(1000, 5000):.4f}",
+            'closeTime': int(time.time() * 1000)
+        }
+
+    def respond(self, path: str, params: Dict[str, Any]) -> Any:
+        if path == '/api/v3/ticker/24hr':
+            if 'symbols' in params:
+                symbols = [s.strip('"') for s in params['symbols'].strip('[]').split(',')]
+                return [self._ticker(symbol) for symbol in symbols]
+            return self._ticker(params['symbol'])
+        if path == '/api/v3/klines':
+            return self._klines(params)
+        raise ValueError(f"Unsupported fake binance path: {path}")
+
+    def _klines(self, params: Dict[str, Any]) -> List[list]:
+        interval_ms = 5 * 60 * 1000
+        end_ms = min(params.get('endTime', int(time.time() * 1000)), int(time.time() * 1000))
+        start_ms = params.get('startTime', end_ms - interval_ms * params['limit'])
+        open_time = -(-start_ms // interval_ms) * interval_ms
+        klines = []
+        while open_time <= end_ms and len(klines) < params['limit']:
+            close = self.next_price(params['symbol'])
+            klines.append([
+                open_time, f"{close:.8f}", f"{close * 1.001:.8f}", f"{close * 0.999:.8f}",
+                f"{close:.8f}", f"{self.random.uniform(10, 50):.4f}", open_time + interval_ms - 1
+            ])
+            open_time += interval_ms
+        return klines
+
+
+class FakeFinnhubClient(FakeTransport, FinnhubClient):
+    """Finnhub 替身：/quote"""
+
+    def __init__(self, rate_limit: Optional[int] = UNLIMITED_RATE, **fake_options):
+        FinnhubClient.__init__(self, 'fake-key', rate_limit)
+        self.setup_fake(**fake_options)
+
+    def respond(self, path: str, params: Dict[str, Any]) -> Any:
+        if path != '/quote':
+            raise ValueError(f"Unsupported fake finnhub path: {path}")
+        price = self.next_price(params['symbol'])
+        return {'c': price, 'o': price, 'h': price * 1.01, 'l': price * 0.99, 'pc': price, 'v': None}
+
+
+class FakeMetalsAPIClient(FakeTransport, MetalsAPIClient):
+    """Metals-API 替身：/latest（返回 1/USD 格式的汇率）"""
+
+    def __init__(self, rate_limit: Optional[int] = UNLIMITED_RATE, **fake_options):
+        MetalsAPIClient.__init__(self, 'fake-key', rate_limit)
+        self.setup_fake(**fake_options)
+
+    def respond(self, path: str, params: Dict[str, Any]) -> Any:
+        if path != '/latest':
+            raise ValueError(f"Unsupported fake metals-api path: {path}")
+        return {
+            'success': True,
+            'timestamp': int(time.time()),
+            'rates': {
+                symbol: 1 / self.next_price(symbol, base=2000.0)
+                for symbol in params['symbols'].split(',')
+            }
+        }
+
+
+def install_fake_clients(rate_limit: Optional[int] = UNLIMITED_RATE, **fake_options) -> Dict[str, FakeTransport]:
+    """创建三个数据源的替身并注册到 APIClientFactory，返回 api_name -> 替身"""
+    clients = {
+        'binance': FakeBinanceClient(rate_limit, **fake_options),
+        'finnhub': FakeFinnhubClient(rate_limit, **fake_options),
+        'metals-api': FakeMetalsAPIClient(rate_limit, **fake_options),
+    }
+    with APIClientFactory._lock:
+        APIClientFactory._instances.update(clients)
+    return clients
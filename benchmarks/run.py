@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+端到端基准测试
+在临时数据库中生成合成标的和历史行情，用替身数据源跑行情获取、波动检测、backfill 和常用查询，
+结果写成 JSON，便于不同版本之间对比
+
+用法（在项目根目录）：
+    python3 -m benchmarks.run --symbols 50 --months 2 --latency 0.05 --error-rate 0.01 --output results.json
+"""
+
+import sys
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, '/Users/yuchao/.openclaw/workspace/market_monitor')
+
+import config.database as database
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """耗时样本（秒）汇总为毫秒统计"""
+    ordered = sorted(samples)
+    if not ordered:
+        return {'n': 0}
+
+    def percentile(q: float) -> float:
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)] * 1000
+
+    return {
+        'n': len(ordered),
+        'min_ms': ordered[0] * 1000,
+        'p50_ms': percentile(0.5),
+        'p95_ms': percentile(0.95),
+        'max_ms': ordered[-1] * 1000,
+        'mean_ms': statistics.fmean(ordered) * 1000,
+    }
+
+
+def timed(func: Callable[[], Any], repeat: int) -> List[float]:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=Path(__file__).parent.parent, capture_output=True, text=True, timeout=5
+        ).stdout.strip()
+    except Exception:
+        return ''
+
+
+def db_size(path: Path) -> Dict[str, Any]:
+    conn = database.get_connection()
+    page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+    page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+    freelist = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    wal = Path(f"{path}-wal")
+    return {
+        'file_bytes': path.stat().st_size,
+        'wal_bytes': wal.stat().st_size if wal.exists() else 0,
+        'page_bytes': page_size * page_count,
+        'free_bytes': page_size * freelist,
+        'market_data_rows': conn.execute('SELECT COUNT(*) FROM market_data').fetchone()[0],
+        'partitions': len(database.list_partitions(conn)),
+    }
+
+
+def bench_fetch(ticks: int) -> Dict[str, Any]:
+    """行情获取：每轮一个新的 MarketDataFetcher，与 main.job 相同"""
+    from fetcher import MarketDataFetcher
+
+    samples = []
+    succeeded = failed = 0
+    for _ in range(ticks):
+        fetcher = MarketDataFetcher()
+        started = time.perf_counter()
+        result = fetcher.fetch_all(concurrent=True)
+        samples.append(time.perf_counter() - started)
+        succeeded += result.get('success', 0)
+        failed += result.get('failed', 0)
+    return {'tick': summarize(samples), 'succeeded': succeeded, 'failed': failed}
+
+
+def bench_detection(rounds: int, symbol_count: int) -> Dict[str, Any]:
+    """波动检测：逐标的和向量化两种模式，含价格缓存预热耗时"""
+    from models.price_cache import price_cache
+    from volatility_detector import VolatilityDetector, np
+
+    price_cache.clear()
+    warm = timed(price_cache.warm, 1)
+    detector = VolatilityDetector()
+    results = {'cache_warm': summarize(warm)}
+    modes = [('scalar', False)] + ([('batch', True)] if np is not None else [])
+    for name, batch in modes:
+        samples = timed(lambda: detector.check_all(batch=batch), rounds)
+        results[name] = summarize(samples)
+        results[name]['per_symbol_us'] = statistics.fmean(samples) / max(symbol_count, 1) * 1e6
+    return results
+
+
+def bench_backfill(binance_client) -> Dict[str, Any]:
+    from backfill import BackfillService
+
+    service = BackfillService(binance=binance_client)
+    started = time.perf_counter()
+    results = service.backfill_all()
+    elapsed = time.perf_counter() - started
+    rows = sum(results.values())
+    return {
+        'rows': rows,
+        'seconds': elapsed,
+        'rows_per_second': rows / elapsed if elapsed > 0 else 0.0,
+        'pages': service.stats['pages'],
+    }
+
+
+def bench_queries(symbol_ids: List[int], months: int, repeat: int) -> Dict[str, Any]:
+    """常用查询：as-of、区间统计、K 线、历史、缺口扫描"""
+    from models.market_data import MarketDataRepository as repo
+
+    now = datetime.now()
+    sample_id = symbol_ids[0]
+    history_start = now - timedelta(days=30 * months)
+    return {
+        'get_asof_prices': summarize(timed(
+            lambda: repo.get_asof_prices([now - timedelta(minutes=m) for m in (5, 30, 120)]), repeat)),
+        'get_price_at': summarize(timed(
+            lambda: repo.get_price_at(sample_id, now - timedelta(days=15)), repeat)),
+        'get_range_stats': summarize(timed(
+            lambda: repo.get_range_stats(sample_id, history_start, now), repeat)),
+        'get_ohlcv_1d': summarize(timed(
+            lambda: repo.get_ohlcv(sample_id, history_start, now, 86400), repeat)),
+        'get_price_history_1000': summarize(timed(
+            lambda: repo.get_price_history(sample_id, 1000), repeat)),
+        'find_gaps_3d': summarize(timed(
+            lambda: repo.find_gaps(symbol_ids, now - timedelta(days=3), now), repeat)),
+    }
+
+
+def main(argv: List[str] = None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description='Market monitor end-to-end benchmark')
+    parser.add_argument('--symbols', type=int, default=20, help='合成标的数')
+    parser.add_argument('--months', type=int, default=1, help='每个标的的历史月数')
+    parser.add_argument('--latency', type=float, default=0.05, help='替身数据源平均延迟（秒）')
+    parser.add_argument('--jitter', type=float, default=0.01, help='延迟标准差（秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='替身数据源请求失败概率')
+    parser.add_argument('--rate-limit', type=int, default=None,
+                        help='替身数据源每分钟配额，默认不限速')
+    parser.add_argument('--backfill-hours', type=float, default=24, help='binance 标的留给 backfill 的小时数')
+    parser.add_argument('--ticks', type=int, default=5, help='行情获取轮数')
+    parser.add_argument('--repeat', type=int, default=20, help='检测和查询的重复次数')
+    parser.add_argument('--db', help='数据库路径，默认临时目录；已存在的库跳过数据生成，直接复用')
+    parser.add_argument('--output', help='结果 JSON 路径，默认输出到标准输出')
+    parser.add_argument('--verbose', action='store_true', help='保留日志和控制台输出')
+    args = parser.parse_args(argv)
+
+    db_path = Path(args.db) if args.db else Path(tempfile.mkdtemp(prefix='market_monitor_bench_')) / 'bench.db'
+    reuse = db_path.exists()
+    database.DB_PATH = db_path
+    database.close_all_connections()
+
+    if not args.verbose:
+        logging.disable(logging.CRITICAL)
+    quiet = contextlib.redirect_stdout(io.StringIO()) if not args.verbose else contextlib.nullcontext()
+
+    from benchmarks.fake_providers import install_fake_clients, UNLIMITED_RATE
+    from benchmarks.universe import create_symbols, generate_history
+
+    results: Dict[str, Any] = {
+        'meta': {
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'storage_profile': os.getenv('MARKET_MONITOR_STORAGE_PROFILE', 'default'),
+            'time_format': None,
+            'params': vars(args),
+        }
+    }
+
+    with quiet:
+        database.init_db()
+        from models.rollup import RollupRepository
+        RollupRepository.ensure_built()
+        results['meta']['time_format'] = database.get_time_format()
+        clients = install_fake_clients(
+            args.rate_limit or UNLIMITED_RATE,
+            latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, seed=42
+        )
+
+        symbol_ids = create_symbols(args.symbols)
+        if reuse:
+            results['generate'] = None
+        else:
+            results['generate'] = generate_history(symbol_ids, args.months, timedelta(hours=args.backfill_hours))
+        results['backfill'] = bench_backfill(clients['binance'])
+        results['fetch'] = bench_fetch(args.ticks)
+        results['detection'] = bench_detection(args.repeat, len(symbol_ids))
+        results['queries'] = bench_queries(symbol_ids, args.months, args.repeat)
+        results['provider_requests'] = {name: dict(client.fake_stats) for name, client in clients.items()}
+        results['db'] = db_size(db_path)
+
+    output = json.dumps(results, indent=2, ensure_ascii=False, default=str)
+    if args.output:
+        Path(args.output).write_text(output + '\n', encoding='utf-8')
+    else:
+        print(output)
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+预警阈值自动校准
+从 5 分钟汇总表读取各标的最近 lookback_days 天的收盘价，一次向量化算出所有标的的 5m / 30m / 2h 涨跌幅，
+按目标预警频率求每个标的的阈值，写回 symbols.alert_threshold
+
+“任一窗口涨跌幅绝对值达到 x”的时间桶比例是预警频率的上限（30 分钟 / 2 小时的 (1+n)*x 递增只会减少预警），
+先用分位数给出阈值的上下界，再在界内二分，每次只在候选点上重放 check_symbol 的规则（见 backtest.run_rules）计数。
+阈值与 check_symbol 比较的涨跌幅同单位（0.01 表示 1%）
+
+用法（在项目根目录）：
+    python3 calibration.py --target 2 --days 90 --dry-run
+"""
+
+import sys
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, '/Users/yuchao/.openclaw/workspace/market_monitor')
+
+from config import clock
+from config.database import get_connection, set_meta, ROLLUP_LEVELS, PERCENT_THRESHOLD_MIN
+from config.logger import setup_logger
+from models.market_data import MarketDataRepository
+from models.symbol import DEFAULT_ALERT_THRESHOLD
+from models.rollup import RollupRepository
+from volatility_detector import WINDOWS
+from backtest import DEFAULT_EXPIRY, candidate_points, run_rules
+
+try:
+    import numpy as np
+except ImportError:  # 校准依赖 numpy，未安装时 calibrate 报错
+    np = None
+
+logger = setup_logger('calibration')
+
+# 每个标的每天的目标预警次数
+TARGET_ALERTS_PER_DAY = float(os.getenv('MARKET_MONITOR_TARGET_ALERTS_PER_DAY', '2'))
+# 用最近多少天的数据校准
+LOOKBACK_DAYS = int(os.getenv('MARKET_MONITOR_CALIBRATION_DAYS', '90'))
+# 定时校准间隔（小时），0 表示只手动校准
+CALIBRATION_INTERVAL_HOURS = float(os.getenv('MARKET_MONITOR_CALIBRATION_INTERVAL_HOURS', '0'))
+
+CALIBRATION_LEVEL = '5m'
+# 数据少于这么多个时间桶（约一周）的标的不校准
+MIN_BUCKETS = 7 * 288
+# 阈值下限，避免数据几乎不动的标的得到 0 阈值
+MIN_THRESHOLD = 0.0005
+# 阈值上限：不小于 PERCENT_THRESHOLD_MIN 的值写入后会被当作百分数换算
+MAX_THRESHOLD = PERCENT_THRESHOLD_MIN / 2
+# 阈值下界取超过次数为目标这么多倍的分位数
+LOWER_BOUND_FACTOR = 8
+# 二分次数
+FIT_ITERATIONS = 16
+
+
+def load_closes(symbol_ids: List[int], start_bucket: int):
+    """读取 5 分钟收盘价，返回按 (symbol_id, bucket) 排序的 symbol_id / bucket / close 三个数组"""
+    conn = get_connection()
+    placeholders = ','.join('?' * len(symbol_ids))
+    rows = conn.execute(f'''
+        SELECT symbol_id, bucket, close FROM {RollupRepository.table(CALIBRATION_LEVEL)}
+        WHERE symbol_id IN ({placeholders}) AND bucket >= ?
+        ORDER BY symbol_id, bucket
+    ''', (*symbol_ids, start_bucket)).fetchall()
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+    data = np.array(rows, dtype=float)
+    return data[:, 0].astype(np.int64), data[:, 1].astype(np.int64), data[:, 2]
+
+
+def window_changes(symbol_ids, buckets, closes, windows_minutes=WINDOWS) -> List:
+    """
+    每个时间桶各窗口的涨跌幅（所有标的一起计算）
+    窗口前的价格按 as-of 取同一标的 window 之前最近的收盘价，没有时涨跌幅为 0，与 check_symbol 一致
+    """
+    # (symbol_id, bucket) 合成单调递增的键，一次 searchsorted 完成所有标的的 as-of 查找
+    keys = (symbol_ids << 32) | buckets
+    changes = []
+    for minutes in windows_minutes:
+        idx = np.searchsorted(keys, keys - minutes * 60, side='right') - 1
+        safe = np.maximum(idx, 0)
+        past = closes[safe]
+        valid = (idx >= 0) & (symbol_ids[safe] == symbol_ids) & (past != 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            changes.append(np.where(valid, (closes - past) / np.where(valid, past, 1.0), 0.0))
+    return changes
+
+
+def count_alerts(times, changes, threshold: float) -> int:
+    """按 check_symbol 的规则重放，返回预警次数"""
+    return len(run_rules(candidate_points(times, changes, threshold), threshold, DEFAULT_EXPIRY))
+
+
+def fit_threshold(times, changes, score, target: float) -> float:
+    """
+    求使预警次数不超过 target 的最小阈值（按 4 位有效数字取整）
+    上界：超过次数为 target 的分位数；下界：超过次数为 target * LOWER_BOUND_FACTOR 的分位数
+    """
+    n = len(score)
+    upper = float(np.quantile(score, 1.0 - min(target / n, 1.0)))
+    lower = float(np.quantile(score, 1.0 - min(target * LOWER_BOUND_FACTOR / n, 1.0)))
+    lower = min(max(lower, MIN_THRESHOLD), MAX_THRESHOLD)
+    upper = min(max(upper, MIN_THRESHOLD), MAX_THRESHOLD)
+    if count_alerts(times, changes, lower) <= target:
+        return float(f'{lower:.4g}')
+    for _ in range(FIT_ITERATIONS):
+        middle = (lower + upper) / 2
+        if count_alerts(times, changes, middle) > target:
+            lower = middle
+        else:
+            upper = middle
+    return float(f'{upper:.4g}')
+
+
+def calibrate(target_per_day: float = TARGET_ALERTS_PER_DAY, lookback_days: int = LOOKBACK_DAYS,
+              symbol_codes: Optional[List[str]] = None, dry_run: bool = False) -> List[Dict[str, Any]]:
+    """
+    按目标预警频率校准阈值，dry_run 为 False 时写回数据库
+    返回每个标的的校准结果（数据不足的标的 new_threshold 为 None）
+    """
+    if np is None:
+        raise RuntimeError("Threshold calibration requires numpy")
+    if target_per_day <= 0:
+        raise ValueError("target_per_day must be positive")
+
+    symbols = MarketDataRepository().get_active_symbols()
+    if symbol_codes:
+        symbols = [s for s in symbols if s.symbol_code in symbol_codes]
+    if not symbols:
+        return []
+
+    started = time.perf_counter()
+    bucket_seconds = ROLLUP_LEVELS[CALIBRATION_LEVEL]
+    start_bucket = int((clock.timestamp() - lookback_days * 86400) // bucket_seconds) * bucket_seconds
+    symbol_ids, buckets, closes = load_closes([s.symbol_id for s in symbols], start_bucket)
+    changes = window_changes(symbol_ids, buckets, closes)
+    score = np.max(np.abs(changes), axis=0) if len(closes) else np.empty(0)
+    times = buckets.astype(float)
+
+    # 各标的在排序后数组中的区间
+    ids = np.array([s.symbol_id for s in symbols], dtype=np.int64)
+    lo = np.searchsorted(symbol_ids, ids, side='left')
+    hi = np.searchsorted(symbol_ids, ids, side='right')
+
+    results = []
+    updates = []
+    for symbol, a, b in zip(symbols, lo.tolist(), hi.tolist()):
+        current = DEFAULT_ALERT_THRESHOLD if symbol.alert_threshold is None else symbol.alert_threshold
+        result = {
+            'symbol_code': symbol.symbol_code,
+            'buckets': b - a,
+            'old_threshold': current,
+            'new_threshold': None,
+        }
+        results.append(result)
+        if b - a < MIN_BUCKETS:
+            continue
+
+        symbol_times = times[a:b]
+        symbol_changes = [values[a:b] for values in changes]
+        # 按实际有数据的时间跨度换算目标次数
+        days = float(buckets[b - 1] - buckets[a] + bucket_seconds) / 86400
+        threshold = fit_threshold(symbol_times, symbol_changes, score[a:b], target_per_day * days)
+        result.update({
+            'new_threshold': threshold,
+            'old_rate_per_day': count_alerts(symbol_times, symbol_changes, current) / days,
+            'new_rate_per_day': count_alerts(symbol_times, symbol_changes, threshold) / days,
+        })
+        if threshold != current:
+            updates.append((threshold, symbol.symbol_id))
+
+    if updates and not dry_run:
+        conn = get_connection()
+        with conn:
+            conn.executemany('UPDATE symbols SET alert_threshold = ? WHERE symbol_id = ?', updates)
+        set_meta('thresholds_calibrated_at', clock.now().isoformat(timespec='seconds'))
+    logger.info(f"Calibrated {sum(1 for r in results if r['new_threshold'] is not None)}/{len(results)} symbols "
+                f"over {len(closes)} buckets in {time.perf_counter() - started:.2f}s"
+                f"{' (dry run)' if dry_run else f', {len(updates)} updated'}")
+    return results
+
+
+def main(argv: List[str] = None) -> List[Dict[str, Any]]:
+    parser = argparse.ArgumentParser(description='Calibrate alert thresholds from historical volatility')
+    parser.add_argument('--target', type=float, default=TARGET_ALERTS_PER_DAY, help='每个标的每天的目标预警次数')
+    parser.add_argument('--days', type=int, default=LOOKBACK_DAYS, help='用最近多少天的数据')
+    parser.add_argument('--symbols', help='只校准这些标的（逗号分隔）')
+    parser.add_argument('--dry-run', action='store_true', help='只计算，不写回数据库')
+    parser.add_argument('--output', help='结果 JSON 路径，默认输出到标准输出')
+    args = parser.parse_args(argv)
+
+    results = calibrate(args.target, args.days, args.symbols.split(',') if args.symbols else None, args.dry_run)
+    output = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.output:
+        Path(args.output).write_text(output + '\n', encoding='utf-8')
+    else:
+        print(output)
+    return results
+
+
+if __name__ == '__main__':
+    main()
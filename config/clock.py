@@ -0,0 +1,72 @@
+"""
+可替换的时钟
+业务代码通过 clock.now() / clock.timestamp() 取当前时间，默认为系统时钟；
+回放时换成 SimulatedClock，由回放程序推进时间，检测、预警状态过期和 backfill 都按模拟时间运行
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional, Union
+
+
+class SystemClock:
+    """系统时钟"""
+
+    def now(self) -> datetime:
+        return datetime.now()
+
+    def timestamp(self) -> float:
+        return time.time()
+
+
+class SimulatedClock:
+    """模拟时钟：时间只在 set / advance 时变化"""
+
+    def __init__(self, start: Union[datetime, float]):
+        self._lock = threading.Lock()
+        self._ts = start.timestamp() if isinstance(start, datetime) else float(start)
+
+    def now(self) -> datetime:
+        return datetime.fromtimestamp(self.timestamp())
+
+    def timestamp(self) -> float:
+        with self._lock:
+            return self._ts
+
+    def set(self, value: Union[datetime, float]):
+        """设置当前时间（不允许倒退）"""
+        ts = value.timestamp() if isinstance(value, datetime) else float(value)
+        with self._lock:
+            if ts < self._ts:
+                raise ValueError(f"Simulated clock cannot go backwards ({ts} < {self._ts})")
+            self._ts = ts
+
+    def advance(self, seconds: Union[float, timedelta]):
+        if isinstance(seconds, timedelta):
+            seconds = seconds.total_seconds()
+        with self._lock:
+            self._ts += max(seconds, 0.0)
+
+
+_clock = SystemClock()
+
+
+def get_clock():
+    return _clock
+
+
+def set_clock(clock: Optional[object] = None):
+    """替换全局时钟，传 None 恢复系统时钟"""
+    global _clock
+    _clock = clock if clock is not None else SystemClock()
+
+
+def now() -> datetime:
+    """当前本地时间（naive datetime，与 datetime.now() 一致）"""
+    return _clock.now()
+
+
+def timestamp() -> float:
+    """当前 Unix 时间戳（秒）"""
+    return _clock.timestamp()
@@ -1,14 +1,196 @@
+import os
 import sqlite3
-from datetime import datetime
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
 from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from config import clock
 
 DB_PATH = Path(__file__).parent.parent / "data" / "market_monitor.db"
 
-def init_db():
-    """初始化数据库，创建表结构"""
+# 存储配置：连接建立时执行的 PRAGMA
+# default: WAL + synchronous=NORMAL，读写互不阻塞，提交时不再每次 fsync
+# durable: WAL + synchronous=FULL，掉电也不丢最近提交
+# legacy:  回滚日志模式，与旧版本行为一致
+STORAGE_PROFILES = {
+    'default': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -64000,  # 负数单位为 KiB，约 64MB
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,
+    },
+    'durable': {
+        'journal_mode': 'WAL',
+        'synchronous': 'FULL',
+        'mmap_size': 64 * 1024 * 1024,
+        'cache_size': -16000,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,
+    },
+    'legacy': {
+        'journal_mode': 'DELETE',
+        'synchronous': 'FULL',
+        'busy_timeout': 5000,
+    },
+}
+
+# 每个连接缓存的预编译语句数量
+STATEMENT_CACHE_SIZE = 256
+
+# 时间列存储格式
+# iso:      Python datetime 默认适配的本地时间文本（旧格式）
+# epoch_ms: UTC 毫秒时间戳整数，比较和范围扫描都是整数运算
+TIME_FORMAT_ISO = 'iso'
+TIME_FORMAT_EPOCH_MS = 'epoch_ms'
+# 新建数据库使用的时间格式
+DEFAULT_TIME_FORMAT = os.getenv('MARKET_MONITOR_TIME_FORMAT', TIME_FORMAT_ISO)
+
+# 需要按时间格式存储的列
+TIME_COLUMNS = {
+    'market_data': ('market_time', 'local_time'),
+    'alert_states': ('last_trigger_time_30m', 'last_trigger_time_2h'),
+}
+# 时间格式迁移时最后才迁移的近期行情（秒），需覆盖检测和 as-of 查询的最大回看窗口
+MIGRATE_RECENT_SECONDS = 86400
+
+# OHLCV 汇总表：级别 -> 时间桶秒数（按 UTC 对齐），表名为 market_data_<级别>
+ROLLUP_LEVELS = {
+    '5m': 300,
+    '1h': 3600,
+    '1d': 86400,
+}
+# volume 为单个区间成交量、可在时间桶内累加的数据源（K 线）；
+# 其他数据源的 volume 是行情接口的滚动 24h 成交量（或 K 线内的累计值），汇总表中不计入
+INTERVAL_VOLUME_SOURCES = ('binance_backfill', 'synthetic')
+
+# 原始行情按 UTC 自然月分区存储为 market_data_pYYYYMM 表，market_data 是所有分区的 UNION ALL 视图；
+# 当月分区很小，能常驻页缓存，过期数据整表 DROP，不需要大批量 DELETE 或全库 VACUUM
+PARTITION_PREFIX = 'market_data_p'
+# 原始行情保留天数（0 表示永久保留），超出的整月分区在已汇总后删除，汇总表不受影响
+RAW_RETENTION_DAYS = int(os.getenv('MARKET_MONITOR_RAW_RETENTION_DAYS', '90'))
+
+# symbols 表的版本号（db_meta 中的键），表的每次增删改由触发器加 1，供进程内的标的缓存判断是否过期
+SYMBOLS_VERSION_KEY = 'symbols_version'
+
+# symbols.alert_threshold 与检测的涨跌幅同单位（小数，0.02 表示 2%）；
+# 不小于该值的阈值按百分数写入处理（早期默认数据和手工填写的 2.0 等），由触发器换算为小数
+PERCENT_THRESHOLD_MIN = 0.5
+
+_storage_profile = os.getenv('MARKET_MONITOR_STORAGE_PROFILE', 'default')
+# 每个线程一个长连接，线程退出时随 thread-local 一起释放
+_local = threading.local()
+# close_all_connections 之后递增，各线程据此丢弃旧连接
+_generation = 0
+# 当前数据库的时间格式，首次使用时从 db_meta 读取
+_time_format: Optional[str] = None
+# 数据库路径 -> (schema_version, 分区表名列表)，schema 变化时重新读取
+_partitions_cache: Dict[str, Tuple[int, List[str]]] = {}
+# 已完成的一次性初始化 (数据库路径, 名称)；可重入锁让初始化过程中的嵌套调用直接返回
+_init_done: Set[Tuple[str, str]] = set()
+_init_running: Set[Tuple[str, str]] = set()
+_init_lock = threading.RLock()
+
+def set_storage_profile(name: str):
+    """切换存储配置，之后新建的连接生效"""
+    global _storage_profile
+    if name not in STORAGE_PROFILES:
+        raise ValueError(f"Unknown storage profile: {name}")
+    _storage_profile = name
+    close_all_connections()
+
+def _connect() -> sqlite3.Connection:
+    """新建连接并应用存储配置"""
     DB_PATH.parent.mkdir(exist_ok=True)
+    conn = sqlite3.connect(DB_PATH, cached_statements=STATEMENT_CACHE_SIZE)
+    # 必须在其他 PRAGMA 之前：journal_mode 等会写入文件头，之后再设置 auto_vacuum 对新库也不生效；
+    # 已有的库不受影响（需 VACUUM 才能切换，见 enable_incremental_vacuum）
+    conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    profile = STORAGE_PROFILES.get(_storage_profile, STORAGE_PROFILES['default'])
+    for pragma, value in profile.items():
+        conn.execute(f'PRAGMA {pragma} = {value}')
+    return conn
 
-    conn = sqlite3.connect(DB_PATH)
+def get_connection() -> sqlite3.Connection:
+    """
+    获取当前线程的长连接
+    连接按线程复用，调用方不要 close；写操作用 `with conn:` 提交或回滚
+    """
+    conn = getattr(_local, 'conn', None)
+    if (conn is None or getattr(_local, 'path', None) != DB_PATH
+            or getattr(_local, 'generation', None) != _generation):
+        conn = _connect()
+        _local.conn = conn
+        _local.path = DB_PATH
+        _local.generation = _generation
+        run_once('schema', _init_schema)
+    return conn
+
+def close_connection():
+    """关闭当前线程的连接"""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        _local.conn = None
+        conn.close()
+
+def close_all_connections():
+    """
+    使所有线程的连接失效（退出或切换配置时调用）
+    当前线程的连接立即关闭，其他线程在下次 get_connection 时重建
+    """
+    global _generation
+    _generation += 1
+    close_connection()
+
+@contextmanager
+def ddl_transaction(conn: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+    """
+    显式的写事务（BEGIN IMMEDIATE ... COMMIT，异常时回滚）
+    sqlite3 模块只为 DML 隐式开启事务，CREATE / DROP 等 DDL 不在事务内，需要与其他语句原子执行时用这里包起来；
+    调用方已在事务中时直接复用调用方的事务
+    """
+    if conn.in_transaction:
+        yield conn
+        return
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+def run_once(name: str, func: Callable[[], None]):
+    """
+    每个数据库只执行一次 func（建表等初始化），之后的调用只是一次集合查找
+    多线程同时调用时其他线程等待初始化完成；初始化过程中同一线程的嵌套调用直接返回
+    """
+    key = (str(DB_PATH), name)
+    if key in _init_done:
+        return
+    with _init_lock:
+        if key in _init_done or key in _init_running:
+            return
+        _init_running.add(key)
+        try:
+            func()
+            _init_done.add(key)
+        finally:
+            _init_running.discard(key)
+
+def init_db():
+    """初始化数据库（每个进程、每个数据库只执行一次，首次 get_connection 时已自动执行）"""
+    run_once('schema', _init_schema)
+    print(f"Database initialized at {DB_PATH}")
+
+def _init_schema():
+    """创建表结构，迁移旧库"""
+    conn = get_connection()
     cursor = conn.cursor()
 
     # 标的表
@@ -22,26 +204,12 @@ def init_db():
             update_interval INTEGER DEFAULT 5,
             latency_notes TEXT,
             is_active INTEGER DEFAULT 1,
-            alert_threshold REAL DEFAULT 1.0,
+            alert_threshold REAL DEFAULT 0.01,
             backfill_enabled INTEGER DEFAULT 0,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     ''')
 
-    # 行情表
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS market_data (
-            data_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            symbol_id INTEGER NOT NULL,
-            market_time TIMESTAMP NOT NULL,
-            local_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            price REAL NOT NULL,
-            volume REAL,
-            source_api TEXT NOT NULL,
-            FOREIGN KEY (symbol_id) REFERENCES symbols(symbol_id)
-        )
-    ''')
-
     # API配置表
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS api_configs (
@@ -54,15 +222,396 @@ def init_db():
         )
     ''')
 
-    # 创建索引
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_market_data_symbol_time ON market_data(symbol_id, market_time)')
+    # 元数据表（存储格式等）
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS db_meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+    ''')
+
+    # OHLCV 汇总表，bucket 为时间桶起点的 UTC epoch 秒，open_ts / close_ts 为开收盘价对应的 epoch 秒
+    for level in ROLLUP_LEVELS:
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS market_data_{level} (
+                symbol_id INTEGER NOT NULL,
+                bucket INTEGER NOT NULL,
+                open REAL NOT NULL,
+                high REAL NOT NULL,
+                low REAL NOT NULL,
+                close REAL NOT NULL,
+                volume REAL,
+                count INTEGER NOT NULL,
+                open_ts REAL NOT NULL,
+                close_ts REAL NOT NULL,
+                PRIMARY KEY (symbol_id, bucket)
+            ) WITHOUT ROWID
+        ''')
+
+    # 行情分区与 market_data 视图；旧库的 market_data 表在 migrate_to_partitions 中拆分
+    cursor.execute("SELECT type FROM sqlite_master WHERE name = 'market_data'")
+    row = cursor.fetchone()
+    legacy_table = row is not None and row[0] == 'table'
+    if not legacy_table:
+        # 每次都按实际存在的分区重建视图，修复中断的 DDL 留下的指向已删除分区的视图
+        with ddl_transaction(conn):
+            _create_partition(conn, partition_for(time.time()))
+            _rebuild_market_data_view(conn)
+
+    # 已有数据但未记录格式的旧库按 iso 处理，空库使用默认格式
+    cursor.execute("SELECT value FROM db_meta WHERE key = 'time_format'")
+    if cursor.fetchone() is None:
+        cursor.execute('SELECT 1 FROM market_data LIMIT 1')
+        time_format = TIME_FORMAT_ISO if cursor.fetchone() else DEFAULT_TIME_FORMAT
+        cursor.execute("INSERT INTO db_meta (key, value) VALUES ('time_format', ?)", (time_format,))
+
+    # 标的表版本号：任何进程（包括手工 SQL）修改 symbols 都会递增
+    cursor.execute("INSERT OR IGNORE INTO db_meta (key, value) VALUES (?, '0')", (SYMBOLS_VERSION_KEY,))
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS symbols_version_{event.lower()} AFTER {event} ON symbols
+            BEGIN
+                UPDATE db_meta SET value = CAST(value AS INTEGER) + 1 WHERE key = '{SYMBOLS_VERSION_KEY}';
+            END
+        ''')
+
+    # 阈值统一为小数：换算旧库中按百分数存储的阈值，之后按百分数写入的值由触发器换算
+    cursor.execute(
+        'UPDATE symbols SET alert_threshold = alert_threshold / 100.0 WHERE alert_threshold >= ?',
+        (PERCENT_THRESHOLD_MIN,)
+    )
+    for event in ('INSERT', 'UPDATE OF alert_threshold'):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS symbols_threshold_percent_{event.split()[0].lower()}
+            AFTER {event} ON symbols
+            WHEN NEW.alert_threshold >= {PERCENT_THRESHOLD_MIN}
+            BEGIN
+                UPDATE symbols SET alert_threshold = NEW.alert_threshold / 100.0 WHERE symbol_id = NEW.symbol_id;
+            END
+        ''')
+
+    # 汇总表是否已包含全部历史数据，旧库需要 RollupRepository.ensure_built 重建一次
+    cursor.execute("SELECT value FROM db_meta WHERE key = 'rollups_built'")
+    if cursor.fetchone() is None:
+        cursor.execute('SELECT 1 FROM market_data LIMIT 1')
+        built = '0' if cursor.fetchone() else '1'
+        cursor.execute("INSERT INTO db_meta (key, value) VALUES ('rollups_built', ?)", (built,))
+    # 早期汇总表累加了所有数据源的 volume，旧库标记为未构建，由 ensure_built 重建一次
+    cursor.execute("SELECT value FROM db_meta WHERE key = 'rollup_volume'")
+    if cursor.fetchone() is None:
+        cursor.execute('''
+            UPDATE db_meta SET value = '0'
+            WHERE key = 'rollups_built' AND EXISTS (SELECT 1 FROM market_data LIMIT 1)
+        ''')
+        cursor.execute("INSERT INTO db_meta (key, value) VALUES ('rollup_volume', 'interval')")
 
     conn.commit()
-    conn.close()
-    print(f"Database initialized at {DB_PATH}")
+    _reset_time_format()
+    if legacy_table or _has_unpartitioned(conn):
+        moved = migrate_to_partitions()
+        print(f"Moved {moved} market_data rows into monthly partitions")
 
-def get_connection():
-    return sqlite3.connect(DB_PATH)
+def get_meta(key: str) -> Optional[str]:
+    """读取 db_meta 中的配置项"""
+    conn = get_connection()
+    try:
+        row = conn.execute('SELECT value FROM db_meta WHERE key = ?', (key,)).fetchone()
+    except sqlite3.OperationalError:
+        # 旧库尚未创建 db_meta
+        return None
+    return row[0] if row else None
+
+def set_meta(key: str, value: str):
+    """写入 db_meta 配置项"""
+    conn = get_connection()
+    with conn:
+        conn.execute('INSERT OR REPLACE INTO db_meta (key, value) VALUES (?, ?)', (key, value))
+
+def get_time_format() -> str:
+    """当前数据库时间列的存储格式"""
+    global _time_format
+    if _time_format is None:
+        _time_format = get_meta('time_format') or TIME_FORMAT_ISO
+    return _time_format
+
+def _reset_time_format():
+    global _time_format
+    _time_format = None
+
+def encode_time(value: Any) -> Any:
+    """datetime 转换为数据库存储值（按当前时间格式）"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if get_time_format() == TIME_FORMAT_EPOCH_MS:
+        if isinstance(value, datetime):
+            return int(round(value.timestamp() * 1000))
+        return int(value)
+    return value
+
+def decode_time(value: Any) -> Optional[datetime]:
+    """数据库存储值转换为本地时间 datetime（兼容两种格式）"""
+    if value is None or isinstance(value, datetime):
+        return value
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return datetime.fromtimestamp(value / 1000)
+
+def migrate_time_format(batch_size: int = 5000, recent_seconds: float = MIGRATE_RECENT_SECONDS) -> int:
+    """
+    把 iso 文本时间原地迁移为 UTC 毫秒时间戳，返回迁移的行数
+    SQLite 中整数总是小于文本，迁移期间新旧两种值混在一起时按时间比较和排序是错的，因此：
+    - 分批阶段只迁移 recent_seconds 之前的行情，每个标的按 market_time 从旧到新、每批一个事务，
+      已迁移的行都早于该标的任何未迁移的行，近期窗口（文本参数）的 as-of 和区间查询结果不受影响；
+      更早时间的查询在迁移期间可能不准
+    - 最后在同一事务内迁移剩余的行（近期行情、预警状态、迁移期间新写入的行）并切换 db_meta.time_format
+    迁移期间应停止 backfill、replay 等写入历史时间行情的进程（否则早于已迁移部分的文本行会打破上述顺序），
+    实时写入可以继续；其他正在运行的进程需重启才会按新格式写入
+    """
+    if get_time_format() == TIME_FORMAT_EPOCH_MS:
+        return 0
+
+    conn = get_connection()
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+    def to_epoch_ms(column: str) -> str:
+        # julianday(..., 'utc') 把本地时间文本换算为 UTC
+        return (f"CASE WHEN typeof({column}) = 'text' "
+                f"THEN CAST(ROUND((julianday({column}, 'utc') - 2440587.5) * 86400000.0) AS INTEGER) "
+                f"ELSE {column} END")
+
+    def migrate_batch(table: str, key: str, columns, where: str = '1 = 1', params: tuple = (),
+                      order: Optional[str] = None) -> int:
+        assignments = ', '.join(f'{column} = {to_epoch_ms(column)}' for column in columns)
+        pending = ' OR '.join(f"typeof({column}) = 'text'" for column in columns)
+        cursor = conn.execute(f'''
+            UPDATE {table} SET {assignments}
+            WHERE {key} IN (
+                SELECT {key} FROM {table} WHERE ({pending}) AND {where} ORDER BY {order or key} LIMIT ?
+            )
+        ''', (*params, batch_size))
+        return cursor.rowcount
+
+    keys = {'market_data': 'data_id', 'alert_states': 'symbol_id'}
+
+    def market_data_tables() -> List[str]:
+        # market_data 是分区视图，逐个分区表迁移：旧表中是最早的数据，其次按月份从旧到新
+        tables = list(reversed(list_partitions(conn)))
+        if _has_unpartitioned(conn):
+            tables = ['market_data_unpartitioned'] + tables
+        return tables
+
+    def targets():
+        for table, columns in TIME_COLUMNS.items():
+            if table == 'market_data':
+                for partition in market_data_tables():
+                    yield partition, keys[table], columns
+            elif table in existing:
+                yield table, keys[table], columns
+
+    total = 0
+    # 分批阶段：每个标的按 market_time 顺序迁移近期窗口之前的行情（走 (symbol_id, market_time) 索引）
+    cutoff = partition_bound(clock.timestamp() - recent_seconds)
+    columns = TIME_COLUMNS['market_data']
+    for table in market_data_tables():
+        symbol_ids = [row[0] for row in conn.execute(f'SELECT DISTINCT symbol_id FROM {table}')]
+        for symbol_id in symbol_ids:
+            while True:
+                with conn:
+                    count = migrate_batch(
+                        table, keys['market_data'], columns,
+                        where="symbol_id = ? AND typeof(market_time) = 'text' AND market_time < ?",
+                        params=(symbol_id, cutoff), order='market_time'
+                    )
+                total += count
+                if count < batch_size:
+                    break
+
+    # 收尾：近期行情、迁移期间新写入的文本行与格式切换放在同一事务
+    with conn:
+        for table, key, columns in targets():
+            while True:
+                count = migrate_batch(table, key, columns)
+                total += count
+                if count < batch_size:
+                    break
+        conn.execute(
+            "INSERT OR REPLACE INTO db_meta (key, value) VALUES ('time_format', ?)",
+            (TIME_FORMAT_EPOCH_MS,)
+        )
+    _reset_time_format()
+    return total
+
+def partition_for(ts: float) -> str:
+    """epoch 秒所在 UTC 月份的分区表名"""
+    month = datetime.fromtimestamp(ts, timezone.utc)
+    return f"{PARTITION_PREFIX}{month.year:04d}{month.month:02d}"
+
+def partition_range(name: str) -> Tuple[float, float]:
+    """分区覆盖的 [起点, 终点) epoch 秒"""
+    year, month = int(name[-6:-2]), int(name[-2:])
+    start = datetime(year, month, 1, tzinfo=timezone.utc)
+    end = datetime(year + month // 12, month % 12 + 1, 1, tzinfo=timezone.utc)
+    return start.timestamp(), end.timestamp()
+
+def partition_bound(ts: float) -> Any:
+    """epoch 秒转换为可与 market_time 比较的存储值"""
+    return encode_time(datetime.fromtimestamp(ts))
+
+def list_partitions(conn: Optional[sqlite3.Connection] = None) -> List[str]:
+    """所有行情分区表名，从新到旧"""
+    conn = conn or get_connection()
+    version = conn.execute('PRAGMA schema_version').fetchone()[0]
+    cached = _partitions_cache.get(str(DB_PATH))
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    names = sorted((
+        row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB ?",
+            (PARTITION_PREFIX + '[0-9][0-9][0-9][0-9][0-9][0-9]',)
+        )
+    ), reverse=True)
+    _partitions_cache[str(DB_PATH)] = (version, names)
+    return names
+
+def _create_partition(conn: sqlite3.Connection, name: str):
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {name} (
+            data_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            symbol_id INTEGER NOT NULL,
+            market_time TIMESTAMP NOT NULL,
+            local_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            price REAL NOT NULL,
+            volume REAL,
+            source_api TEXT NOT NULL,
+            FOREIGN KEY (symbol_id) REFERENCES symbols(symbol_id)
+        )
+    ''')
+    conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{name}_symbol_time ON {name}(symbol_id, market_time)')
+
+def _has_unpartitioned(conn: sqlite3.Connection) -> bool:
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'market_data_unpartitioned'"
+    ).fetchone()
+    return row is not None
+
+def _rebuild_market_data_view(conn: sqlite3.Connection):
+    """按当前分区重建 market_data 视图（在调用方的事务内执行）"""
+    tables = list_partitions(conn)
+    if _has_unpartitioned(conn):
+        # 迁移尚未完成，旧表中剩余的数据也要可见
+        tables = tables + ['market_data_unpartitioned']
+    conn.execute('DROP VIEW IF EXISTS market_data')
+    conn.execute('CREATE VIEW market_data AS ' + ' UNION ALL '.join(
+        f'SELECT data_id, symbol_id, market_time, local_time, price, volume, source_api FROM {table}'
+        for table in tables
+    ))
+
+def ensure_partitions(names: Iterable[str], conn: Optional[sqlite3.Connection] = None):
+    """
+    创建缺少的分区并重建视图，写入前调用
+    调用方已在事务中时在其事务内执行，否则建表和重建视图单独一个事务
+    """
+    conn = conn or get_connection()
+    names = set(names)
+    if not names - set(list_partitions(conn)):
+        return
+    with ddl_transaction(conn):
+        # 持有写锁后重新读取，包含其他进程刚建的分区
+        for name in sorted(names - set(list_partitions(conn))):
+            _create_partition(conn, name)
+        _rebuild_market_data_view(conn)
+
+def migrate_to_partitions() -> int:
+    """
+    把旧库的 market_data 表拆分为月分区，返回搬迁的行数
+    旧表先改名（O(1)）并纳入视图，再按月每月一个事务搬迁，中断后重新调用可继续
+    """
+    conn = get_connection()
+    row = conn.execute("SELECT type FROM sqlite_master WHERE name = 'market_data'").fetchone()
+    with ddl_transaction(conn):
+        if row is not None and row[0] == 'table':
+            conn.execute('ALTER TABLE market_data RENAME TO market_data_unpartitioned')
+            _create_partition(conn, partition_for(time.time()))
+            _rebuild_market_data_view(conn)
+    if not _has_unpartitioned(conn):
+        return 0
+
+    total = 0
+    while True:
+        row = conn.execute('SELECT MIN(market_time) FROM market_data_unpartitioned').fetchone()
+        if row[0] is None:
+            break
+        name = partition_for(decode_time(row[0]).timestamp())
+        start, end = partition_range(name)
+        with ddl_transaction(conn):
+            ensure_partitions([name], conn)
+            # 分区起点之前的行（跨时区边界的零头）一并并入
+            params = (partition_bound(end),)
+            conn.execute(f'''
+                INSERT INTO {name} (symbol_id, market_time, local_time, price, volume, source_api)
+                SELECT symbol_id, market_time, local_time, price, volume, source_api
+                FROM market_data_unpartitioned WHERE market_time < ?
+            ''', params)
+            cursor = conn.execute('DELETE FROM market_data_unpartitioned WHERE market_time < ?', params)
+            total += cursor.rowcount
+
+    with ddl_transaction(conn):
+        conn.execute('DROP TABLE market_data_unpartitioned')
+        _rebuild_market_data_view(conn)
+    return total
+
+def apply_retention(days: int = RAW_RETENTION_DAYS, now: Optional[float] = None) -> List[str]:
+    """
+    删除整月都早于保留期的原始行情分区，返回删除的分区名
+    汇总表尚未包含全部历史时不删除；删除后增量 VACUUM 归还空闲页
+    """
+    if days <= 0 or get_meta('rollups_built') != '1':
+        return []
+    now = clock.timestamp() if now is None else now
+    cutoff = now - days * 86400
+    current = partition_for(now)
+
+    conn = get_connection()
+    expired = [
+        name for name in list_partitions(conn)
+        if name != current and partition_range(name)[1] <= cutoff
+    ]
+    if not expired:
+        return []
+
+    retained_from = max(partition_range(name)[1] for name in expired)
+    # 删表、重建视图和记录保留起点在同一事务内，中途失败时视图不会指向已删除的分区
+    with ddl_transaction(conn):
+        ensure_partitions([current], conn)
+        for name in expired:
+            conn.execute(f'DROP TABLE {name}')
+        _rebuild_market_data_view(conn)
+        previous = conn.execute("SELECT value FROM db_meta WHERE key = 'raw_retained_from'").fetchone()
+        if previous is not None:
+            retained_from = max(retained_from, float(previous[0]))
+        conn.execute(
+            "INSERT OR REPLACE INTO db_meta (key, value) VALUES ('raw_retained_from', ?)",
+            (str(retained_from),)
+        )
+    # 未开启 auto_vacuum 的库（在 _connect 设置之前创建的库）此语句无效，空闲页只留给新分区复用，
+    # 文件不会变小；用 enable_incremental_vacuum 转换一次。
+    # incremental_vacuum 每执行一步只释放一页，execute 只执行一步，用 executescript 执行到底
+    conn.executescript('PRAGMA incremental_vacuum')
+    return expired
+
+def enable_incremental_vacuum() -> bool:
+    """
+    为未开启 auto_vacuum 的库开启增量 VACUUM（需完整 VACUUM 一次，期间锁库，请停止其他进程后执行）
+    返回是否做了转换
+    """
+    conn = get_connection()
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+        return False
+    conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    conn.execute('VACUUM')
+    return True
 
 def init_default_data():
     """初始化默认标的和API配置"""
@@ -83,20 +632,20 @@ def init_default_data():
     # 初始化标的
     symbols = [
         # 加密货币 - Binance, 启用 backfill
-        ('BTCUSDT', 'Bitcoin', 'crypto', 'binance', 5, '实时', 2.0, 1),
-        ('ETHUSDT', 'Ethereum', 'crypto', 'binance', 5, '实时', 2.0, 1),
+        ('BTCUSDT', 'Bitcoin', 'crypto', 'binance', 5, '实时', 0.02, 1),
+        ('ETHUSDT', 'Ethereum', 'crypto', 'binance', 5, '实时', 0.02, 1),
 
         # 贵金属 ETF - Finnhub
-        ('GLD', 'Gold ETF', 'commodity', 'finnhub', 5, '实时', 1.0, 0),
-        ('SLV', 'Silver ETF', 'commodity', 'finnhub', 5, '实时', 1.0, 0),
+        ('GLD', 'Gold ETF', 'commodity', 'finnhub', 5, '实时', 0.01, 0),
+        ('SLV', 'Silver ETF', 'commodity', 'finnhub', 5, '实时', 0.01, 0),
 
         # 原油 ETF - Finnhub
-        ('USO', 'Crude Oil ETF', 'commodity', 'finnhub', 5, '实时', 1.2, 0),
+        ('USO', 'Crude Oil ETF', 'commodity', 'finnhub', 5, '实时', 0.012, 0),
 
         # 美股指数 ETF - Finnhub
-        ('SPY', 'S&P 500 ETF', 'index', 'finnhub', 5, '实时', 0.8, 0),
-        ('DIA', 'Dow Jones ETF', 'index', 'finnhub', 5, '实时', 0.8, 0),
-        ('QQQ', 'NASDAQ ETF', 'index', 'finnhub', 5, '实时', 0.8, 0),
+        ('SPY', 'S&P 500 ETF', 'index', 'finnhub', 5, '实时', 0.008, 0),
+        ('DIA', 'Dow Jones ETF', 'index', 'finnhub', 5, '实时', 0.008, 0),
+        ('QQQ', 'NASDAQ ETF', 'index', 'finnhub', 5, '实时', 0.008, 0),
     ]
 
     cursor.executemany('''
@@ -106,9 +655,16 @@ def init_default_data():
     ''', symbols)
 
     conn.commit()
-    conn.close()
     print("Default data initialized")
 
 if __name__ == '__main__':
     init_db()
     init_default_data()
+    if len(sys.argv) > 1 and sys.argv[1] == 'migrate-time':
+        count = migrate_time_format()
+        print(f"Migrated {count} rows to {TIME_FORMAT_EPOCH_MS}")
+    elif len(sys.argv) > 1 and sys.argv[1] == 'enable-vacuum':
+        if enable_incremental_vacuum():
+            print("Enabled incremental auto_vacuum")
+        else:
+            print("Incremental auto_vacuum already enabled")
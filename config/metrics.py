@@ -0,0 +1,290 @@
+"""
+进程内指标：计数器和直方图（按标签区分），导出为 Prometheus 文本格式
+每次记录只是一次加锁的整数/浮点累加（直方图多一次 bisect），可以常开；
+通过 HTTP（/metrics）或定期写文件（node_exporter textfile collector）导出
+"""
+
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# 直方图默认分桶（秒）
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# 导出配置：HTTP 端口 / 文件路径，未设置时不导出
+METRICS_PORT = os.getenv('MARKET_MONITOR_METRICS_PORT')
+# HTTP 监听地址：端点没有鉴权，默认只监听本机，需要远程抓取时显式设置（如 0.0.0.0）
+METRICS_HOST = os.getenv('MARKET_MONITOR_METRICS_HOST', '127.0.0.1')
+METRICS_FILE = os.getenv('MARKET_MONITOR_METRICS_FILE')
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _CounterChild:
+    __slots__ = ('value', 'lock')
+
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self.lock:
+            self.value += amount
+
+
+class _HistogramChild:
+    __slots__ = ('bounds', 'counts', 'sum', 'lock')
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        # 最后一格为 +Inf
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+
+class _Metric:
+    """一个指标及其各组标签值的子项"""
+
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, **labels):
+        """按标签取子项（首次使用时创建）"""
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.get(key)
+                if child is None:
+                    child = self._children[key] = self._new_child()
+        return child
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(self.samples())
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1, **labels):
+        self.labels(**labels).inc(amount)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            children = list(self._children.items())
+        return [
+            f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}'
+            for key, child in children
+        ]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float, **labels):
+        self.labels(**labels).observe(value)
+
+    def time(self, **labels):
+        """计时上下文：with HISTOGRAM.time(provider='binance'): ..."""
+        return self.labels(**labels).time()
+
+    def timed(self, **labels) -> Callable:
+        """计时装饰器，标签固定"""
+        def decorator(func: Callable) -> Callable:
+            child = self.labels(**labels)
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    child.observe(time.perf_counter() - started)
+            return wrapper
+        return decorator
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            children = list(self._children.items())
+        lines = []
+        for key, child in children:
+            with child.lock:
+                counts = list(child.counts)
+                total = child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}')
+        return lines
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Prometheus 文本格式"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+    def write_file(self, path: str):
+        """写入文件（先写临时文件再改名，读取方不会读到一半）"""
+        target = Path(path)
+        tmp = target.with_name(target.name + '.tmp')
+        tmp.write_text(self.render(), encoding='utf-8')
+        os.replace(tmp, target)
+
+    def serve(self, port: int, host: str = METRICS_HOST) -> ThreadingHTTPServer:
+        """在后台线程提供 GET /metrics"""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/metrics', '/'):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+        return server
+
+
+# 进程内共享的注册表
+registry = MetricsRegistry()
+
+API_REQUEST_SECONDS = registry.histogram(
+    'market_monitor_api_request_seconds', 'HTTP request latency per provider and endpoint',
+    ('provider', 'endpoint'))
+API_REQUESTS_TOTAL = registry.counter(
+    'market_monitor_api_requests_total', 'HTTP requests per provider, endpoint and status',
+    ('provider', 'endpoint', 'status'))
+API_RETRIES_TOTAL = registry.counter(
+    'market_monitor_api_retries_total', 'Retried HTTP requests per provider and endpoint',
+    ('provider', 'endpoint'))
+API_HEDGED_REQUESTS_TOTAL = registry.counter(
+    'market_monitor_api_hedged_requests_total', 'Hedged HTTP requests per provider, endpoint and winner',
+    ('provider', 'endpoint', 'winner'))
+RATE_LIMIT_WAIT_SECONDS = registry.histogram(
+    'market_monitor_rate_limit_wait_seconds', 'Time spent waiting for rate limit tokens',
+    ('provider',), buckets=(0, 0.01, 0.1, 0.5, 1.0, 5.0, 15.0, 60.0))
+FETCH_TICK_SECONDS = registry.histogram(
+    'market_monitor_fetch_tick_seconds', 'Duration of one fetch_all round')
+CIRCUIT_TRANSITIONS_TOTAL = registry.counter(
+    'market_monitor_circuit_transitions_total', 'Circuit breaker state changes per provider',
+    ('provider', 'state'))
+# 不按标的打标签：标的数量随配置增长，单个标的的失败见 fetch_all 的 stats['errors'] 和日志
+FETCH_RESULTS_TOTAL = registry.counter(
+    'market_monitor_fetch_results_total', 'Quote fetch results per provider',
+    ('provider', 'result'))
+DB_WRITE_SECONDS = registry.histogram(
+    'market_monitor_db_write_seconds', 'SQLite write transaction latency', ('operation',))
+DB_ROWS_WRITTEN_TOTAL = registry.counter(
+    'market_monitor_db_rows_written_total', 'Rows written to SQLite', ('operation',))
+DB_READ_SECONDS = registry.histogram(
+    'market_monitor_db_read_seconds', 'SQLite read latency per query', ('query',))
+DETECTION_SECONDS = registry.histogram(
+    'market_monitor_detection_seconds', 'Duration of volatility detection', ('mode',))
+# 不按标的区分：每个标的一组直方图分桶，标的一多序列数随之膨胀
+DETECTION_SYMBOL_SECONDS = registry.histogram(
+    'market_monitor_detection_symbol_seconds', 'Duration of check_symbol for a single symbol')
+ALERTS_TOTAL = registry.counter(
+    'market_monitor_alerts_total', 'Alerts triggered per symbol and direction', ('symbol', 'direction'))
+ALERT_DELIVERY_SECONDS = registry.histogram(
+    'market_monitor_alert_delivery_seconds', 'Time from enqueue to successful delivery per sink', ('sink',))
+ALERT_DELIVERY_TOTAL = registry.counter(
+    'market_monitor_alert_delivery_total', 'Alert delivery attempts per sink and result', ('sink', 'result'))
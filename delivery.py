@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""
+预警消息异步投递
+每个消息通道（openclaw 命令、飞书 webhook 等）一个有界队列和一个后台线程，
+提交立即返回，投递失败按指数退避重试；积压时排队中的消息合并发送（单条不超过 max_chars），
+队列满且无法合并时丢弃最早的消息，慢的通道既不会阻塞行情获取，也不会拖慢其他通道
+"""
+
+import sys
+import os
+import random
+import subprocess
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Deque, Dict, List, Optional, Sequence, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+sys.path.insert(0, '/Users/yuchao/.openclaw/workspace/market_monitor')
+
+from config.logger import setup_logger
+from config.metrics import ALERT_DELIVERY_SECONDS, ALERT_DELIVERY_TOTAL
+
+logger = setup_logger('delivery')
+
+# 合并多条消息时的分隔
+COALESCE_SEPARATOR = '\n\n'
+# 合并后单条消息的最大字符数（单条原始消息超过时原样发送）
+MAX_MESSAGE_CHARS = 4000
+
+
+class MessageSink:
+    """消息通道，send 失败时抛出异常"""
+
+    name = 'sink'
+
+    def send(self, message: str):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class SubprocessSink(MessageSink):
+    """通过外部命令发送（默认 openclaw message send）"""
+
+    name = 'openclaw'
+
+    def __init__(self, command: Sequence[str] = ('openclaw', 'message', 'send'), timeout: float = 30.0):
+        self.command = list(command)
+        self.timeout = timeout
+
+    def send(self, message: str):
+        result = subprocess.run(
+            self.command + [message],
+            capture_output=True,
+            text=True,
+            timeout=self.timeout
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"{self.command[0]} exited with {result.returncode}: {result.stderr.strip()}")
+
+
+class WebhookSink(MessageSink):
+    """飞书自定义机器人 webhook，复用连接池中的长连接"""
+
+    name = 'feishu'
+
+    def __init__(self, url: str, timeout: float = 10.0):
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=2))
+
+    def send(self, message: str):
+        response = self.session.post(
+            self.url,
+            json={'msg_type': 'text', 'content': {'text': message}},
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        # 飞书在 HTTP 200 的响应体里返回业务错误码
+        body = response.json() if response.content else {}
+        code = body.get('code', body.get('StatusCode', 0))
+        if code:
+            raise RuntimeError(f"Webhook rejected message: {code} {body.get('msg', body.get('StatusMessage', ''))}")
+
+    def close(self):
+        self.session.close()
+
+
+def default_sinks() -> List[MessageSink]:
+    """默认通道：openclaw 命令，配置了 FEISHU_WEBHOOK 时再加上飞书 webhook"""
+    sinks: List[MessageSink] = [SubprocessSink()]
+    webhook = os.getenv('FEISHU_WEBHOOK')
+    if webhook:
+        sinks.append(WebhookSink(webhook))
+    return sinks
+
+
+class _SinkWorker:
+    """单个通道的有界队列和投递线程"""
+
+    def __init__(self, sink: MessageSink, maxsize: int, max_retries: int,
+                 backoff: float, max_backoff: float, max_chars: int = MAX_MESSAGE_CHARS):
+        self.sink = sink
+        self.maxsize = maxsize
+        self.max_chars = max_chars
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        # (入队时间, 消息)
+        self.queue: Deque[Tuple[float, str]] = deque()
+        self.cond = threading.Condition()
+        self.closed = threading.Event()
+        self.busy = False
+        self.stats = {
+            'submitted': 0,
+            'sent': 0,
+            'failed': 0,
+            'retries': 0,
+            'coalesced': 0,
+            'dropped': 0,
+            'latency_total': 0.0,
+            'latency_max': 0.0,
+        }
+        self.thread = threading.Thread(target=self._run, name=f"delivery-{sink.name}", daemon=True)
+        self.thread.start()
+
+    def submit(self, message: str):
+        """
+        入队，不阻塞；队列已满时并入最后一条，
+        合并后超过 max_chars 时丢弃最早的一条再入队（计入 dropped）
+        """
+        dropped = 0
+        with self.cond:
+            self.stats['submitted'] += 1
+            if len(self.queue) < self.maxsize:
+                self.queue.append((time.monotonic(), message))
+            else:
+                enqueued_at, last = self.queue[-1]
+                if len(last) + len(COALESCE_SEPARATOR) + len(message) <= self.max_chars:
+                    self.queue[-1] = (enqueued_at, last + COALESCE_SEPARATOR + message)
+                    self.stats['coalesced'] += 1
+                else:
+                    self.queue.popleft()
+                    self.queue.append((time.monotonic(), message))
+                    self.stats['dropped'] += 1
+                    dropped = self.stats['dropped']
+            self.cond.notify()
+        if dropped:
+            ALERT_DELIVERY_TOTAL.inc(sink=self.sink.name, result='dropped')
+            # 持续积压时每丢弃 100 条提示一次
+            if dropped % 100 == 1:
+                logger.warning(f"Delivery queue for {self.sink.name} is full, "
+                               f"dropped the oldest message ({dropped} dropped so far)")
+
+    def _take(self) -> Optional[Tuple[float, str]]:
+        """
+        从队首取出积压的消息合并为一条（不超过 max_chars，至少一条），返回 (最早入队时间, 消息)；
+        关闭且队列为空时返回 None
+        """
+        with self.cond:
+            while not self.queue and not self.closed.is_set():
+                self.cond.wait()
+            if not self.queue:
+                return None
+            enqueued_at, message = self.queue.popleft()
+            parts, size = [message], len(message)
+            while self.queue and size + len(COALESCE_SEPARATOR) + len(self.queue[0][1]) <= self.max_chars:
+                _, message = self.queue.popleft()
+                parts.append(message)
+                size += len(COALESCE_SEPARATOR) + len(message)
+            self.busy = True
+            self.stats['coalesced'] += len(parts) - 1
+            return enqueued_at, COALESCE_SEPARATOR.join(parts)
+
+    def _deliver(self, message: str) -> bool:
+        """发送一条消息，失败按指数退避（带抖动）重试"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.sink.send(message)
+                return True
+            except Exception as e:
+                if attempt == self.max_retries:
+                    logger.error(f"Delivery via {self.sink.name} failed after {attempt + 1} attempts: {e}")
+                    return False
+                delay = min(self.backoff * (2 ** attempt), self.max_backoff)
+                delay *= random.uniform(0.5, 1.0)
+                logger.warning(f"Delivery via {self.sink.name} failed: {e}, retrying in {delay:.1f}s")
+                with self.cond:
+                    self.stats['retries'] += 1
+                ALERT_DELIVERY_TOTAL.inc(sink=self.sink.name, result='retry')
+                # 关闭时不再等待，直接重试
+                self.closed.wait(delay)
+        return False
+
+    def _run(self):
+        while True:
+            item = self._take()
+            if item is None:
+                # 关闭且队列已清空：由投递线程自己关闭通道，不会在发送途中关闭
+                self._close_sink()
+                return
+            enqueued_at, message = item
+            try:
+                ok = self._deliver(message)
+            except Exception as e:
+                logger.error(f"Delivery worker {self.sink.name} error: {e}")
+                logger.error(traceback.format_exc())
+                ok = False
+            latency = time.monotonic() - enqueued_at
+            with self.cond:
+                self.busy = False
+                if ok:
+                    self.stats['sent'] += 1
+                    self.stats['latency_total'] += latency
+                    self.stats['latency_max'] = max(self.stats['latency_max'], latency)
+                else:
+                    self.stats['failed'] += 1
+                self.cond.notify_all()
+            ALERT_DELIVERY_TOTAL.inc(sink=self.sink.name, result='sent' if ok else 'failed')
+            if ok:
+                ALERT_DELIVERY_SECONDS.observe(latency, sink=self.sink.name)
+                logger.info(f"Alert delivered via {self.sink.name} in {latency:.2f}s")
+
+    def pending(self) -> int:
+        with self.cond:
+            return len(self.queue) + (1 if self.busy else 0)
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """等待队列清空，超时返回 False"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.cond:
+            while self.queue or self.busy:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.cond.wait(remaining)
+        return True
+
+    def _close_sink(self):
+        try:
+            self.sink.close()
+        except Exception as e:
+            logger.error(f"Failed to close {self.sink.name}: {e}")
+
+    def close(self, timeout: Optional[float] = None):
+        """
+        等待投递线程发完排队的消息后退出，由线程关闭通道；
+        超时后线程仍在发送时不关闭通道，只记录日志，线程发完剩余消息后再关闭
+        """
+        with self.cond:
+            self.closed.set()
+            self.cond.notify_all()
+        self.thread.join(timeout)
+        if self.thread.is_alive():
+            logger.warning(f"Delivery via {self.sink.name} still has {self.pending()} pending messages "
+                           f"after {timeout}s, closing it in the background")
+
+
+class AlertDeliveryQueue:
+    """预警消息投递队列"""
+
+    def __init__(self, sinks: Optional[List[MessageSink]] = None, maxsize: int = 100,
+                 max_retries: int = 3, backoff: float = 2.0, max_backoff: float = 60.0,
+                 max_chars: int = MAX_MESSAGE_CHARS):
+        """
+        sinks: 消息通道，默认 default_sinks()
+        maxsize: 每个通道最多排队的消息数，超出后并入最后一条，无法并入时丢弃最早的一条
+        max_chars: 合并后单条消息的最大字符数
+        max_retries: 每条消息最多重试次数
+        backoff / max_backoff: 重试退避的初始 / 最大秒数
+        """
+        if sinks is None:
+            sinks = default_sinks()
+        self._workers = [
+            _SinkWorker(sink, maxsize, max_retries, backoff, max_backoff, max_chars)
+            for sink in sinks
+        ]
+
+    def submit(self, message: str):
+        """提交消息到所有通道，立即返回"""
+        if not message:
+            return
+        for worker in self._workers:
+            worker.submit(message)
+
+    def pending(self) -> int:
+        """尚未投递完成的消息数（各通道之和）"""
+        return sum(worker.pending() for worker in self._workers)
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """等待所有通道投递完排队的消息"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for worker in self._workers:
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0.0)
+            if not worker.join(remaining):
+                return False
+        return True
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """各通道的投递统计，latency_avg 为从入队到发送成功的平均秒数"""
+        result = {}
+        for worker in self._workers:
+            with worker.cond:
+                stats = dict(worker.stats)
+            stats['latency_avg'] = stats['latency_total'] / stats['sent'] if stats['sent'] else 0.0
+            stats['pending'] = worker.pending()
+            name = worker.sink.name
+            if name in result:
+                name = f"{name}-{len(result)}"
+            result[name] = stats
+        return result
+
+    def close(self, timeout: Optional[float] = 10.0):
+        """投递完排队的消息后停止后台线程"""
+        for worker in self._workers:
+            worker.close(timeout)
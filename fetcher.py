@@ -5,28 +5,46 @@
 """
 
 import sys
+import threading
+import time
 import traceback
-from datetime import datetime
-from typing import List, Dict, Any
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Collection, List, Dict, Any, Optional, Set
 
 # 添加项目路径
 sys.path.insert(0, '/Users/yuchao/.openclaw/workspace/market_monitor')
 
+from config import clock
 from config.logger import setup_logger
+from config.metrics import FETCH_TICK_SECONDS, FETCH_RESULTS_TOTAL
 from models.symbol import Symbol
-from models.market_data import MarketDataRepository
-from api_clients import APIClientFactory
+from models.market_data import MarketDataRepository, MarketDataWriter
+from api_clients import APIClientFactory, CircuitOpenError
 from volatility_detector import VolatilityDetector, AlertResult
 from notifier import AlertNotifier
 
 # 设置日志
 logger = setup_logger('fetcher')
 
+# 并发模式下每个数据源的最大并发请求数
+PROVIDER_CONCURRENCY = {
+    'binance': 8,
+    'finnhub': 2,
+    'metals-api': 1,
+}
+DEFAULT_CONCURRENCY = 2
+
 class MarketDataFetcher:
     """行情数据获取器"""
     
-    def __init__(self):
+    def __init__(self, exclude_symbols: Collection[str] = ()):
+        """exclude_symbols: 不通过 REST 轮询的标的代码（如已由 WebSocket 实时接入的 binance 标的）"""
+        self.exclude_symbols = frozenset(exclude_symbols)
         self.repo = MarketDataRepository()
+        # 本轮行情先进入缓冲，结束时一个事务写入；
+        # add 不在轮中写入，写入失败只在 flush 中处理，不会记到正在处理的标的上
+        self.writer = MarketDataWriter(auto_flush=False)
         self.detector = VolatilityDetector()
         self.notifier = AlertNotifier()
         self.stats = {
@@ -36,6 +54,10 @@ class MarketDataFetcher:
             'errors': []
         }
         self.alerts: List[AlertResult] = []
+        # 计为成功的标的，行情写入失败时据此改记为失败
+        self._succeeded: Set[int] = set()
+        # 并发模式下保护 stats / alerts
+        self._lock = threading.Lock()
     
     def fetch_symbol(self, symbol: Symbol) -> bool:
         """获取单个标的的行情并检测波动"""
@@ -47,9 +69,17 @@ class MarketDataFetcher:
             
             # 调用 API 获取数据
             data = client.get_price(symbol.symbol_code)
-            
-            # 保存到数据库
-            data_id = self.repo.save_market_data(
+        except Exception as e:
+            self._record_failure(symbol, e)
+            return False
+        
+        return self._process_quote(symbol, data)
+    
+    def _process_quote(self, symbol: Symbol, data: Dict[str, Any]) -> bool:
+        """保存单个标的的行情并检测波动"""
+        try:
+            # 写入缓冲，批量保存到数据库
+            self.writer.add(
                 symbol_id=symbol.symbol_id,
                 market_time=data['market_time'],
                 price=data['price'],
@@ -57,40 +87,186 @@ class MarketDataFetcher:
                 source_api=data['source_api']
             )
             
-            logger.info(f"  ✓ Saved: price={data['price']}, time={data['market_time']}")
+            logger.info(f"  ✓ Fetched {symbol.symbol_code}: price={data['price']}, time={data['market_time']}")
             
             # 检测波动
             alert = self.detector.check_symbol(symbol, data['price'])
+            
+            with self._lock:
+                if alert:
+                    self.alerts.append(alert)
+                self.stats['success'] += 1
+                self._succeeded.add(symbol.symbol_id)
+            FETCH_RESULTS_TOTAL.inc(provider=symbol.data_source, result='ok')
             if alert:
-                self.alerts.append(alert)
                 logger.warning(f"  ⚠ Alert triggered for {symbol.symbol_code}!")
-            
-            self.stats['success'] += 1
             return True
             
         except Exception as e:
-            error_msg = f"{symbol.symbol_code}: {str(e)}"
+            self._record_failure(symbol, e)
+            return False
+    
+    def _record_failure(self, symbol: Symbol, error: Exception):
+        """记录单个标的的失败（熔断导致的失败不打印堆栈）"""
+        error_msg = f"{symbol.symbol_code}: {str(error)}"
+        circuit_open = isinstance(error, CircuitOpenError)
+        if circuit_open:
+            logger.debug(f"  ✗ Skipped: {error_msg}")
+        else:
             logger.error(f"  ✗ Error: {error_msg}")
-            logger.error(traceback.format_exc())
+            if error.__traceback__ is not None:
+                logger.error(''.join(traceback.format_exception(type(error), error, error.__traceback__)).rstrip())
+        with self._lock:
             self.stats['errors'].append(error_msg)
             self.stats['failed'] += 1
-            return False
+        FETCH_RESULTS_TOTAL.inc(provider=symbol.data_source,
+                                result='circuit_open' if circuit_open else 'error')
     
-    def fetch_all(self) -> Dict[str, Any]:
-        """获取所有活跃标的的行情"""
+    def fetch_group(self, data_source: str, symbols: List[Symbol], concurrent: bool = False):
+        """
+        获取同一数据源下的一组标的
+        客户端支持批量接口时一次请求获取整组行情，否则逐个获取
+        （concurrent 为 True 时按 PROVIDER_CONCURRENCY 并发）；
+        批量请求被拒绝（4xx，如其中一个标的已下架）时改为逐个获取，只有出问题的标的失败
+        数据源熔断中时整组直接记为失败，不占用本轮时间
+        """
+        if not APIClientFactory.is_available(data_source):
+            error = CircuitOpenError(f"{data_source} circuit open, skipped")
+            logger.warning(f"{data_source} is unhealthy, skipping {len(symbols)} symbols: "
+                           f"{APIClientFactory.health().get(data_source)}")
+            for symbol in symbols:
+                self._record_failure(symbol, error)
+            return
+        
+        try:
+            client = APIClientFactory.get_client(data_source)
+        except Exception as e:
+            for symbol in symbols:
+                self._record_failure(symbol, e)
+            return
+        
+        if client.supports_batch:
+            logger.info(f"Fetching {len(symbols)} symbols from {data_source} in one batch...")
+            try:
+                quotes = client.get_prices([symbol.symbol_code for symbol in symbols])
+            except Exception as e:
+                if not client.is_rejected(e):
+                    for symbol in symbols:
+                        self._record_failure(symbol, e)
+                    return
+                logger.warning(f"Batch request to {data_source} rejected ({e}), "
+                               f"fetching {len(symbols)} symbols one by one")
+                quotes = None
+            
+            if quotes is not None:
+                for symbol in symbols:
+                    data = quotes.get(symbol.symbol_code)
+                    if data is None:
+                        self._record_failure(symbol, Exception(f"no data returned from {data_source}"))
+                    else:
+                        self._process_quote(symbol, data)
+                return
+        
+        max_workers = min(PROVIDER_CONCURRENCY.get(data_source, DEFAULT_CONCURRENCY), len(symbols))
+        if not concurrent or max_workers <= 1:
+            for symbol in symbols:
+                self.fetch_symbol(symbol)
+            return
+        
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"fetch-{data_source}") as executor:
+            wait([executor.submit(self.fetch_symbol, symbol) for symbol in symbols])
+    
+    def flush(self):
+        """
+        写入缓冲中的行情和变化的预警状态
+        行情写入失败时，缓冲中的标的从成功改记为失败：获取器每轮新建，缓冲不会留到下一轮重试
+        """
+        try:
+            count = self.writer.flush()
+            if count:
+                logger.info(f"Saved {count} records")
+        except Exception as e:
+            logger.error(f"  ✗ Error: flush: {str(e)}")
+            logger.error(traceback.format_exc())
+            self._record_save_failure(e)
+        
+        try:
+            self.detector.flush_states()
+        except Exception as e:
+            # 预警状态保留在共享的 alert_store 中，下一轮再写入
+            error_msg = f"flush alert states: {str(e)}"
+            logger.error(f"  ✗ Error: {error_msg}")
+            logger.error(traceback.format_exc())
+            with self._lock:
+                self.stats['errors'].append(error_msg)
+    
+    def _record_save_failure(self, error: Exception):
+        """丢弃写入失败的缓冲行情，对应标的计为失败"""
+        symbol_ids = list(dict.fromkeys(row['symbol_id'] for row in self.writer.discard()))
+        for symbol_id in symbol_ids:
+            symbol = self.repo.get_symbol_by_id(symbol_id)
+            code = symbol.symbol_code if symbol else str(symbol_id)
+            with self._lock:
+                if symbol_id not in self._succeeded:
+                    # 已因缓冲写入时的失败计过一次
+                    continue
+                self._succeeded.discard(symbol_id)
+                self.stats['errors'].append(f"{code}: save failed: {str(error)}")
+                self.stats['success'] -= 1
+                self.stats['failed'] += 1
+            if symbol:
+                FETCH_RESULTS_TOTAL.inc(provider=symbol.data_source, result='save_error')
+    
+    def _group_by_source(self, symbols: List[Symbol]) -> Dict[str, List[Symbol]]:
+        """按数据源分组"""
+        groups: Dict[str, List[Symbol]] = defaultdict(list)
+        for symbol in symbols:
+            groups[symbol.data_source].append(symbol)
+        return groups
+    
+    def _fetch_concurrent(self, groups: Dict[str, List[Symbol]]):
+        """
+        各数据源并发获取
+        每个数据源在独立线程中处理，互不等待，整体耗时取决于最慢的数据源
+        """
+        if not groups:
+            return
+        with ThreadPoolExecutor(max_workers=len(groups), thread_name_prefix="fetch") as executor:
+            wait([
+                executor.submit(self.fetch_group, data_source, group, True)
+                for data_source, group in groups.items()
+            ])
+    
+    def fetch_all(self, concurrent: bool = False,
+                  symbols: Optional[List[Symbol]] = None) -> Dict[str, Any]:
+        """
+        获取所有活跃标的的行情
+        每个数据源一组，支持批量接口的数据源每组只请求一次
+        concurrent: 为 True 时各数据源并发获取，否则逐组获取
+        symbols: 只获取这些标的（如调度器中同一更新间隔的一组），默认所有活跃标的
+        """
         logger.info(f"{'='*60}")
-        logger.info(f"Market Data Fetcher - {datetime.now()}")
+        logger.info(f"Market Data Fetcher - {clock.now()}")
         logger.info(f"{'='*60}")
         
         # 获取所有活跃标的
-        symbols = self.repo.get_active_symbols()
+        if symbols is None:
+            symbols = self.repo.get_active_symbols()
+        symbols = [s for s in symbols if s.symbol_code not in self.exclude_symbols]
         self.stats['total'] = len(symbols)
         
         logger.info(f"Found {len(symbols)} active symbols")
         
-        # 逐个获取
-        for symbol in symbols:
-            self.fetch_symbol(symbol)
+        started = time.perf_counter()
+        groups = self._group_by_source(symbols)
+        if concurrent:
+            self._fetch_concurrent(groups)
+        else:
+            # 逐组获取
+            for data_source, group in groups.items():
+                self.fetch_group(data_source, group)
+        self.flush()
+        FETCH_TICK_SECONDS.observe(time.perf_counter() - started)
         
         # 统计
         logger.info(f"Summary: {self.stats['success']}/{self.stats['total']} succeeded")
@@ -117,7 +293,9 @@ class MarketDataFetcher:
         if not symbol:
             logger.error(f"Symbol {symbol_code} not found")
             return False
-        return self.fetch_symbol(symbol)
+        success = self.fetch_symbol(symbol)
+        self.flush()
+        return success and self.stats['failed'] == 0
 
 
 def main():
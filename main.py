@@ -1,33 +1,85 @@
 #!/usr/bin/env python3
 """
 行情监控主程序
-定时获取行情数据
+按每个标的的 update_interval 定时获取行情数据
 """
 
 import sys
-import time
-import schedule
+import threading
 import traceback
+from collections import defaultdict
 from datetime import datetime
+from typing import Dict, List, Optional
 
 sys.path.insert(0, '/Users/yuchao/.openclaw/workspace/market_monitor')
 
-from config.database import init_db, init_default_data
+from config.database import init_db, init_default_data, apply_retention
 from config.logger import setup_logger
+from config.metrics import registry, METRICS_HOST, METRICS_PORT, METRICS_FILE
+from calibration import calibrate, CALIBRATION_INTERVAL_HOURS
 from fetcher import MarketDataFetcher
 from backfill import BackfillService
+from volatility_detector import suspend_detection, resume_detection
+from models.symbol import Symbol
+from models.market_data import MarketDataRepository
+from models.rollup import RollupRepository
+from models.price_cache import price_cache
+from scheduler import Scheduler, OVERRUN_SKIP, POOL_MAINTENANCE
+from delivery import AlertDeliveryQueue
+from api_clients.base_client import BaseAPIClient
+from api_clients.recording import Recorder
 
 # 设置日志
 logger = setup_logger('market_monitor', 'market_monitor.log')
 
-def job():
-    """定时任务"""
+# WebSocket 实时接入（--stream），其订阅的标的不再通过 REST 轮询
+stream_ingestor = None
+
+# 没有配置 update_interval 时的默认更新间隔（分钟）
+DEFAULT_UPDATE_INTERVAL = 5
+# 重新读取标的配置、增删调度任务的间隔（秒）
+SYMBOL_REFRESH_INTERVAL = 300
+# 检查并删除过期行情分区的间隔（秒）
+RETENTION_INTERVAL = 3600
+# 写指标文件的间隔（秒）
+METRICS_FILE_INTERVAL = 15
+
+# 预警消息异步投递，慢的消息通道不会阻塞行情获取
+alert_queue: Optional[AlertDeliveryQueue] = None
+_alert_queue_lock = threading.Lock()
+
+def send_alert_message(msg: str):
+    """提交预警消息（openclaw / 飞书 webhook），由后台线程投递"""
+    global alert_queue
+    with _alert_queue_lock:
+        if alert_queue is None:
+            alert_queue = AlertDeliveryQueue()
+    alert_queue.submit(msg)
+    logger.info("Alert message queued for delivery")
+
+def group_by_interval(symbols: List[Symbol]) -> Dict[float, List[Symbol]]:
+    """按更新间隔（秒）分组"""
+    groups: Dict[float, List[Symbol]] = defaultdict(list)
+    for symbol in symbols:
+        minutes = symbol.update_interval or DEFAULT_UPDATE_INTERVAL
+        groups[float(minutes) * 60].append(symbol)
+    return dict(groups)
+
+def job(interval: Optional[float] = None):
+    """
+    定时任务
+    interval: 只获取更新间隔为该秒数的标的，默认获取所有活跃标的
+    """
     logger.info("=" * 60)
-    logger.info("Starting scheduled job...")
+    logger.info(f"Starting scheduled job{f' ({interval:g}s symbols)' if interval else ''}...")
     
     try:
-        fetcher = MarketDataFetcher()
-        result = fetcher.fetch_all()
+        symbols = None
+        if interval is not None:
+            symbols = group_by_interval(MarketDataRepository().get_active_symbols()).get(interval, [])
+        streamed = stream_ingestor.subscribed_codes() if stream_ingestor is not None else ()
+        fetcher = MarketDataFetcher(exclude_symbols=streamed)
+        result = fetcher.fetch_all(concurrent=True, symbols=symbols)
         
         # 记录统计信息
         logger.info(f"Job completed: {result.get('success', 0)}/{result.get('total', 0)} succeeded")
@@ -35,17 +87,7 @@ def job():
         # 如果有预警，发送到飞书
         if isinstance(result, dict) and 'alert_message' in result and result['alert_message']:
             logger.info(f"Alerts triggered: {len(result.get('alerts', []))}")
-            try:
-                import subprocess
-                msg = result['alert_message']
-                subprocess.run(
-                    ['openclaw', 'message', 'send', msg],
-                    capture_output=True,
-                    text=True
-                )
-                logger.info("Feishu notification sent")
-            except Exception as e:
-                logger.error(f"Failed to send Feishu message: {e}")
+            send_alert_message(result['alert_message'])
         else:
             logger.info("No alerts triggered")
             
@@ -56,8 +98,107 @@ def job():
     logger.info("Job finished")
     logger.info("=" * 60)
 
+def start_streaming():
+    """启动 Binance WebSocket 实时接入，已订阅的 binance 标的不再由定时任务轮询"""
+    global stream_ingestor
+    from streaming import BinanceStreamIngestor
+    
+    ingestor = BinanceStreamIngestor(
+        on_alerts=lambda alerts, message: send_alert_message(message)
+    )
+    ingestor.start()
+    stream_ingestor = ingestor
+    logger.info("Binance streaming started")
+    return ingestor
+
+def sync_jobs(scheduler: Scheduler):
+    """按当前活跃标的的更新间隔增删定时任务，每个间隔一个任务"""
+    intervals = set(group_by_interval(MarketDataRepository().get_active_symbols()))
+    names = {f"fetch-{interval:g}s": interval for interval in intervals}
+    
+    for name in scheduler.jobs():
+        if name.startswith('fetch-') and name not in names:
+            scheduler.remove_job(name)
+            logger.info(f"Removed job {name}")
+    for name, interval in names.items():
+        if name not in scheduler.jobs():
+            scheduler.add_job(name, interval, lambda interval=interval: job(interval), policy=OVERRUN_SKIP)
+            logger.info(f"Scheduled job {name}")
+
+def retention_job():
+    """删除超出保留期的原始行情分区"""
+    dropped = apply_retention()
+    if dropped:
+        logger.info(f"Dropped expired market data partitions: {', '.join(dropped)}")
+
+def calibration_job():
+    """按历史波动重新校准预警阈值"""
+    results = calibrate()
+    for result in results:
+        if result['new_threshold'] is not None and result['new_threshold'] != result['old_threshold']:
+            logger.info(f"{result['symbol_code']}: alert threshold {result['old_threshold']} -> "
+                        f"{result['new_threshold']} (~{result['new_rate_per_day']:.1f} alerts/day)")
+
+def start_background_backfill() -> threading.Thread:
+    """
+    在后台线程中重建汇总表（旧库首次启动时）并补充历史数据，不阻塞实时接入
+    各标的的尾部缺口起点在启动线程前记录，之后实时写入的数据不影响缺口判断；
+    有尾部缺口的标的在补完之前暂停波动检测，避免把整段停机期间的涨跌当成一次波动预警
+    """
+    backfill = BackfillService()
+    last_times = backfill.snapshot_last_times()
+    pending = [
+        symbol.symbol_id for symbol in MarketDataRepository().get_active_symbols()
+        if backfill.needs_tail_backfill(symbol, last_times.get(symbol.symbol_id))
+    ]
+    suspend_detection(pending)
+    if pending:
+        logger.info(f"Detection suspended for {len(pending)} symbols until their backfill completes")
+    
+    def run():
+        try:
+            RollupRepository.ensure_built()
+            backfill_results = backfill.backfill_all(
+                last_times, on_symbol_done=lambda symbol: resume_detection([symbol.symbol_id])
+            )
+            if backfill_results:
+                logger.info(f"Backfill completed: {backfill_results}")
+        except Exception as e:
+            logger.error(f"Background backfill failed: {e}")
+            logger.error(traceback.format_exc())
+        finally:
+            resume_detection(pending)
+    
+    thread = threading.Thread(target=run, name='backfill-main', daemon=True)
+    thread.start()
+    logger.info("Backfill started in background")
+    return thread
+
+def start_recording(path: str) -> Recorder:
+    """录制所有数据源的原始响应，供 replay.py 回放"""
+    recorder = Recorder(path)
+    BaseAPIClient.recorder = recorder
+    logger.info(f"Recording provider responses to {path}")
+    return recorder
+
+def start_metrics_export(scheduler: Scheduler):
+    """按环境变量导出指标：HTTP /metrics 和/或定期写文件"""
+    if METRICS_PORT:
+        registry.serve(int(METRICS_PORT), METRICS_HOST)
+        logger.info(f"Metrics endpoint listening on {METRICS_HOST}:{METRICS_PORT}/metrics")
+    if METRICS_FILE:
+        scheduler.add_job('metrics-file', METRICS_FILE_INTERVAL,
+                          lambda: registry.write_file(METRICS_FILE), run_immediately=True,
+                          pool=POOL_MAINTENANCE)
+        logger.info(f"Writing metrics to {METRICS_FILE} every {METRICS_FILE_INTERVAL}s")
+
 def main():
-    """主函数"""
+    """
+    主函数
+    --stream: binance 标的改用 WebSocket 实时接入
+    --record PATH: 把数据源原始响应录制到 PATH（gzip 压缩的 JSON Lines）
+    --sync-backfill: 先完成 backfill 再开始实时接入（默认在后台补充）
+    """
     logger.info("Market Monitor - Starting up...")
     
     try:
@@ -66,28 +207,52 @@ def main():
         init_db()
         init_default_data()
         logger.info("Database initialized")
+        # 价格缓存在后台预热，预热完成前波动检测直接查数据库
+        price_cache.warm_in_background()
+        
+        if '--record' in sys.argv:
+            start_recording(sys.argv[sys.argv.index('--record') + 1])
         
         # 启动时补充历史数据
-        logger.info("Starting backfill service...")
-        backfill = BackfillService()
-        backfill_results = backfill.backfill_all()
-        if backfill_results:
-            logger.info(f"Backfill completed: {backfill_results}")
+        if '--sync-backfill' in sys.argv:
+            RollupRepository.ensure_built()
+            logger.info("Starting backfill service...")
+            backfill_results = BackfillService().backfill_all()
+            if backfill_results:
+                logger.info(f"Backfill completed: {backfill_results}")
+        else:
+            start_background_backfill()
+        
+        if '--stream' in sys.argv:
+            start_streaming()
         
         # 立即执行一次
         job()
         
-        # 设置定时任务（每5分钟）
-        schedule.every(5).minutes.do(job)
-        
-        logger.info("Scheduler started. Fetching data every 5 minutes...")
+        # 每个更新间隔一个任务，触发时间对齐到墙钟整点（如 :00/:05/...）
+        scheduler = Scheduler()
+        sync_jobs(scheduler)
+        # 维护任务在独立线程池中执行，不占用行情任务的线程
+        scheduler.add_job('sync-jobs', SYMBOL_REFRESH_INTERVAL, lambda: sync_jobs(scheduler),
+                          pool=POOL_MAINTENANCE)
+        scheduler.add_job('retention', RETENTION_INTERVAL, retention_job, run_immediately=True,
+                          pool=POOL_MAINTENANCE)
+        if CALIBRATION_INTERVAL_HOURS > 0:
+            scheduler.add_job('calibration', CALIBRATION_INTERVAL_HOURS * 3600, calibration_job,
+                              pool=POOL_MAINTENANCE)
+        start_metrics_export(scheduler)
         
-        while True:
-            schedule.run_pending()
-            time.sleep(1)
+        logger.info("Scheduler started. Fetching data at each symbol's update interval...")
+        scheduler.run_forever()
             
     except KeyboardInterrupt:
         logger.info("Shutting down by user (KeyboardInterrupt)...")
+        if alert_queue is not None:
+            alert_queue.close()
+            logger.info(f"Alert delivery stats: {alert_queue.stats()}")
+        if BaseAPIClient.recorder is not None:
+            BaseAPIClient.recorder.close()
+            logger.info(f"Recorded {BaseAPIClient.recorder.count} provider responses")
         sys.exit(0)
     except Exception as e:
         logger.critical(f"Fatal error: {e}")
@@ -1,8 +1,10 @@
 import sqlite3
+import threading
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any, List
-from dataclasses import dataclass
-from config.database import get_connection
+from typing import Optional, Dict, Any, List, Tuple
+from dataclasses import dataclass, astuple
+from config.database import get_connection, encode_time, decode_time, run_once
+from config.metrics import DB_WRITE_SECONDS, DB_ROWS_WRITTEN_TOTAL
 
 @dataclass
 class AlertState:
@@ -17,12 +19,29 @@ class AlertState:
     last_trigger_direction_30m: Optional[str] = None  # 'up' or 'down'
     last_trigger_direction_2h: Optional[str] = None
 
+def _row_to_state(row: Tuple) -> AlertState:
+    return AlertState(
+        symbol_id=row[0],
+        n1=row[1],
+        n2=row[2],
+        m1=row[3],
+        m2=row[4],
+        last_trigger_time_30m=decode_time(row[5]),
+        last_trigger_time_2h=decode_time(row[6]),
+        last_trigger_direction_30m=row[7],
+        last_trigger_direction_2h=row[8]
+    )
+
 class AlertRepository:
     """预警状态数据访问"""
     
     @staticmethod
     def init_table():
-        """初始化预警状态表"""
+        """初始化预警状态表（每个进程只执行一次）"""
+        run_once('alert_states', AlertRepository._create_table)
+
+    @staticmethod
+    def _create_table():
         conn = get_connection()
         cursor = conn.cursor()
         cursor.execute('''
@@ -41,7 +60,6 @@ class AlertRepository:
             )
         ''')
         conn.commit()
-        conn.close()
     
     @staticmethod
     def get_or_create(symbol_id: int) -> AlertState:
@@ -57,44 +75,153 @@ class AlertRepository:
         row = cursor.fetchone()
         
         if row:
-            state = AlertState(
-                symbol_id=row[0],
-                n1=row[1],
-                n2=row[2],
-                m1=row[3],
-                m2=row[4],
-                last_trigger_time_30m=row[5],
-                last_trigger_time_2h=row[6],
-                last_trigger_direction_30m=row[7],
-                last_trigger_direction_2h=row[8]
-            )
+            state = _row_to_state(row)
         else:
             state = AlertState(symbol_id=symbol_id)
-            cursor.execute('''
-                INSERT INTO alert_states (symbol_id) VALUES (?)
-            ''', (symbol_id,))
-            conn.commit()
+            with conn:
+                conn.execute('''
+                    INSERT INTO alert_states (symbol_id) VALUES (?)
+                ''', (symbol_id,))
         
-        conn.close()
         return state
     
     @staticmethod
     def save(state: AlertState):
         """保存预警状态"""
         conn = get_connection()
+        with conn:
+            conn.execute('''
+                UPDATE alert_states SET
+                    n1 = ?, n2 = ?, m1 = ?, m2 = ?,
+                    last_trigger_time_30m = ?, last_trigger_time_2h = ?,
+                    last_trigger_direction_30m = ?, last_trigger_direction_2h = ?,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE symbol_id = ?
+            ''', (
+                state.n1, state.n2, state.m1, state.m2,
+                encode_time(state.last_trigger_time_30m), encode_time(state.last_trigger_time_2h),
+                state.last_trigger_direction_30m, state.last_trigger_direction_2h,
+                state.symbol_id
+            ))
+    
+    @staticmethod
+    def load_all() -> Dict[int, AlertState]:
+        """一次加载所有预警状态"""
+        conn = get_connection()
         cursor = conn.cursor()
         cursor.execute('''
-            UPDATE alert_states SET
-                n1 = ?, n2 = ?, m1 = ?, m2 = ?,
-                last_trigger_time_30m = ?, last_trigger_time_2h = ?,
-                last_trigger_direction_30m = ?, last_trigger_direction_2h = ?,
-                updated_at = CURRENT_TIMESTAMP
-            WHERE symbol_id = ?
-        ''', (
-            state.n1, state.n2, state.m1, state.m2,
-            state.last_trigger_time_30m, state.last_trigger_time_2h,
-            state.last_trigger_direction_30m, state.last_trigger_direction_2h,
-            state.symbol_id
-        ))
-        conn.commit()
-        conn.close()
+            SELECT symbol_id, n1, n2, m1, m2, 
+                   last_trigger_time_30m, last_trigger_time_2h,
+                   last_trigger_direction_30m, last_trigger_direction_2h
+            FROM alert_states
+        ''')
+        return {row[0]: _row_to_state(row) for row in cursor.fetchall()}
+    
+    @staticmethod
+    @DB_WRITE_SECONDS.timed(operation='alert_states')
+    def save_many(states: List[AlertState]):
+        """在一个事务内保存（插入或更新）多个预警状态"""
+        if not states:
+            return
+        conn = get_connection()
+        with conn:
+            conn.executemany('''
+                INSERT INTO alert_states (
+                    symbol_id, n1, n2, m1, m2,
+                    last_trigger_time_30m, last_trigger_time_2h,
+                    last_trigger_direction_30m, last_trigger_direction_2h,
+                    updated_at
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(symbol_id) DO UPDATE SET
+                    n1 = excluded.n1, n2 = excluded.n2, m1 = excluded.m1, m2 = excluded.m2,
+                    last_trigger_time_30m = excluded.last_trigger_time_30m,
+                    last_trigger_time_2h = excluded.last_trigger_time_2h,
+                    last_trigger_direction_30m = excluded.last_trigger_direction_30m,
+                    last_trigger_direction_2h = excluded.last_trigger_direction_2h,
+                    updated_at = CURRENT_TIMESTAMP
+            ''', [
+                (
+                    state.symbol_id, state.n1, state.n2, state.m1, state.m2,
+                    encode_time(state.last_trigger_time_30m), encode_time(state.last_trigger_time_2h),
+                    state.last_trigger_direction_30m, state.last_trigger_direction_2h
+                )
+                for state in states
+            ])
+        DB_ROWS_WRITTEN_TOTAL.inc(len(states), operation='alert_states')
+
+
+class AlertStateStore:
+    """
+    预警状态的内存存储（write-behind）
+    首次使用时一次加载全部状态，检测过程只读写内存；
+    flush 时把与上次持久化快照不同的状态在一个事务内写回，
+    快照只在提交成功后更新，因此崩溃时数据库始终是某次完整 flush 的结果
+    """
+    
+    def __init__(self):
+        self._states: Dict[int, AlertState] = {}
+        # symbol_id -> 最近一次持久化时的字段快照，None 表示尚未写入数据库
+        self._persisted: Dict[int, Optional[Tuple]] = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+        # 串行化首次加载：并发检测的线程同时首次访问时只加载一次，
+        # 否则后一次加载会替换前一次加载出的状态对象，已做的修改丢失
+        self._load_lock = threading.Lock()
+    
+    def load(self):
+        """从数据库加载所有状态"""
+        states = AlertRepository.load_all()
+        with self._lock:
+            self._states = states
+            self._persisted = {symbol_id: astuple(state) for symbol_id, state in states.items()}
+            self._loaded = True
+    
+    def get(self, symbol_id: int) -> AlertState:
+        """获取预警状态，不存在时在内存中创建（下次 flush 时写入）"""
+        if not self._loaded:
+            with self._load_lock:
+                if not self._loaded:
+                    self.load()
+        state = self._states.get(symbol_id)
+        if state is None:
+            with self._lock:
+                state = self._states.get(symbol_id)
+                if state is None:
+                    state = self._states[symbol_id] = AlertState(symbol_id=symbol_id)
+                    self._persisted[symbol_id] = None
+        return state
+    
+    def dirty_states(self) -> List[AlertState]:
+        """与持久化快照不同的状态"""
+        with self._lock:
+            return [
+                state for symbol_id, state in self._states.items()
+                if self._persisted.get(symbol_id) != astuple(state)
+            ]
+    
+    def flush(self) -> int:
+        """把变化的状态在一个事务内写回数据库，返回写入条数"""
+        with self._lock:
+            dirty = [
+                (state, astuple(state)) for symbol_id, state in self._states.items()
+                if self._persisted.get(symbol_id) != astuple(state)
+            ]
+        if not dirty:
+            return 0
+        
+        AlertRepository.save_many([state for state, _ in dirty])
+        with self._lock:
+            for state, snapshot in dirty:
+                self._persisted[state.symbol_id] = snapshot
+        return len(dirty)
+    
+    def clear(self):
+        """丢弃内存状态，下次使用时重新加载"""
+        with self._lock:
+            self._states = {}
+            self._persisted = {}
+            self._loaded = False
+
+
+# 进程内共享的预警状态存储
+alert_store = AlertStateStore()
@@ -0,0 +1,74 @@
+from dataclasses import dataclass
+from typing import Optional, Tuple
+from config.database import get_connection, run_once
+
+@dataclass
+class BackfillCheckpoint:
+    """单个标的的 backfill 进度（时间均为 UTC 毫秒时间戳）"""
+    symbol_id: int
+    range_start: int  # 缺口起点（不含）
+    range_end: int    # 缺口终点（含）
+    done_until: int   # 续传起点（含），此前的数据已写入
+
+class BackfillCheckpointRepository:
+    """backfill 进度数据访问"""
+
+    @staticmethod
+    def init_table():
+        """初始化进度表（每个进程只执行一次）"""
+        run_once('backfill_checkpoints', BackfillCheckpointRepository._create_table)
+
+    @staticmethod
+    def _create_table():
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS backfill_checkpoints (
+                symbol_id INTEGER PRIMARY KEY,
+                range_start INTEGER NOT NULL,
+                range_end INTEGER NOT NULL,
+                done_until INTEGER NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (symbol_id) REFERENCES symbols(symbol_id)
+            )
+        ''')
+        conn.commit()
+
+    @staticmethod
+    def get(symbol_id: int) -> Optional[BackfillCheckpoint]:
+        """获取未完成的进度"""
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT symbol_id, range_start, range_end, done_until
+            FROM backfill_checkpoints WHERE symbol_id = ?
+        ''', (symbol_id,))
+        row = cursor.fetchone()
+
+        if row:
+            return BackfillCheckpoint(*row)
+        return None
+
+    @staticmethod
+    def save(checkpoint: BackfillCheckpoint):
+        """保存进度"""
+        sql, params = BackfillCheckpointRepository.save_statement(checkpoint)
+        conn = get_connection()
+        with conn:
+            conn.execute(sql, params)
+
+    @staticmethod
+    def save_statement(checkpoint: BackfillCheckpoint) -> Tuple[str, tuple]:
+        """保存进度的语句，供与行情写入放在同一事务执行"""
+        return ('''
+            INSERT OR REPLACE INTO backfill_checkpoints
+            (symbol_id, range_start, range_end, done_until, updated_at)
+            VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ''', (checkpoint.symbol_id, checkpoint.range_start, checkpoint.range_end, checkpoint.done_until))
+
+    @staticmethod
+    def delete(symbol_id: int):
+        """完成后删除进度"""
+        conn = get_connection()
+        with conn:
+            conn.execute('DELETE FROM backfill_checkpoints WHERE symbol_id = ?', (symbol_id,))
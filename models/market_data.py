@@ -1,130 +1,377 @@
 import sqlite3
+import threading
+import time
 from datetime import datetime
-from typing import List, Optional, Dict, Any
-from config.database import get_connection
+from typing import List, Optional, Dict, Any, Tuple
+from collections import defaultdict
+from config.database import (
+    get_connection, encode_time, decode_time, get_time_format, TIME_FORMAT_EPOCH_MS,
+    list_partitions, partition_for, partition_range, ensure_partitions
+)
+from config import clock
 from models.symbol import Symbol, MarketData
+from models.price_cache import price_cache, _to_timestamp
+from models.symbol_registry import symbol_registry
+from models.rollup import RollupRepository
+from config.metrics import DB_READ_SECONDS, DB_WRITE_SECONDS, DB_ROWS_WRITTEN_TOTAL
+
+def _partitions_until(target_time: Optional[datetime] = None) -> List[str]:
+    """起点不晚于 target_time 的分区，从新到旧；分区按月不重叠，as-of 查询命中的第一个分区即为答案"""
+    partitions = list_partitions()
+    if target_time is None:
+        return partitions
+    ts = target_time.timestamp()
+    return [name for name in partitions if partition_range(name)[0] <= ts]
 
 class MarketDataRepository:
-    """行情数据仓库"""
+    """
+    行情数据仓库
+    原始行情按月分区（见 config.database），写入直接进对应分区；
+    范围查询走 market_data 视图，as-of / 最新价查询从新到旧逐个分区查找
+    """
     
     @staticmethod
     def get_active_symbols() -> List[Symbol]:
-        """获取所有启用的标的"""
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT symbol_id, symbol_code, symbol_name, symbol_type, 
-                   data_source, update_interval, latency_notes, is_active, alert_threshold, backfill_enabled
-            FROM symbols WHERE is_active = 1
-        ''')
-        rows = cursor.fetchall()
-        conn.close()
-        
-        return [
-            Symbol(
-                symbol_id=row[0],
-                symbol_code=row[1],
-                symbol_name=row[2],
-                symbol_type=row[3],
-                data_source=row[4],
-                update_interval=row[5],
-                latency_notes=row[6],
-                is_active=bool(row[7]),
-                alert_threshold=row[8] if row[8] is not None else 1.0,
-                backfill_enabled=bool(row[9]) if row[9] is not None else False
-            )
-            for row in rows
-        ]
+        """获取所有启用的标的（来自进程内的标的缓存，symbols 表变化后自动重新加载）"""
+        return symbol_registry.active()
+    
+    @staticmethod
+    def get_active_symbols_by_source(data_source: str) -> List[Symbol]:
+        """获取某个数据源下启用的标的"""
+        return symbol_registry.active_by_source(data_source)
     
     @staticmethod
     def get_symbol_by_code(symbol_code: str) -> Optional[Symbol]:
         """根据代码获取标的"""
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT symbol_id, symbol_code, symbol_name, symbol_type, 
-                   data_source, update_interval, latency_notes, is_active, alert_threshold, backfill_enabled
-            FROM symbols WHERE symbol_code = ?
-        ''', (symbol_code,))
-        row = cursor.fetchone()
-        conn.close()
-        
-        if row:
-            return Symbol(
-                symbol_id=row[0],
-                symbol_code=row[1],
-                symbol_name=row[2],
-                symbol_type=row[3],
-                data_source=row[4],
-                update_interval=row[5],
-                latency_notes=row[6],
-                is_active=bool(row[7]),
-                alert_threshold=row[8] if row[8] is not None else 1.0,
-                backfill_enabled=bool(row[9]) if row[9] is not None else False
-            )
-        return None
+        return symbol_registry.get_by_code(symbol_code)
+    
+    @staticmethod
+    def get_symbol_by_id(symbol_id: int) -> Optional[Symbol]:
+        """根据 id 获取标的"""
+        return symbol_registry.get(symbol_id)
     
     @staticmethod
     def save_market_data(symbol_id: int, market_time: datetime, 
                          price: float, volume: Optional[float], 
                          source_api: str) -> int:
         """保存行情数据"""
+        partition = partition_for(_to_timestamp(market_time))
         conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO market_data (symbol_id, market_time, local_time, price, volume, source_api)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (symbol_id, market_time, datetime.now(), price, volume, source_api))
-        data_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        return data_id
+        with conn:
+            ensure_partitions([partition], conn)
+            cursor = conn.execute(f'''
+                INSERT INTO {partition} (symbol_id, market_time, local_time, price, volume, source_api)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (symbol_id, encode_time(market_time), encode_time(clock.now()), price, volume, source_api))
+            RollupRepository.apply(conn, [
+                {'symbol_id': symbol_id, 'market_time': market_time, 'price': price,
+                 'volume': volume, 'source_api': source_api}
+            ])
+        price_cache.add(symbol_id, market_time, price)
+        return cursor.lastrowid
+    
+    @staticmethod
+    @DB_WRITE_SECONDS.timed(operation='market_data')
+    def save_many(rows: List[Dict[str, Any]],
+                  extra_statements: Optional[List[Tuple[str, tuple]]] = None) -> int:
+        """
+        批量保存行情数据，单个事务内 executemany
+        rows: 每项包含 symbol_id, market_time, price, volume, source_api
+        extra_statements: 需要与行情在同一事务提交的其他语句 (sql, params)，如 backfill 进度
+        返回写入条数
+        """
+        if not rows and not extra_statements:
+            return 0
+        
+        local_time = encode_time(clock.now())
+        by_partition: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for row in rows:
+            by_partition[partition_for(_to_timestamp(row['market_time']))].append(row)
+        
+        conn = get_connection()
+        with conn:
+            for sql, params in extra_statements or []:
+                conn.execute(sql, params)
+            ensure_partitions(by_partition, conn)
+            for partition, partition_rows in by_partition.items():
+                conn.executemany(f'''
+                    INSERT INTO {partition} (symbol_id, market_time, local_time, price, volume, source_api)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', [
+                    (row['symbol_id'], encode_time(row['market_time']), local_time,
+                     row['price'], row.get('volume'), row['source_api'])
+                    for row in partition_rows
+                ])
+            # 汇总表与原始数据同一事务提交
+            RollupRepository.apply(conn, rows)
+        DB_ROWS_WRITTEN_TOTAL.inc(len(rows), operation='market_data')
+        for row in rows:
+            price_cache.add(row['symbol_id'], row['market_time'], row['price'])
+        return len(rows)
     
     @staticmethod
     def get_latest_price(symbol_id: int) -> Optional[Dict[str, Any]]:
         """获取最新价格"""
+        history = MarketDataRepository.get_price_history(symbol_id, limit=1)
+        return history[0] if history else None
+    
+    @staticmethod
+    @DB_READ_SECONDS.timed(query='get_price_at')
+    def get_price_at(symbol_id: int, target_time: datetime) -> Optional[float]:
+        """获取 target_time 时刻（含）之前最近一条价格"""
+        conn = get_connection()
+        for partition in _partitions_until(target_time):
+            row = conn.execute(f'''
+                SELECT price FROM {partition}
+                WHERE symbol_id = ? AND market_time <= ?
+                ORDER BY market_time DESC
+                LIMIT 1
+            ''', (symbol_id, encode_time(target_time))).fetchone()
+            if row:
+                return row[0]
+        return None
+    
+    @staticmethod
+    @DB_READ_SECONDS.timed(query='get_asof_prices')
+    def get_asof_prices(target_times: List[datetime]) -> Dict[int, Tuple[Optional[float], ...]]:
+        """
+        一次查询所有活跃标的的最新价格及各 target_time 时刻（含）之前最近的价格
+        返回 symbol_id -> (最新价格, target_times[0] 时价格, ...)，没有数据的位置为 None
+        """
+        # 每列按分区从新到旧 COALESCE，找到即短路，不再查更旧的分区
+        def asof_column(partitions: List[str], bounded: bool) -> str:
+            condition = ' AND m.market_time <= ?' if bounded else ''
+            subqueries = [
+                f'''(SELECT price FROM {partition} m
+                    WHERE m.symbol_id = s.symbol_id{condition}
+                    ORDER BY m.market_time DESC LIMIT 1)'''
+                for partition in partitions
+            ] or ['NULL']
+            return subqueries[0] if len(subqueries) == 1 else f"COALESCE({', '.join(subqueries)})"
+        
+        columns = [asof_column(_partitions_until(), False)]
+        params = []
+        for target_time in target_times:
+            partitions = _partitions_until(target_time)
+            columns.append(asof_column(partitions, True))
+            params.extend([encode_time(target_time)] * len(partitions))
+        
         conn = get_connection()
         cursor = conn.cursor()
-        cursor.execute('''
-            SELECT price, market_time, local_time, source_api
-            FROM market_data
-            WHERE symbol_id = ?
-            ORDER BY market_time DESC
-            LIMIT 1
-        ''', (symbol_id,))
-        row = cursor.fetchone()
-        conn.close()
+        cursor.execute(f'''
+            SELECT s.symbol_id, {', '.join(columns)}
+            FROM symbols s WHERE s.is_active = 1
+        ''', params)
         
-        if row:
-            return {
-                'price': row[0],
-                'market_time': row[1],
-                'local_time': row[2],
-                'source_api': row[3]
-            }
+        return {row[0]: tuple(row[1:]) for row in cursor.fetchall()}
+    
+    @staticmethod
+    def bucket_expression(bucket_seconds: int, column: str = 'market_time') -> str:
+        """时间列换算为 UTC 时间桶编号（epoch 秒 // bucket_seconds）的 SQL 表达式"""
+        if get_time_format() == TIME_FORMAT_EPOCH_MS:
+            return f'({column} / {bucket_seconds * 1000})'
+        # iso 文本为本地时间，'utc' 修饰符换算为 UTC
+        return f"(CAST(strftime('%s', {column}, 'utc') AS INTEGER) / {bucket_seconds})"
+    
+    @staticmethod
+    @DB_READ_SECONDS.timed(query='find_gaps')
+    def find_gaps(symbol_ids: List[int], start_time: datetime, end_time: datetime,
+                  bucket_seconds: int = 300) -> Dict[int, List[Tuple[int, int]]]:
+        """
+        查找 [start_time, end_time] 内缺失数据的时间桶
+        一次窗口函数扫描：对每个标的的非空时间桶按顺序用 LAG 取前一个桶，
+        相邻桶编号相差大于 1 即为缺口；首尾各补一个哨兵桶以发现区间两端的缺口
+        返回 symbol_id -> [(缺口首个桶编号, 缺口末个桶编号), ...]，桶编号 * bucket_seconds 为 UTC epoch 秒
+        """
+        if not symbol_ids:
+            return {}
+        
+        start_bucket = int(start_time.timestamp()) // bucket_seconds
+        end_bucket = int(end_time.timestamp()) // bucket_seconds
+        bucket = MarketDataRepository.bucket_expression(bucket_seconds)
+        id_values = ', '.join('(?)' for _ in symbol_ids)
+        
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            WITH ids(symbol_id) AS (VALUES {id_values}),
+            buckets AS (
+                SELECT DISTINCT symbol_id, {bucket} AS b FROM market_data
+                WHERE symbol_id IN (SELECT symbol_id FROM ids)
+                  AND market_time >= ? AND market_time < ?
+                UNION SELECT symbol_id, ? FROM ids
+                UNION SELECT symbol_id, ? FROM ids
+            ),
+            ordered AS (
+                SELECT symbol_id, b, LAG(b) OVER (PARTITION BY symbol_id ORDER BY b) AS prev
+                FROM buckets
+            )
+            SELECT symbol_id, prev + 1, b - 1 FROM ordered
+            WHERE prev IS NOT NULL AND b - prev > 1
+            ORDER BY symbol_id, prev
+        ''', [
+            *symbol_ids,
+            encode_time(datetime.fromtimestamp(start_bucket * bucket_seconds)),
+            encode_time(datetime.fromtimestamp((end_bucket + 1) * bucket_seconds)),
+            start_bucket - 1,
+            end_bucket + 1
+        ])
+        
+        gaps: Dict[int, List[Tuple[int, int]]] = {symbol_id: [] for symbol_id in symbol_ids}
+        for symbol_id, gap_start, gap_end in cursor.fetchall():
+            gaps[symbol_id].append((gap_start, gap_end))
+        return gaps
+    
+    @staticmethod
+    def get_last_market_time(symbol_id: int) -> Optional[datetime]:
+        """获取标的最近记录时间"""
+        conn = get_connection()
+        for partition in list_partitions(conn):
+            row = conn.execute(f'''
+                SELECT MAX(market_time) FROM {partition} WHERE symbol_id = ?
+            ''', (symbol_id,)).fetchone()
+            if row and row[0] is not None:
+                return decode_time(row[0])
         return None
     
     @staticmethod
+    @DB_READ_SECONDS.timed(query='get_ohlcv')
+    def get_ohlcv(symbol_id: int, start_time: datetime, end_time: datetime,
+                  bucket_seconds: int = 300) -> List[Dict[str, Any]]:
+        """K 线数据，从能拼出该周期的最粗汇总表读取，不扫描原始数据"""
+        return RollupRepository.get_bars(symbol_id, start_time, end_time, bucket_seconds)
+
+    @staticmethod
+    @DB_READ_SECONDS.timed(query='get_range_stats')
+    def get_range_stats(symbol_id: int, start_time: datetime, end_time: datetime) -> Optional[Dict[str, Any]]:
+        """区间开高低收、成交量和点数，整桶部分读汇总表，只有两端零头读原始数据"""
+        return RollupRepository.get_range_stats(symbol_id, start_time, end_time)
+
+    @staticmethod
+    @DB_READ_SECONDS.timed(query='get_price_history')
     def get_price_history(symbol_id: int, limit: int = 100) -> List[Dict[str, Any]]:
-        """获取历史价格"""
+        """获取历史价格（从新到旧），只读到凑满 limit 条为止的分区"""
         conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT price, market_time, local_time, source_api
-            FROM market_data
-            WHERE symbol_id = ?
-            ORDER BY market_time DESC
-            LIMIT ?
-        ''', (symbol_id, limit))
-        rows = cursor.fetchall()
-        conn.close()
+        rows = []
+        for partition in list_partitions(conn):
+            rows.extend(conn.execute(f'''
+                SELECT price, market_time, local_time, source_api
+                FROM {partition}
+                WHERE symbol_id = ?
+                ORDER BY market_time DESC
+                LIMIT ?
+            ''', (symbol_id, limit - len(rows))).fetchall())
+            if len(rows) >= limit:
+                break
         
         return [
             {
                 'price': row[0],
-                'market_time': row[1],
-                'local_time': row[2],
+                'market_time': decode_time(row[1]),
+                'local_time': decode_time(row[2]),
                 'source_api': row[3]
             }
             for row in rows
         ]
+
+    @staticmethod
+    @DB_READ_SECONDS.timed(query='get_price_series')
+    def get_price_series(symbol_id: int, start_time: Optional[datetime] = None,
+                         end_time: Optional[datetime] = None) -> Tuple[List[float], List[float]]:
+        """
+        时间范围 [start_time, end_time) 内的价格序列，按时间升序，返回 (时间戳秒列表, 价格列表)
+        逐个分区从旧到新读取，供回测等整段历史的批量计算使用
+        """
+        conn = get_connection()
+        start_ts = start_time.timestamp() if start_time else None
+        end_ts = end_time.timestamp() if end_time else None
+        conditions = ['symbol_id = ?']
+        params: List[Any] = [symbol_id]
+        if start_time is not None:
+            conditions.append('market_time >= ?')
+            params.append(encode_time(start_time))
+        if end_time is not None:
+            conditions.append('market_time < ?')
+            params.append(encode_time(end_time))
+
+        rows = []
+        for partition in reversed(list_partitions(conn)):
+            # 分区按 UTC 自然月划分，两端各留一天余量
+            first, last = partition_range(partition)
+            if (start_ts is not None and last + 86400 <= start_ts) or \
+                    (end_ts is not None and first - 86400 >= end_ts):
+                continue
+            rows.extend(
+                (_to_timestamp(market_time), price)
+                for market_time, price in conn.execute(f'''
+                    SELECT market_time, price FROM {partition}
+                    WHERE {' AND '.join(conditions)}
+                    ORDER BY market_time
+                ''', params)
+            )
+        rows.sort()
+        return [row[0] for row in rows], [row[1] for row in rows]
+
+
+class MarketDataWriter:
+    """
+    行情写入缓冲
+    累积到 max_rows 条或距上次写入超过 flush_interval 秒时，
+    通过 save_many 在一个事务内批量写入；调用方在一轮结束时应调用 flush
+    auto_flush 为 False 时 add 只写入缓冲，由调用方显式调用 flush
+    """
+    
+    def __init__(self, max_rows: int = 500, flush_interval: float = 5.0,
+                 auto_flush: bool = True):
+        self.max_rows = max_rows
+        self.flush_interval = flush_interval
+        self.auto_flush = auto_flush
+        self._rows: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+    
+    def add(self, symbol_id: int, market_time: datetime, price: float,
+            volume: Optional[float], source_api: str):
+        """加入一条行情，开启 auto_flush 时达到条数或时间阈值即写入"""
+        with self._lock:
+            self._rows.append({
+                'symbol_id': symbol_id,
+                'market_time': market_time,
+                'price': price,
+                'volume': volume,
+                'source_api': source_api
+            })
+            due = self.auto_flush and (
+                len(self._rows) >= self.max_rows
+                or time.monotonic() - self._last_flush >= self.flush_interval)
+        if due:
+            self.flush()
+    
+    def maybe_flush(self) -> int:
+        """距上次写入超过 flush_interval 时写入（供长时间运行的调用方定期调用）"""
+        if self._rows and time.monotonic() - self._last_flush >= self.flush_interval:
+            return self.flush()
+        return 0
+    
+    def flush(self) -> int:
+        """写入所有缓冲数据，返回写入条数；写入失败时数据保留在缓冲中"""
+        with self._lock:
+            rows = self._rows
+            self._rows = []
+            self._last_flush = time.monotonic()
+        try:
+            return MarketDataRepository.save_many(rows)
+        except Exception:
+            with self._lock:
+                self._rows = rows + self._rows
+            raise
+    
+    def discard(self) -> List[Dict[str, Any]]:
+        """丢弃并返回缓冲中的数据（写入失败且不再重试时调用）"""
+        with self._lock:
+            rows = self._rows
+            self._rows = []
+        return rows
+    
+    def __len__(self) -> int:
+        return len(self._rows)
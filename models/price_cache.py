@@ -0,0 +1,254 @@
+import threading
+from bisect import bisect_right
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple, Union
+from config.database import get_connection, encode_time, list_partitions, partition_range
+from config import clock
+from config.logger import setup_logger
+from config.metrics import DB_READ_SECONDS
+
+logger = setup_logger('price_cache')
+
+# 缓存保留时长：最长检测窗口（2小时）再加一些余量
+DEFAULT_RETENTION_MINUTES = 150
+
+# 预热时先在这么多个分区（cutoff 所在月份及上一个月）中查找 cutoff 之前最近一条，
+# 仍缺失的标的再逐个分区往前查
+AS_OF_PARTITIONS = 2
+
+
+def _to_timestamp(value: Union[datetime, str, int]) -> float:
+    """market_time（datetime / iso 文本 / UTC 毫秒整数）统一转换为秒级时间戳"""
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, str):
+        return datetime.fromisoformat(value).timestamp()
+    return value / 1000.0
+
+
+class PriceRingBuffer:
+    """
+    单个标的按时间排序的价格序列
+    只保留 cutoff 之后的数据，以及 cutoff 之前最近的一条（保证 cutoff 时刻的 as-of 查询可答）；
+    过期数据通过移动起始下标丢弃，定期压缩底层列表
+    """
+
+    __slots__ = ('times', 'prices', 'start', 'cutoff')
+
+    def __init__(self):
+        self.times: List[float] = []
+        self.prices: List[float] = []
+        self.start = 0
+        self.cutoff = float('-inf')
+
+    def __len__(self) -> int:
+        return len(self.times) - self.start
+
+    def add(self, ts: float, price: float):
+        """追加一个点，乱序写入（如 backfill）时按时间插入"""
+        if not self.times or ts >= self.times[-1]:
+            self.times.append(ts)
+            self.prices.append(price)
+        else:
+            i = bisect_right(self.times, ts, self.start)
+            self.times.insert(i, ts)
+            self.prices.insert(i, price)
+
+    def price_at(self, ts: float) -> Optional[float]:
+        """ts 时刻（含）之前最近一条价格"""
+        i = bisect_right(self.times, ts, self.start) - 1
+        if i < self.start:
+            return None
+        return self.prices[i]
+
+    def prune(self, cutoff: float):
+        """丢弃 cutoff 之前除最近一条以外的数据"""
+        self.cutoff = max(self.cutoff, cutoff)
+        i = bisect_right(self.times, self.cutoff, self.start) - 1
+        if i > self.start:
+            self.start = i
+        if self.start > 64 and self.start * 2 > len(self.times):
+            del self.times[:self.start]
+            del self.prices[:self.start]
+            self.start = 0
+
+
+class PriceCache:
+    """
+    进程内的最近价格缓存，供波动检测做 N 分钟前价格查询
+    启动后在后台一次批量查询预热（预热完成前查询回退到数据库），之后由 MarketDataRepository 写入时同步更新，
+    稳态下检测不再读数据库
+    """
+
+    def __init__(self, retention_minutes: int = DEFAULT_RETENTION_MINUTES):
+        self.retention = timedelta(minutes=retention_minutes).total_seconds()
+        self._buffers: Dict[int, PriceRingBuffer] = {}
+        self._lock = threading.Lock()
+        self.is_warm = False
+        # 预热互斥，保证同一时刻只有一个预热在执行
+        self._warm_lock = threading.Lock()
+        self._warming = False
+        # 预热查询期间写入的价格，预热结束时并入
+        self._pending: Optional[List[Tuple[int, float, float]]] = None
+
+    def warm(self):
+        """从 market_data 重新加载所有标的在保留时长内的数据（同一时刻只有一个预热在执行）"""
+        with self._warm_lock:
+            self._load()
+
+    @DB_READ_SECONDS.timed(query='price_cache_warm')
+    def _load(self):
+        """
+        查询不持有 _lock，期间 add 写入的价格暂存，结束时并入（不会因为查询早于写入提交而丢失）
+        调用方需持有 _warm_lock；失败时缓存保持未预热，暂存的价格丢弃
+        """
+        cutoff = clock.now() - timedelta(seconds=self.retention)
+        with self._lock:
+            self._warming = True
+            self._pending = []
+        try:
+            buffers: Dict[int, PriceRingBuffer] = {}
+            for symbol_id, market_time, price in self._query_warm_rows(cutoff):
+                buffer = buffers.get(symbol_id)
+                if buffer is None:
+                    buffer = buffers[symbol_id] = PriceRingBuffer()
+                buffer.add(_to_timestamp(market_time), price)
+
+            with self._lock:
+                for symbol_id, ts, price in self._pending:
+                    buffer = buffers.get(symbol_id)
+                    if buffer is None:
+                        buffer = buffers[symbol_id] = PriceRingBuffer()
+                    buffer.add(ts, price)
+                cutoff_ts = cutoff.timestamp()
+                for buffer in buffers.values():
+                    buffer.prune(cutoff_ts)
+                self._buffers = buffers
+                self.is_warm = True
+        finally:
+            with self._lock:
+                self._pending = None
+                self._warming = False
+
+    @staticmethod
+    def _query_warm_rows(cutoff: datetime) -> List[Tuple[int, Any, float]]:
+        """
+        cutoff 之后的全部行情，加上每个标的 cutoff 之前最近一条
+        逐个分区查询而不扫描整个 market_data 视图：保留窗口只落在最近的分区中，
+        as-of 先查 cutoff 所在月份及上一个月的分区，只对仍缺失的标的再往前查
+        """
+        conn = get_connection()
+        cutoff_ts = cutoff.timestamp()
+        bound = encode_time(cutoff)
+        rows: List[Tuple[int, Any, float]] = []
+        candidates = []
+        for partition in list_partitions(conn):
+            # 分区按 UTC 自然月划分，两端各留一天余量
+            first, last = partition_range(partition)
+            if last + 86400 > cutoff_ts:
+                rows.extend(conn.execute(
+                    f'SELECT symbol_id, market_time, price FROM {partition} WHERE market_time >= ?',
+                    (bound,)
+                ))
+            if first - 86400 < cutoff_ts:
+                candidates.append(partition)
+
+        as_of: Dict[int, Tuple[Any, float]] = {}
+        for partition in candidates[:AS_OF_PARTITIONS]:
+            for symbol_id, market_time, price in conn.execute(f'''
+                SELECT symbol_id, MAX(market_time), price FROM {partition}
+                WHERE market_time < ?
+                GROUP BY symbol_id
+            ''', (bound,)):
+                if symbol_id not in as_of or market_time > as_of[symbol_id][0]:
+                    as_of[symbol_id] = (market_time, price)
+
+        older = candidates[AS_OF_PARTITIONS:]
+        if older:
+            missing = {row[0] for row in conn.execute('SELECT symbol_id FROM symbols')} - as_of.keys()
+            for partition in older:
+                if not missing:
+                    break
+                for symbol_id, market_time, price in conn.execute(f'''
+                    SELECT symbol_id, MAX(market_time), price FROM {partition}
+                    WHERE symbol_id IN ({','.join('?' * len(missing))})
+                    GROUP BY symbol_id
+                ''', list(missing)):
+                    as_of[symbol_id] = (market_time, price)
+                    missing.discard(symbol_id)
+
+        rows.extend((symbol_id, market_time, price) for symbol_id, (market_time, price) in as_of.items())
+        return rows
+
+    def ensure_warm(self):
+        """未预热时预热一次（正在预热时等待其完成）"""
+        if self.is_warm:
+            return
+        with self._warm_lock:
+            if not self.is_warm:
+                self._load()
+
+    def warm_in_background(self) -> Optional[threading.Thread]:
+        """
+        在后台线程预热（已预热或正在预热时不重复启动）
+        失败时记录日志，缓存保持未预热（查询回退到数据库），下次调用时重试
+        """
+        with self._lock:
+            if self.is_warm or self._warming:
+                return None
+            self._warming = True
+
+        def run():
+            try:
+                self.ensure_warm()
+            except Exception as e:
+                logger.error(f"Price cache warm-up failed, falling back to database lookups: {e}")
+            finally:
+                with self._lock:
+                    if self._pending is None:
+                        self._warming = False
+
+        thread = threading.Thread(target=run, name='price-cache-warm', daemon=True)
+        thread.start()
+        return thread
+
+    def add(self, symbol_id: int, market_time: Union[datetime, str], price: float):
+        """写入一条新价格（未预热时忽略，预热会从数据库加载；正在预热或重新加载时同时暂存）"""
+        ts = _to_timestamp(market_time)
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((symbol_id, ts, price))
+            if not self.is_warm:
+                return
+            buffer = self._buffers.get(symbol_id)
+            if buffer is None:
+                buffer = self._buffers[symbol_id] = PriceRingBuffer()
+            buffer.add(ts, price)
+            buffer.prune(clock.timestamp() - self.retention)
+
+    def lookup(self, symbol_id: int, target_time: datetime) -> Tuple[bool, Optional[float]]:
+        """
+        查询 target_time 时刻（含）之前最近一条价格
+        返回 (是否命中缓存, 价格)；未命中时调用方应回退到数据库查询
+        """
+        if not self.is_warm:
+            return False, None
+        ts = target_time.timestamp()
+        with self._lock:
+            buffer = self._buffers.get(symbol_id)
+            if buffer is None:
+                # 预热覆盖所有有数据的标的，没有 buffer 说明该标的没有任何数据
+                return True, None
+            if ts < buffer.cutoff:
+                return False, None
+            return True, buffer.price_at(ts)
+
+    def clear(self):
+        """清空缓存，下次使用时重新预热"""
+        with self._lock:
+            self._buffers = {}
+            self.is_warm = False
+
+
+# 进程内共享的价格缓存
+price_cache = PriceCache()
@@ -0,0 +1,295 @@
+import math
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from config.database import (
+    get_connection, encode_time, get_meta, set_meta, get_time_format,
+    TIME_FORMAT_EPOCH_MS, ROLLUP_LEVELS, INTERVAL_VOLUME_SOURCES
+)
+from models.price_cache import _to_timestamp
+
+# 由细到粗的级别
+_LEVELS_FINE_TO_COARSE = sorted(ROLLUP_LEVELS.items(), key=lambda item: item[1])
+
+# (symbol_id, bucket) -> [open, high, low, close, volume, count, open_ts, close_ts]
+_Bar = List[Any]
+
+_INTERVAL_VOLUME_SQL = ', '.join(f"'{source}'" for source in INTERVAL_VOLUME_SOURCES)
+
+
+def _interval_volume(source_api: Optional[str], volume: Optional[float]) -> Optional[float]:
+    """可累加的区间成交量；滚动 24h 成交量等其他来源返回 None"""
+    return volume if source_api in INTERVAL_VOLUME_SOURCES else None
+
+
+def _merge_bar(bar: Optional[_Bar], ts: float, price: float, volume: Optional[float]) -> _Bar:
+    """把一个价格点并入时间桶"""
+    if bar is None:
+        return [price, price, price, price, volume, 1, ts, ts]
+    if ts < bar[6]:
+        bar[0], bar[6] = price, ts
+    if ts >= bar[7]:
+        bar[3], bar[7] = price, ts
+    bar[1] = max(bar[1], price)
+    bar[2] = min(bar[2], price)
+    if volume is not None:
+        bar[4] = volume if bar[4] is None else bar[4] + volume
+    bar[5] += 1
+    return bar
+
+
+class RollupRepository:
+    """
+    OHLCV 汇总表（5m / 1h / 1d）数据访问
+    写入原始行情时在同一事务内增量更新各级汇总，也可从原始数据重建；
+    区间查询优先使用能覆盖区间的最粗级别，只有区间两端不足一个桶的部分才读细级别或原始数据。
+    volume 为桶内 K 线成交量之和（只累加 INTERVAL_VOLUME_SOURCES 的数据），
+    实时行情的 volume 是滚动 24h 成交量，不计入；桶内没有 K 线数据时为 NULL
+    """
+
+    @staticmethod
+    def table(level: str) -> str:
+        return f'market_data_{level}'
+
+    @staticmethod
+    def apply(conn, rows: Iterable[Dict[str, Any]]):
+        """
+        把新写入的原始行情合并进各级汇总（在调用方的事务内执行）
+        rows: 每项包含 symbol_id, market_time, price, volume, source_api
+        """
+        bars: Dict[str, Dict[Tuple[int, int], _Bar]] = {level: {} for level in ROLLUP_LEVELS}
+        for row in rows:
+            ts = _to_timestamp(row['market_time'])
+            volume = _interval_volume(row.get('source_api'), row.get('volume'))
+            for level, seconds in ROLLUP_LEVELS.items():
+                key = (row['symbol_id'], int(ts // seconds) * seconds)
+                level_bars = bars[level]
+                level_bars[key] = _merge_bar(level_bars.get(key), ts, row['price'], volume)
+
+        for level, level_bars in bars.items():
+            if not level_bars:
+                continue
+            # UPDATE SET 右侧引用的都是更新前的值
+            conn.executemany(f'''
+                INSERT INTO {RollupRepository.table(level)}
+                (symbol_id, bucket, open, high, low, close, volume, count, open_ts, close_ts)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(symbol_id, bucket) DO UPDATE SET
+                    open = CASE WHEN excluded.open_ts < open_ts THEN excluded.open ELSE open END,
+                    open_ts = MIN(open_ts, excluded.open_ts),
+                    high = MAX(high, excluded.high),
+                    low = MIN(low, excluded.low),
+                    close = CASE WHEN excluded.close_ts >= close_ts THEN excluded.close ELSE close END,
+                    close_ts = MAX(close_ts, excluded.close_ts),
+                    volume = CASE WHEN excluded.volume IS NULL THEN volume
+                                  ELSE COALESCE(volume, 0) + excluded.volume END,
+                    count = count + excluded.count
+            ''', [(symbol_id, bucket, *bar) for (symbol_id, bucket), bar in level_bars.items()])
+
+    @staticmethod
+    def rebuild(symbol_ids: Optional[List[int]] = None,
+                start_time: Optional[datetime] = None, end_time: Optional[datetime] = None) -> Dict[str, int]:
+        """
+        从原始数据重建汇总：最细一级从 market_data 聚合，更粗的级别从上一级聚合
+        可限定标的和时间范围（范围按最粗级别的桶向外对齐，不早于原始数据保留起点），返回各级写入的桶数
+        """
+        coarsest = _LEVELS_FINE_TO_COARSE[-1][1]
+        start = None if start_time is None else int(start_time.timestamp()) // coarsest * coarsest
+        end = None if end_time is None else -(-int(math.ceil(end_time.timestamp())) // coarsest) * coarsest
+        # 已过保留期删除的原始数据无法重建，保留那部分汇总
+        retained_from = get_meta('raw_retained_from')
+        if retained_from is not None:
+            floor = -(-int(float(retained_from)) // coarsest) * coarsest
+            start = floor if start is None else max(start, floor)
+
+        if get_time_format() == TIME_FORMAT_EPOCH_MS:
+            raw_ts = 'market_time / 1000.0'
+        else:
+            # 取整到毫秒，消除 julianday 的浮点误差
+            raw_ts = "ROUND((julianday(market_time, 'utc') - 2440587.5) * 86400000.0) / 1000.0"
+        raw_source = f'''
+            SELECT symbol_id, {raw_ts} AS open_ts, {raw_ts} AS close_ts,
+                   price AS open, price AS high, price AS low, price AS close,
+                   CASE WHEN source_api IN ({_INTERVAL_VOLUME_SQL}) THEN volume END AS volume, 1 AS count
+            FROM market_data WHERE 1 = 1'''
+        raw_params: List[Any] = []
+        if start is not None:
+            raw_source += ' AND market_time >= ?'
+            raw_params.append(encode_time(datetime.fromtimestamp(start)))
+        if end is not None:
+            raw_source += ' AND market_time < ?'
+            raw_params.append(encode_time(datetime.fromtimestamp(end)))
+
+        symbol_filter = ''
+        if symbol_ids is not None:
+            symbol_filter = f" AND symbol_id IN ({', '.join('?' for _ in symbol_ids)})"
+            raw_source += symbol_filter
+            raw_params.extend(symbol_ids)
+
+        counts = {}
+        conn = get_connection()
+        with conn:
+            source, source_params = raw_source, raw_params
+            for level, seconds in _LEVELS_FINE_TO_COARSE:
+                table = RollupRepository.table(level)
+                where, params = 'WHERE 1 = 1', []
+                if start is not None:
+                    where += ' AND bucket >= ?'
+                    params.append(start)
+                if end is not None:
+                    where += ' AND bucket < ?'
+                    params.append(end)
+                where += symbol_filter
+                params.extend(symbol_ids or [])
+
+                conn.execute(f'DELETE FROM {table} {where}', params)
+                cursor = conn.execute(f'''
+                    INSERT INTO {table}
+                    (symbol_id, bucket, open, high, low, close, volume, count, open_ts, close_ts)
+                    SELECT symbol_id, bucket, MIN(first_open), MAX(high), MIN(low), MIN(last_close),
+                           SUM(volume), SUM(count), MIN(open_ts), MAX(close_ts)
+                    FROM (
+                        SELECT symbol_id, bucket, high, low, volume, count, open_ts, close_ts,
+                               FIRST_VALUE(open) OVER (PARTITION BY symbol_id, bucket ORDER BY open_ts) AS first_open,
+                               FIRST_VALUE(close) OVER (PARTITION BY symbol_id, bucket ORDER BY close_ts DESC) AS last_close
+                        FROM (
+                            SELECT *, CAST(open_ts / {seconds} AS INTEGER) * {seconds} AS bucket
+                            FROM ({source})
+                        )
+                    )
+                    GROUP BY symbol_id, bucket
+                ''', source_params)
+                counts[level] = cursor.rowcount
+
+                # 下一级从本级聚合
+                source = f'''
+                    SELECT symbol_id, open_ts, close_ts, open, high, low, close, volume, count
+                    FROM {table} {where}'''
+                source_params = params
+        return counts
+
+    @staticmethod
+    def ensure_built():
+        """旧库首次使用汇总表时从原始数据重建一次"""
+        if get_meta('rollups_built') == '1':
+            return
+        RollupRepository.rebuild()
+        set_meta('rollups_built', '1')
+
+    @staticmethod
+    def choose_level(bucket_seconds: int) -> Optional[str]:
+        """能拼出 bucket_seconds 大小时间桶的最粗级别，没有时返回 None（需读原始数据）"""
+        for level, seconds in reversed(_LEVELS_FINE_TO_COARSE):
+            if seconds <= bucket_seconds and bucket_seconds % seconds == 0:
+                return level
+        return None
+
+    @staticmethod
+    def get_bars(symbol_id: int, start_time: datetime, end_time: datetime,
+                 bucket_seconds: int = 300) -> List[Dict[str, Any]]:
+        """
+        [start_time, end_time) 内按 bucket_seconds 聚合的 OHLCV（如 4 小时线由 1h 汇总拼出）
+        bucket_seconds 需为某一级别桶长的整数倍
+        """
+        level = RollupRepository.choose_level(bucket_seconds)
+        if level is None:
+            raise ValueError(f"No rollup level divides {bucket_seconds}s buckets")
+
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT bucket, MIN(first_open), MAX(high), MIN(low), MIN(last_close),
+                   SUM(volume), SUM(count)
+            FROM (
+                SELECT bucket / {bucket_seconds} * {bucket_seconds} AS bucket, high, low, volume, count,
+                       FIRST_VALUE(open) OVER w_open AS first_open,
+                       FIRST_VALUE(close) OVER w_close AS last_close
+                FROM {RollupRepository.table(level)}
+                WHERE symbol_id = ? AND bucket >= ? AND bucket < ?
+                WINDOW w_open AS (PARTITION BY bucket / {bucket_seconds} ORDER BY open_ts),
+                       w_close AS (PARTITION BY bucket / {bucket_seconds} ORDER BY close_ts DESC)
+            )
+            GROUP BY bucket
+            ORDER BY bucket
+        ''', (symbol_id, int(start_time.timestamp()), int(math.ceil(end_time.timestamp()))))
+
+        return [
+            {
+                'bucket_time': datetime.fromtimestamp(row[0]),
+                'open': row[1],
+                'high': row[2],
+                'low': row[3],
+                'close': row[4],
+                'volume': row[5],
+                'count': row[6]
+            }
+            for row in cursor.fetchall()
+        ]
+
+    @staticmethod
+    def _plan(start: float, end: float, levels: List[Tuple[str, int]]) -> List[Tuple[Optional[str], float, float]]:
+        """把 [start, end) 拆成尽量粗的若干段：(级别或 None 表示原始数据, 起点, 终点)"""
+        if start >= end:
+            return []
+        for i, (level, seconds) in enumerate(levels):
+            inner_start = math.ceil(start / seconds) * seconds
+            inner_end = math.floor(end / seconds) * seconds
+            if inner_start < inner_end:
+                finer = levels[i + 1:]
+                return (RollupRepository._plan(start, inner_start, finer)
+                        + [(level, inner_start, inner_end)]
+                        + RollupRepository._plan(inner_end, end, finer))
+        return [(None, start, end)]
+
+    @staticmethod
+    def get_range_stats(symbol_id: int, start_time: datetime, end_time: datetime) -> Optional[Dict[str, Any]]:
+        """
+        [start_time, end_time) 内的开高低收、成交量和点数
+        区间中间整桶部分读最粗的汇总，两端零头逐级读更细的汇总，最后才读原始数据
+        """
+        plan = RollupRepository._plan(start_time.timestamp(), end_time.timestamp(),
+                                      list(reversed(_LEVELS_FINE_TO_COARSE)))
+        conn = get_connection()
+        bars: List[_Bar] = []
+        for level, start, end in plan:
+            if level is None:
+                # 两端不足一个最细桶的零头，点数很少
+                bar = None
+                for price, market_time, volume, source_api in conn.execute('''
+                    SELECT price, market_time, volume, source_api FROM market_data
+                    WHERE symbol_id = ? AND market_time >= ? AND market_time < ?
+                ''', (symbol_id, encode_time(datetime.fromtimestamp(start)),
+                      encode_time(datetime.fromtimestamp(end)))):
+                    bar = _merge_bar(bar, _to_timestamp(market_time), price,
+                                     _interval_volume(source_api, volume))
+                if bar is not None:
+                    bars.append(bar)
+                continue
+
+            row = conn.execute(f'''
+                SELECT (SELECT open FROM {RollupRepository.table(level)}
+                        WHERE symbol_id = ?1 AND bucket >= ?2 AND bucket < ?3 ORDER BY open_ts LIMIT 1),
+                       MAX(high), MIN(low),
+                       (SELECT close FROM {RollupRepository.table(level)}
+                        WHERE symbol_id = ?1 AND bucket >= ?2 AND bucket < ?3 ORDER BY close_ts DESC LIMIT 1),
+                       SUM(volume), SUM(count), MIN(open_ts), MAX(close_ts)
+                FROM {RollupRepository.table(level)}
+                WHERE symbol_id = ?1 AND bucket >= ?2 AND bucket < ?3
+            ''', (symbol_id, int(start), int(end))).fetchone()
+            if row and row[5]:
+                bars.append(list(row))
+
+        if not bars:
+            return None
+        first = min(bars, key=lambda bar: bar[6])
+        last = max(bars, key=lambda bar: bar[7])
+        volumes = [bar[4] for bar in bars if bar[4] is not None]
+        return {
+            'open': first[0],
+            'high': max(bar[1] for bar in bars),
+            'low': min(bar[2] for bar in bars),
+            'close': last[3],
+            'volume': sum(volumes) if volumes else None,
+            'count': sum(bar[5] for bar in bars),
+            'open_time': datetime.fromtimestamp(first[6]),
+            'close_time': datetime.fromtimestamp(last[7])
+        }
@@ -2,6 +2,9 @@ from dataclasses import dataclass
 from datetime import datetime
 from typing import Optional
 
+# 未设置阈值时的默认值（与涨跌幅同单位，0.01 表示 1%）
+DEFAULT_ALERT_THRESHOLD = 0.01
+
 @dataclass
 class Symbol:
     symbol_id: int
@@ -9,10 +12,10 @@ class Symbol:
     symbol_name: str
     symbol_type: str
     data_source: str
-    update_interval: int
+    update_interval: float  # 更新间隔（分钟），可为小数，如 0.5 表示 30 秒
     latency_notes: str
     is_active: bool
-    alert_threshold: float = 1.0
+    alert_threshold: float = DEFAULT_ALERT_THRESHOLD  # 小数，0.02 表示 2%
     backfill_enabled: bool = False
 
 @dataclass
@@ -0,0 +1,105 @@
+import threading
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from config import database
+from config.database import get_connection, get_meta, SYMBOLS_VERSION_KEY
+from config.metrics import DB_READ_SECONDS
+from models.symbol import Symbol, DEFAULT_ALERT_THRESHOLD
+
+
+class _Snapshot:
+    """某个版本的标的表：全部标的按 id / 代码索引，活跃标的按数据源分组"""
+
+    __slots__ = ('path', 'version', 'by_id', 'by_code', 'active', 'active_by_source')
+
+    def __init__(self, path: Path, version: Optional[str], symbols: List[Symbol]):
+        self.path = path
+        self.version = version
+        self.by_id: Dict[int, Symbol] = {s.symbol_id: s for s in symbols}
+        self.by_code: Dict[str, Symbol] = {s.symbol_code: s for s in symbols}
+        self.active: Tuple[Symbol, ...] = tuple(s for s in symbols if s.is_active)
+        groups: Dict[str, List[Symbol]] = defaultdict(list)
+        for symbol in self.active:
+            groups[symbol.data_source].append(symbol)
+        self.active_by_source: Dict[str, Tuple[Symbol, ...]] = {
+            source: tuple(group) for source, group in groups.items()
+        }
+
+
+class SymbolRegistry:
+    """
+    进程内的标的表缓存，按 symbol_id / symbol_code / data_source 索引
+    symbols 表的增删改由触发器递增 db_meta.symbols_version（见 config.database），
+    每次访问只读这一行比较版本，变化时整表重新加载；其他进程或手工 SQL 的修改同样生效，无需重启
+    返回的 Symbol 为共享对象，调用方不应修改
+    """
+
+    def __init__(self):
+        self._snapshot: Optional[_Snapshot] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    @DB_READ_SECONDS.timed(query='load_symbols')
+    def _load() -> List[Symbol]:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT symbol_id, symbol_code, symbol_name, symbol_type,
+                   data_source, update_interval, latency_notes, is_active, alert_threshold, backfill_enabled
+            FROM symbols ORDER BY symbol_id
+        ''')
+        return [
+            Symbol(
+                symbol_id=row[0],
+                symbol_code=row[1],
+                symbol_name=row[2],
+                symbol_type=row[3],
+                data_source=row[4],
+                update_interval=row[5],
+                latency_notes=row[6],
+                is_active=bool(row[7]),
+                alert_threshold=row[8] if row[8] is not None else DEFAULT_ALERT_THRESHOLD,
+                backfill_enabled=bool(row[9]) if row[9] is not None else False
+            )
+            for row in cursor.fetchall()
+        ]
+
+    def snapshot(self) -> _Snapshot:
+        """当前版本的快照，数据库或版本变化时重新加载"""
+        path = database.DB_PATH
+        version = get_meta(SYMBOLS_VERSION_KEY)
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.path == path and snapshot.version == version:
+            return snapshot
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None or snapshot.path != path or snapshot.version != version:
+                # 先读版本再读表：加载期间的修改会让版本再次变化，下次访问重新加载
+                snapshot = self._snapshot = _Snapshot(path, version, self._load())
+            return snapshot
+
+    def active(self) -> List[Symbol]:
+        """所有启用的标的（按 symbol_id 排序）"""
+        return list(self.snapshot().active)
+
+    def active_by_source(self, data_source: str) -> List[Symbol]:
+        """某个数据源下启用的标的"""
+        return list(self.snapshot().active_by_source.get(data_source, ()))
+
+    def get(self, symbol_id: int) -> Optional[Symbol]:
+        """按 id 查找（含未启用的标的）"""
+        return self.snapshot().by_id.get(symbol_id)
+
+    def get_by_code(self, symbol_code: str) -> Optional[Symbol]:
+        """按代码查找（含未启用的标的）"""
+        return self.snapshot().by_code.get(symbol_code)
+
+    def invalidate(self):
+        """丢弃缓存，下次访问重新加载"""
+        with self._lock:
+            self._snapshot = None
+
+
+# 进程内共享的标的表缓存
+symbol_registry = SymbolRegistry()
@@ -7,11 +7,11 @@
 import sys
 import json
 import os
-from datetime import datetime
 from typing import List
 
 sys.path.insert(0, '/Users/yuchao/.openclaw/workspace/market_monitor')
 
+from config import clock
 from volatility_detector import AlertResult
 
 class AlertNotifier:
@@ -33,7 +33,7 @@ class AlertNotifier:
         if not alerts:
             return ""
         
-        header = f"📊 行情预警 {datetime.now().strftime('%m-%d %H:%M')}\n"
+        header = f"📊 行情预警 {clock.now().strftime('%m-%d %H:%M')}\n"
         
         alert_texts = [self.format_alert(alert) for alert in alerts]
         
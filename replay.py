@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+回放录制的数据源响应
+全局时钟换成模拟时钟，按各标的 update_interval 的对齐时刻逐轮执行 fetch_all
+（解析、行情写入、汇总表、波动检测、预警状态过期都走正常代码），不访问网络、不发送预警；
+每轮结束后模拟时钟直接跳到下一个触发点，--speed 控制相对实时的倍速（0 表示不等待，尽快跑完）
+
+用法（在项目根目录）：
+    python3 main.py --record recordings/live.jsonl.gz                # 录制
+    python3 replay.py recordings/live.jsonl.gz --speed 500 --output replay.json
+"""
+
+import sys
+import argparse
+import contextlib
+import heapq
+import io
+import json
+import logging
+import tempfile
+import time
+from dataclasses import asdict
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List
+
+sys.path.insert(0, '/Users/yuchao/.openclaw/workspace/market_monitor')
+
+import config.database as database
+from config import clock
+from scheduler import next_boundary
+
+
+def parse_time(value: str) -> float:
+    return datetime.fromisoformat(value).timestamp()
+
+
+def replay(recording_path: str, speed: float = 0.0, start: float = None, end: float = None,
+           lookahead: float = None) -> Dict[str, Any]:
+    """
+    回放录制文件，返回每轮统计和触发的预警
+    start / end: 回放的时间范围（Unix 时间戳），默认为整个录制文件
+    """
+    from api_clients.recording import Recording, install_replay_clients, DEFAULT_LOOKAHEAD
+    from fetcher import MarketDataFetcher
+    from main import group_by_interval
+    from models.market_data import MarketDataRepository
+    from models.rollup import RollupRepository
+
+    recording = Recording.load(recording_path)
+    if not recording.count:
+        raise ValueError(f"Recording {recording_path} is empty")
+    start = recording.start if start is None else start
+    end = recording.end if end is None else end
+
+    # 第一轮对齐到 start 所在的间隔起点，录制时该轮的请求在起点之后发出
+    groups = group_by_interval(MarketDataRepository().get_active_symbols())
+    heap = [(next_boundary(start - interval, interval), interval) for interval in groups]
+    heapq.heapify(heap)
+    if not heap:
+        raise ValueError("No active symbols to replay")
+
+    simulated = clock.SimulatedClock(heap[0][0])
+    clock.set_clock(simulated)
+    clients = install_replay_clients(recording, lookahead or DEFAULT_LOOKAHEAD)
+    RollupRepository.ensure_built()
+
+    ticks = 0
+    totals = {'success': 0, 'failed': 0}
+    alerts: List[Dict[str, Any]] = []
+    sim_started = heap[0][0]
+    real_started = time.monotonic()
+    try:
+        while heap and heap[0][0] <= end:
+            due, interval = heapq.heappop(heap)
+            if speed > 0:
+                delay = (due - sim_started) / speed - (time.monotonic() - real_started)
+                if delay > 0:
+                    time.sleep(delay)
+            simulated.set(due)
+
+            result = MarketDataFetcher().fetch_all(concurrent=False, symbols=groups[interval])
+            ticks += 1
+            totals['success'] += result.get('success', 0)
+            totals['failed'] += result.get('failed', 0)
+            for alert in result.get('alerts', []):
+                alerts.append({'time': clock.now().isoformat(), **asdict(alert)})
+
+            heapq.heappush(heap, (due + interval, interval))
+    finally:
+        clock.set_clock(None)
+
+    elapsed = time.monotonic() - real_started
+    simulated_seconds = simulated.timestamp() - sim_started
+    return {
+        'recording': {
+            'path': str(recording_path),
+            'responses': recording.count,
+            'start': datetime.fromtimestamp(recording.start).isoformat(),
+            'end': datetime.fromtimestamp(recording.end).isoformat(),
+        },
+        'ticks': ticks,
+        'simulated_seconds': simulated_seconds,
+        'wall_seconds': elapsed,
+        'speedup': simulated_seconds / elapsed if elapsed > 0 else None,
+        'fetch': totals,
+        'provider_requests': {name: dict(client.replay_stats) for name, client in clients.items()},
+        'alerts': alerts,
+    }
+
+
+def main(argv: List[str] = None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description='Replay recorded provider responses')
+    parser.add_argument('recording', help='main.py --record 生成的录制文件')
+    parser.add_argument('--speed', type=float, default=0.0, help='相对实时的倍速，如 100 / 1000；0 表示尽快跑完')
+    parser.add_argument('--start', help='回放起点（ISO 时间），默认录制开始时间')
+    parser.add_argument('--end', help='回放终点（ISO 时间），默认录制结束时间')
+    parser.add_argument('--lookahead', type=float, help='请求时刻与录制时间允许的偏差（秒）')
+    parser.add_argument('--db', help='数据库路径，默认临时目录；传入已有库时会写入回放数据，请使用副本')
+    parser.add_argument('--output', help='结果 JSON 路径，默认输出到标准输出')
+    parser.add_argument('--verbose', action='store_true', help='保留日志和控制台输出')
+    args = parser.parse_args(argv)
+
+    database.DB_PATH = Path(args.db) if args.db else Path(tempfile.mkdtemp(prefix='market_monitor_replay_')) / 'replay.db'
+    database.close_all_connections()
+
+    if not args.verbose:
+        logging.disable(logging.CRITICAL)
+    quiet = contextlib.redirect_stdout(io.StringIO()) if not args.verbose else contextlib.nullcontext()
+
+    with quiet:
+        database.init_db()
+        database.init_default_data()
+        results = replay(
+            args.recording, args.speed,
+            parse_time(args.start) if args.start else None,
+            parse_time(args.end) if args.end else None,
+            args.lookahead
+        )
+
+    output = json.dumps(results, indent=2, ensure_ascii=False, default=str)
+    if args.output:
+        Path(args.output).write_text(output + '\n', encoding='utf-8')
+    else:
+        print(output)
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+定时调度模块
+基于最小堆的定时器：每个任务有自己的间隔，触发时间对齐到墙钟整点（如每 5 分钟的 :00/:05/...），
+任务在线程池中执行，同一任务不会重叠运行，超时未完成时按策略跳过或补跑；
+维护类任务（数据保留、阈值校准等）在独立的线程池中执行，耗时再长也不会占用行情任务的线程
+"""
+
+import sys
+import heapq
+import itertools
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+sys.path.insert(0, '/Users/yuchao/.openclaw/workspace/market_monitor')
+
+from config.logger import setup_logger
+
+logger = setup_logger('scheduler')
+
+# 超时策略
+OVERRUN_SKIP = 'skip'          # 错过的触发点直接跳过，等下一个对齐的触发点
+OVERRUN_CATCH_UP = 'catch_up'  # 错过的触发点在上一次完成后立即补跑（最多 max_catch_up 次）
+
+# 线程池
+POOL_DEFAULT = 'default'          # 行情获取等需要按时触发的任务
+POOL_MAINTENANCE = 'maintenance'  # 数据保留、阈值校准、指标文件等维护任务
+
+
+@dataclass
+class ScheduledJob:
+    """调度任务"""
+    name: str
+    interval: float  # 秒
+    func: Callable[[], None]
+    policy: str = OVERRUN_SKIP
+    max_catch_up: int = 1
+    pool: str = POOL_DEFAULT
+    next_run: float = 0.0
+    running: bool = False
+    pending_catch_up: int = 0
+    cancelled: bool = False
+    stats: Dict[str, int] = field(default_factory=lambda: {'runs': 0, 'overruns': 0, 'skipped': 0, 'failed': 0})
+
+
+def next_boundary(now: float, interval: float) -> float:
+    """now 之后第一个按 interval 对齐的墙钟时刻"""
+    return (int(now // interval) + 1) * interval
+
+
+class Scheduler:
+    """最小堆定时调度器"""
+
+    def __init__(self, max_workers: int = 4, maintenance_workers: int = 2,
+                 time_func: Callable[[], float] = time.time):
+        """
+        max_workers: 默认线程池（行情任务）的线程数
+        maintenance_workers: 维护任务线程池的线程数
+        """
+        self._time = time_func
+        self._heap: List = []
+        self._jobs: Dict[str, ScheduledJob] = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._executors = {
+            POOL_DEFAULT: ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='scheduler'),
+            POOL_MAINTENANCE: ThreadPoolExecutor(max_workers=maintenance_workers,
+                                                 thread_name_prefix='scheduler-maintenance'),
+        }
+
+    def add_job(self, name: str, interval: float, func: Callable[[], None],
+                policy: str = OVERRUN_SKIP, max_catch_up: int = 1,
+                run_immediately: bool = False, pool: str = POOL_DEFAULT) -> ScheduledJob:
+        """
+        添加任务，同名任务会被替换
+        interval: 间隔秒数，首次触发对齐到下一个 interval 整数倍的墙钟时刻
+        run_immediately: 是否先立即执行一次
+        pool: 执行任务的线程池（POOL_DEFAULT / POOL_MAINTENANCE）
+        """
+        if policy not in (OVERRUN_SKIP, OVERRUN_CATCH_UP):
+            raise ValueError(f"Unknown overrun policy: {policy}")
+        if pool not in self._executors:
+            raise ValueError(f"Unknown pool: {pool}")
+
+        with self._cond:
+            old = self._jobs.get(name)
+            if old is not None:
+                old.cancelled = True
+            now = self._time()
+            job = ScheduledJob(name=name, interval=interval, func=func, policy=policy,
+                               max_catch_up=max_catch_up, pool=pool,
+                               next_run=now if run_immediately else next_boundary(now, interval))
+            self._jobs[name] = job
+            heapq.heappush(self._heap, (job.next_run, next(self._seq), job))
+            self._cond.notify()
+        return job
+
+    def remove_job(self, name: str):
+        """移除任务（已在运行的本次执行不受影响）"""
+        with self._cond:
+            job = self._jobs.pop(name, None)
+            if job is not None:
+                job.cancelled = True
+
+    def jobs(self) -> Dict[str, ScheduledJob]:
+        return dict(self._jobs)
+
+    def _reschedule(self, job: ScheduledJob, due: float, now: float):
+        """计算下一次触发时间"""
+        next_run = due + job.interval
+        if next_run <= now:
+            # 调度本身落后（如系统休眠），错过了若干触发点
+            missed = int((now - next_run) // job.interval) + 1
+            if job.policy == OVERRUN_CATCH_UP:
+                job.pending_catch_up = min(job.pending_catch_up + missed, job.max_catch_up)
+            else:
+                job.stats['skipped'] += missed
+            next_run = next_boundary(now, job.interval)
+        job.next_run = next_run
+        heapq.heappush(self._heap, (next_run, next(self._seq), job))
+
+    def _dispatch(self, job: ScheduledJob, due: float):
+        """到期任务：未在运行则提交执行，否则记为超时"""
+        if job.running:
+            job.stats['overruns'] += 1
+            if job.policy == OVERRUN_CATCH_UP and job.pending_catch_up < job.max_catch_up:
+                job.pending_catch_up += 1
+                logger.warning(f"Job {job.name} overran its {job.interval:g}s interval, will catch up")
+            else:
+                job.stats['skipped'] += 1
+                logger.warning(f"Job {job.name} overran its {job.interval:g}s interval, skipping this run")
+            return
+        job.running = True
+        self._executors[job.pool].submit(self._run, job)
+
+    def _run(self, job: ScheduledJob):
+        """在线程池中执行任务，结束后处理补跑"""
+        while True:
+            started = time.monotonic()
+            try:
+                job.func()
+            except Exception as e:
+                job.stats['failed'] += 1
+                logger.error(f"Job {job.name} failed: {e}")
+                logger.error(traceback.format_exc())
+            job.stats['runs'] += 1
+            elapsed = time.monotonic() - started
+            if elapsed > job.interval:
+                logger.warning(f"Job {job.name} took {elapsed:.1f}s, longer than its {job.interval:g}s interval")
+
+            with self._cond:
+                if job.pending_catch_up > 0 and not job.cancelled and not self._stopped:
+                    job.pending_catch_up -= 1
+                    continue
+                job.running = False
+                return
+
+    def run_pending(self) -> Optional[float]:
+        """执行所有到期任务，返回距下一个任务的秒数（无任务时为 None）"""
+        with self._cond:
+            now = self._time()
+            while self._heap and self._heap[0][0] <= now:
+                due, _, job = heapq.heappop(self._heap)
+                if job.cancelled or due != job.next_run:
+                    continue
+                self._dispatch(job, due)
+                self._reschedule(job, due, now)
+            if not self._heap:
+                return None
+            return max(self._heap[0][0] - now, 0.0)
+
+    def run_forever(self):
+        """阻塞运行直到 stop：睡眠到堆顶任务到期（添加任务时会被唤醒），无需轮询"""
+        with self._cond:
+            while not self._stopped:
+                wait = self.run_pending()
+                self._cond.wait(timeout=wait)
+
+    def stop(self, wait: bool = True):
+        """停止调度，wait 为 True 时等待运行中的任务结束"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        for executor in self._executors.values():
+            executor.shutdown(wait=wait)
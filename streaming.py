@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Binance WebSocket 实时行情接入
+订阅所有 binance 标的的组合 miniTicker 流，价格到达即做波动检测，
+行情按 persist_interval 采样后经批量写入器保存，断线自动重连；
+标的表变化（新增、停用 binance 标的）时重新订阅
+"""
+
+import sys
+import json
+import threading
+import time
+import traceback
+from datetime import datetime
+from typing import FrozenSet, List, Dict, Optional, Callable
+
+sys.path.insert(0, '/Users/yuchao/.openclaw/workspace/market_monitor')
+
+from config.logger import setup_logger
+from models.symbol import Symbol
+from models.market_data import MarketDataRepository, MarketDataWriter
+from volatility_detector import VolatilityDetector, AlertResult
+from notifier import AlertNotifier
+
+try:
+    import websocket  # websocket-client
+except ImportError:  # 未安装时只能使用 REST 轮询
+    websocket = None
+
+logger = setup_logger('streaming')
+
+BINANCE_STREAM_URL = 'wss://stream.binance.com:9443/stream'
+# 同一标的两次波动检测的最小间隔（秒）：价格到达后几秒内发出预警
+DEFAULT_CHECK_INTERVAL = 2.0
+# 同一标的同一规则同方向重复预警的冷却（秒），与轮询间隔一致，见 VolatilityDetector
+DEFAULT_ALERT_COOLDOWN = 300.0
+# 检查标的表是否变化的间隔（秒）
+SYMBOL_REFRESH_INTERVAL = 5.0
+
+
+class BinanceStreamIngestor:
+    """Binance 组合流行情接入"""
+
+    def __init__(self, symbols: Optional[List[Symbol]] = None, url: str = BINANCE_STREAM_URL,
+                 check_interval: float = DEFAULT_CHECK_INTERVAL, persist_interval: float = 60.0,
+                 alert_cooldown: float = DEFAULT_ALERT_COOLDOWN,
+                 on_alerts: Optional[Callable[[List[AlertResult], str], None]] = None):
+        """
+        symbols: 订阅的标的，默认所有活跃的 binance 标的（随标的表变化重新订阅）
+        url: 组合流地址（测试时可指向本地的替身服务）
+        check_interval: 同一标的两次波动检测的最小间隔（秒）
+        persist_interval: 同一标的两次写入行情的最小间隔（秒）
+        alert_cooldown: 同一段波动不重复预警、计数器不连续升级的冷却（秒）
+        on_alerts: 有预警时的回调 (alerts, message)，默认打印到控制台
+        """
+        if websocket is None:
+            raise RuntimeError("websocket-client is required for streaming mode")
+
+        self.repo = MarketDataRepository()
+        self.detector = VolatilityDetector(cooldown_seconds=alert_cooldown)
+        self.notifier = AlertNotifier()
+        self.writer = MarketDataWriter(flush_interval=5.0)
+        self.url = url
+        self.check_interval = check_interval
+        self.persist_interval = persist_interval
+        self.on_alerts = on_alerts
+
+        # 未指定标的时跟随标的表
+        self._follow_registry = symbols is None
+        if symbols is None:
+            symbols = self.repo.get_active_symbols_by_source('binance')
+        self.symbols: Dict[str, Symbol] = {s.symbol_code.upper(): s for s in symbols}
+        self._last_refresh = time.monotonic()
+
+        self._last_persist: Dict[str, float] = {}
+        self._last_check: Dict[str, float] = {}
+        self._pending_alerts: List[AlertResult] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._ws = None
+        self.stats = {'messages': 0, 'reconnects': 0, 'alerts': 0}
+
+    def stream_url(self) -> str:
+        """组合流地址，如 .../stream?streams=btcusdt@miniTicker/ethusdt@miniTicker"""
+        streams = '/'.join(f"{code.lower()}@miniTicker" for code in self.symbols)
+        return f"{self.url}?streams={streams}"
+
+    def subscribed_codes(self) -> FrozenSet[str]:
+        """当前订阅的标的代码（REST 轮询应跳过这些标的）"""
+        return frozenset(s.symbol_code for s in self.symbols.values())
+
+    def refresh_symbols(self) -> bool:
+        """从标的表重新读取活跃的 binance 标的，订阅集合变化时返回 True（需要重连）"""
+        self._last_refresh = time.monotonic()
+        if not self._follow_registry:
+            return False
+        symbols = {s.symbol_code.upper(): s for s in self.repo.get_active_symbols_by_source('binance')}
+        changed = symbols.keys() != self.symbols.keys()
+        self.symbols = symbols
+        if changed:
+            logger.info(f"Binance symbols changed, subscribing to {len(symbols)} symbols")
+        return changed
+
+    def handle_message(self, raw: str):
+        """处理一条组合流消息（miniTicker 或 kline）"""
+        message = json.loads(raw)
+        data = message.get('data', message)
+        event = data.get('e')
+
+        if event == '24hrMiniTicker':
+            price = float(data['c'])
+            volume = float(data['v'])
+        elif event == 'kline':
+            price = float(data['k']['c'])
+            volume = float(data['k']['v'])
+        else:
+            return
+
+        symbol = self.symbols.get(data['s'])
+        if symbol is None:
+            return
+
+        self.stats['messages'] += 1
+        self.on_price(symbol, price, volume, datetime.fromtimestamp(data['E'] / 1000))
+
+    def on_price(self, symbol: Symbol, price: float, volume: Optional[float], market_time: datetime):
+        """新价格到达：按间隔采样写入并检测波动"""
+        now = time.monotonic()
+        code = symbol.symbol_code
+
+        if now - self._last_persist.get(code, float('-inf')) >= self.persist_interval:
+            self._last_persist[code] = now
+            self.writer.add(
+                symbol_id=symbol.symbol_id,
+                market_time=market_time,
+                price=price,
+                volume=volume,
+                source_api='binance_ws'
+            )
+
+        if now - self._last_check.get(code, float('-inf')) >= self.check_interval:
+            self._last_check[code] = now
+            alert = self.detector.check_symbol(symbol, price)
+            if alert:
+                logger.warning(f"  ⚠ Alert triggered for {code} (stream)!")
+                self._pending_alerts.append(alert)
+
+    def flush(self):
+        """写入缓冲行情、预警状态，并发出累积的预警"""
+        try:
+            self.writer.flush()
+            self.detector.flush_states()
+        except Exception as e:
+            logger.error(f"Stream flush failed: {e}")
+            return
+
+        if self._pending_alerts:
+            alerts, self._pending_alerts = self._pending_alerts, []
+            self.stats['alerts'] += len(alerts)
+            message = self.notifier.get_message(alerts)
+            if self.on_alerts:
+                self.on_alerts(alerts, message)
+            else:
+                self.notifier.send(alerts)
+
+    def run(self):
+        """连接并持续接收，断线后指数退避重连，直到 stop"""
+        if not self.symbols and not self._follow_registry:
+            logger.info("No binance symbols to stream")
+            return
+
+        delay = 1.0
+        while not self._stop.is_set():
+            if not self.symbols:
+                # 没有可订阅的标的，等待标的表变化
+                self._stop.wait(SYMBOL_REFRESH_INTERVAL)
+                self.refresh_symbols()
+                continue
+            try:
+                logger.info(f"Connecting to {self.url} ({len(self.symbols)} symbols)...")
+                self._ws = websocket.create_connection(self.stream_url(), timeout=10)
+                self._ws.settimeout(1.0)
+                logger.info("Stream connected")
+                delay = 1.0
+
+                while not self._stop.is_set():
+                    try:
+                        raw = self._ws.recv()
+                    except websocket.WebSocketTimeoutException:
+                        raw = None
+                    if raw:
+                        try:
+                            self.handle_message(raw)
+                        except Exception as e:
+                            logger.error(f"Bad stream message: {e}")
+                            logger.error(traceback.format_exc())
+                    elif raw is not None:
+                        # 空消息表示连接已关闭
+                        raise websocket.WebSocketConnectionClosedException("stream closed")
+
+                    if self.writer.maybe_flush() or self._pending_alerts:
+                        self.flush()
+
+                    if (time.monotonic() - self._last_refresh >= SYMBOL_REFRESH_INTERVAL
+                            and self.refresh_symbols()):
+                        # 订阅集合变化：立即按新的组合流地址重连
+                        break
+            except Exception as e:
+                if self._stop.is_set():
+                    break
+                self.stats['reconnects'] += 1
+                logger.error(f"Stream disconnected: {e}, reconnecting in {delay:.0f}s")
+                self._stop.wait(delay)
+                delay = min(delay * 2, 60.0)
+            finally:
+                if self._ws is not None:
+                    try:
+                        self._ws.close()
+                    except Exception:
+                        pass
+                    self._ws = None
+
+        self.flush()
+        logger.info("Stream stopped")
+
+    def start(self) -> threading.Thread:
+        """在后台线程运行"""
+        self._thread = threading.Thread(target=self.run, name='binance-stream', daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self, timeout: float = 5.0):
+        """停止接收并等待后台线程退出"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+if __name__ == '__main__':
+    ingestor = BinanceStreamIngestor()
+    try:
+        ingestor.run()
+    except KeyboardInterrupt:
+        ingestor.stop()
@@ -0,0 +1,27 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from config import database
+from models.alert_state import alert_store
+from models.price_cache import price_cache
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """使用临时数据库（含默认标的），结束后恢复原路径"""
+    monkeypatch.setattr(database, 'DB_PATH', tmp_path / 'market_monitor.db')
+    database.close_all_connections()
+    database._reset_time_format()
+    price_cache.clear()
+    alert_store.clear()
+    database.init_db()
+    database.init_default_data()
+    yield database
+    database.close_all_connections()
+    database._reset_time_format()
+    price_cache.clear()
+    alert_store.clear()
@@ -0,0 +1,37 @@
+import threading
+import time
+
+from models.alert_state import AlertRepository, AlertStateStore
+
+
+def test_concurrent_first_get_loads_once(db, monkeypatch):
+    AlertRepository.init_table()
+    load_all = AlertRepository.load_all
+    loads = []
+
+    def slow_load_all():
+        loads.append(threading.current_thread().name)
+        time.sleep(0.1)
+        return load_all()
+
+    monkeypatch.setattr(AlertRepository, 'load_all', staticmethod(slow_load_all))
+    store = AlertStateStore()
+    start = threading.Barrier(8)
+
+    def detect():
+        start.wait()
+        state = store.get(1)
+        with store._lock:
+            state.n1 += 1
+
+    threads = [threading.Thread(target=detect) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(loads) == 1
+    # 所有线程修改的是同一个状态对象，flush 后全部写回
+    assert store.get(1).n1 == 8
+    assert store.flush() == 1
+    assert AlertRepository.load_all()[1].n1 == 8
@@ -0,0 +1,67 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from models.market_data import MarketDataRepository
+
+
+def thresholds(db):
+    return dict(db.get_connection().execute('SELECT symbol_code, alert_threshold FROM symbols'))
+
+
+def test_default_thresholds_are_fractions(db):
+    assert thresholds(db) == {
+        'BTCUSDT': 0.02, 'ETHUSDT': 0.02, 'GLD': 0.01, 'SLV': 0.01,
+        'USO': 0.012, 'SPY': 0.008, 'DIA': 0.008, 'QQQ': 0.008,
+    }
+
+
+def test_percent_thresholds_are_converted(db):
+    conn = db.get_connection()
+    conn.execute('''
+        INSERT INTO symbols (symbol_code, symbol_name, symbol_type, data_source, alert_threshold)
+        VALUES ('SOLUSDT', 'Solana', 'crypto', 'binance', 3.0)
+    ''')
+    conn.execute("UPDATE symbols SET alert_threshold = 1.5 WHERE symbol_code = 'GLD'")
+    conn.execute("UPDATE symbols SET alert_threshold = 0.015 WHERE symbol_code = 'SLV'")
+    conn.commit()
+
+    values = thresholds(db)
+    assert values['SOLUSDT'] == pytest.approx(0.03)
+    assert values['GLD'] == pytest.approx(0.015)
+    assert values['SLV'] == 0.015
+
+
+def test_legacy_percent_thresholds_migrated_on_startup(db):
+    conn = db.get_connection()
+    conn.execute("DROP TRIGGER symbols_threshold_percent_update")
+    conn.execute("UPDATE symbols SET alert_threshold = alert_threshold * 100")
+    conn.commit()
+    assert thresholds(db)['BTCUSDT'] == 2.0
+
+    db._init_schema()
+
+    assert thresholds(db)['BTCUSDT'] == pytest.approx(0.02)
+    assert thresholds(db)['SPY'] == pytest.approx(0.008)
+
+
+def test_calibrated_threshold_uses_the_same_unit(db):
+    pytest.importorskip('numpy')
+    from calibration import calibrate
+
+    rng = random.Random(7)
+    symbol_id = MarketDataRepository.get_symbol_by_code('BTCUSDT').symbol_id
+    start = datetime.now().replace(second=0, microsecond=0) - timedelta(days=9)
+    price, rows = 100.0, []
+    for i in range(9 * 288):
+        price *= 1 + rng.gauss(0, 0.003)
+        rows.append({'symbol_id': symbol_id, 'market_time': start + timedelta(minutes=5 * i),
+                     'price': price, 'volume': None, 'source_api': 'binance_backfill'})
+    MarketDataRepository.save_many(rows)
+
+    [result] = calibrate(target_per_day=2, lookback_days=9, symbol_codes=['BTCUSDT'])
+
+    # 0.3% 的 5 分钟波动，每天约 2 次预警的阈值在百分之几的量级，与其他标的的小数阈值可比
+    assert 0.005 < result['new_threshold'] < 0.1
+    assert thresholds(db)['BTCUSDT'] == result['new_threshold']
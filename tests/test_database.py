@@ -0,0 +1,46 @@
+import sqlite3
+import threading
+
+import pytest
+
+
+def connection_in_thread(db):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(db.get_connection()))
+    thread.start()
+    thread.join()
+    return result[0]
+
+
+def test_connection_is_reused_per_thread(db):
+    conn = db.get_connection()
+    assert db.get_connection() is conn
+    assert connection_in_thread(db) is not conn
+
+
+def test_close_all_connections_invalidates_every_thread(db):
+    conn = db.get_connection()
+    db.close_all_connections()
+    fresh = db.get_connection()
+    assert fresh is not conn
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute('SELECT 1')
+
+
+def test_default_profile_pragmas(db):
+    conn = db.get_connection()
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    # synchronous: 1 = NORMAL
+    assert conn.execute('PRAGMA synchronous').fetchone()[0] == 1
+    assert conn.execute('PRAGMA busy_timeout').fetchone()[0] == 5000
+
+
+def test_failed_write_rolls_back_on_shared_connection(db):
+    conn = db.get_connection()
+    with pytest.raises(sqlite3.IntegrityError):
+        with conn:
+            conn.execute("UPDATE symbols SET symbol_name = 'changed' WHERE symbol_code = 'BTCUSDT'")
+            conn.execute("INSERT INTO symbols (symbol_code, symbol_name, symbol_type, data_source) "
+                         "VALUES ('BTCUSDT', 'dup', 'crypto', 'binance')")
+    assert not conn.in_transaction
+    assert conn.execute("SELECT symbol_name FROM symbols WHERE symbol_code = 'BTCUSDT'").fetchone()[0] != 'changed'
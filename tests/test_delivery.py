@@ -0,0 +1,76 @@
+import threading
+
+from delivery import AlertDeliveryQueue, MessageSink
+
+
+class RecordingSink(MessageSink):
+    """记录发送的消息；gate 未放行时 send 阻塞"""
+
+    name = 'recording'
+
+    def __init__(self):
+        self.sent = []
+        self.closed = False
+        self.sending = threading.Event()
+        self.gate = threading.Event()
+
+    def send(self, message):
+        self.sending.set()
+        self.gate.wait(5)
+        assert not self.closed, 'send after close'
+        self.sent.append(message)
+
+    def close(self):
+        self.closed = True
+
+
+def blocked_queue(**kwargs):
+    """第一条消息进入发送后阻塞，后续消息在队列中积压"""
+    sink = RecordingSink()
+    queue = AlertDeliveryQueue(sinks=[sink], max_retries=0, **kwargs)
+    queue.submit('first')
+    assert sink.sending.wait(5)
+    return queue, sink
+
+
+def test_backlog_is_coalesced_into_one_message():
+    queue, sink = blocked_queue(maxsize=10)
+    for i in range(3):
+        queue.submit(f"alert {i}")
+    sink.gate.set()
+
+    assert queue.join(5)
+    assert sink.sent == ['first', 'alert 0\n\nalert 1\n\nalert 2']
+    stats = queue.stats()['recording']
+    assert stats['sent'] == 2 and stats['coalesced'] == 2 and stats['dropped'] == 0
+    queue.close()
+
+
+def test_full_queue_merges_into_last_then_drops_oldest():
+    queue, sink = blocked_queue(maxsize=1, max_chars=20)
+    queue.submit('a' * 8)
+    # 队列已满，并入最后一条：8 + 2 + 8 <= 20
+    queue.submit('b' * 8)
+    # 合并后超过 max_chars，丢弃最早的一条
+    queue.submit('c' * 8)
+    sink.gate.set()
+
+    assert queue.join(5)
+    assert sink.sent == ['first', 'c' * 8]
+    stats = queue.stats()['recording']
+    assert stats['coalesced'] == 1 and stats['dropped'] == 1
+    queue.close()
+
+
+def test_close_does_not_close_sink_while_still_sending():
+    queue, sink = blocked_queue()
+    queue.submit('second')
+
+    queue.close(timeout=0.1)
+    assert not sink.closed
+
+    sink.gate.set()
+    worker = queue._workers[0]
+    worker.thread.join(5)
+    assert sink.sent == ['first', 'second']
+    assert sink.closed
@@ -0,0 +1,111 @@
+import pytest
+import requests
+
+from api_clients import APIClientFactory
+from api_clients.binance_client import BinanceClient
+from config import clock
+from config.metrics import FETCH_RESULTS_TOTAL
+from fetcher import MarketDataFetcher
+from models.market_data import MarketDataRepository
+
+
+class FakeClient:
+    supports_batch = False
+
+    def get_price(self, code):
+        return {'price': 1.0, 'market_time': clock.now(), 'source_api': 'binance'}
+
+
+@pytest.fixture
+def fake_binance(monkeypatch):
+    monkeypatch.setattr(APIClientFactory, 'get_client', staticmethod(lambda source: FakeClient()))
+    monkeypatch.setattr(APIClientFactory, 'is_available', staticmethod(lambda source: True))
+
+
+def binance_symbols():
+    return MarketDataRepository.get_active_symbols_by_source('binance')
+
+
+def test_tick_writes_once_at_end(db, fake_binance, monkeypatch):
+    batches = []
+    save_many = MarketDataRepository.save_many
+
+    def recording_save_many(rows):
+        batches.append(len(rows))
+        return save_many(rows)
+
+    monkeypatch.setattr(MarketDataRepository, 'save_many', staticmethod(recording_save_many))
+    fetcher = MarketDataFetcher()
+    # 即使写入间隔已到，add 也不在轮中写入
+    fetcher.writer.flush_interval = 0
+    fetcher.writer.max_rows = 1
+
+    stats = fetcher.fetch_all(symbols=binance_symbols())
+
+    assert batches == [2]
+    assert stats['success'] == 2 and stats['failed'] == 0
+
+
+def test_save_failure_counts_each_symbol_once(db, fake_binance, monkeypatch):
+    def failing_save_many(rows):
+        raise RuntimeError('disk I/O error')
+
+    monkeypatch.setattr(MarketDataRepository, 'save_many', staticmethod(failing_save_many))
+    fetcher = MarketDataFetcher()
+    fetcher.writer.flush_interval = 0
+
+    stats = fetcher.fetch_all(symbols=binance_symbols())
+
+    assert stats['success'] == 0 and stats['failed'] == 2
+    assert sorted(stats['errors']) == [
+        'BTCUSDT: save failed: disk I/O error',
+        'ETHUSDT: save failed: disk I/O error',
+    ]
+    assert len(fetcher.writer) == 0
+
+
+def test_fetch_results_metric_has_no_symbol_label(db, fake_binance):
+    MarketDataFetcher().fetch_all(symbols=binance_symbols())
+
+    assert FETCH_RESULTS_TOTAL.labelnames == ('provider', 'result')
+    assert FETCH_RESULTS_TOTAL.labels(provider='binance', result='ok').value >= 2
+    assert not any('symbol=' in sample for sample in FETCH_RESULTS_TOTAL.samples())
+
+
+class DelistedSymbolBinance(BinanceClient):
+    """批量请求中含已下架的 BADUSDT 时整批返回 400，单独请求 BADUSDT 也返回 400"""
+
+    def __init__(self):
+        super().__init__()
+        self.requests = []
+
+    def _request(self, path, params, timeout=None):
+        self.requests.append(dict(params))
+        if 'symbols' in params or params['symbol'] == 'BADUSDT':
+            response = requests.Response()
+            response.status_code = 400
+            raise requests.HTTPError('400 Client Error: Invalid symbol', response=response)
+        return {'symbol': params['symbol'], 'lastPrice': '1.5', 'volume': '10',
+                'closeTime': int(clock.timestamp() * 1000)}
+
+
+def test_rejected_batch_falls_back_to_per_symbol_requests(db, monkeypatch):
+    conn = db.get_connection()
+    with conn:
+        conn.execute('''
+            INSERT INTO symbols (symbol_code, symbol_name, symbol_type, data_source, update_interval)
+            VALUES ('BADUSDT', 'Delisted', 'crypto', 'binance', 5)
+        ''')
+    client = DelistedSymbolBinance()
+    monkeypatch.setitem(APIClientFactory._instances, 'binance', client)
+
+    stats = MarketDataFetcher().fetch_all(symbols=binance_symbols())
+
+    assert [list(params) for params in client.requests] == [['symbols'], ['symbol'], ['symbol'], ['symbol']]
+    # 只有下架的标的失败
+    assert stats['success'] == 2 and stats['failed'] == 1
+    assert len(stats['errors']) == 1 and stats['errors'][0].startswith('BADUSDT: 400')
+    assert MarketDataRepository.get_latest_price(
+        MarketDataRepository.get_symbol_by_code('ETHUSDT').symbol_id)['price'] == 1.5
+    # 被拒绝的请求不计入熔断
+    assert client.breaker.healthy()
@@ -0,0 +1,97 @@
+from datetime import datetime, timedelta
+
+from models.market_data import MarketDataRepository
+
+
+def save(symbol_id, market_time, price):
+    MarketDataRepository.save_many([{
+        'symbol_id': symbol_id, 'market_time': market_time, 'price': price,
+        'volume': None, 'source_api': 'binance_backfill',
+    }])
+
+
+def partition_counts(db):
+    conn = db.get_connection()
+    return {
+        name: conn.execute(f'SELECT COUNT(*) FROM {name}').fetchone()[0]
+        for name in db.list_partitions(conn)
+    }
+
+
+def test_rows_are_routed_to_monthly_partitions(db):
+    btc = MarketDataRepository.get_symbol_by_code('BTCUSDT').symbol_id
+    now = datetime.now()
+    times = [now - timedelta(days=100), now - timedelta(days=40), now]
+    for i, market_time in enumerate(times):
+        save(btc, market_time, 100.0 + i)
+
+    counts = partition_counts(db)
+    for market_time in times:
+        assert counts[db.partition_for(market_time.timestamp())] >= 1
+    assert sum(counts.values()) == 3
+    # market_data 视图覆盖所有分区
+    conn = db.get_connection()
+    assert conn.execute('SELECT COUNT(*) FROM market_data').fetchone()[0] == 3
+    assert MarketDataRepository.get_price_at(btc, now - timedelta(days=50)) == 100.0
+
+
+def test_retention_drops_expired_partitions_once_rolled_up(db):
+    btc = MarketDataRepository.get_symbol_by_code('BTCUSDT').symbol_id
+    now = datetime.now()
+    old, recent = now - timedelta(days=200), now - timedelta(days=10)
+    save(btc, old, 90.0)
+    save(btc, recent, 100.0)
+    old_partition = db.partition_for(old.timestamp())
+
+    # 汇总表尚未包含全部历史（如旧库刚升级）时不删除
+    db.set_meta('rollups_built', '0')
+    assert db.apply_retention(days=90) == []
+    assert old_partition in db.list_partitions()
+
+    db.set_meta('rollups_built', '1')
+    assert db.apply_retention(days=90) == [old_partition]
+
+    partitions = db.list_partitions()
+    assert old_partition not in partitions
+    assert db.partition_for(now.timestamp()) in partitions
+    conn = db.get_connection()
+    assert [row[0] for row in conn.execute('SELECT price FROM market_data')] == [100.0]
+    retained_from = float(db.get_meta('raw_retained_from'))
+    assert retained_from == db.partition_range(old_partition)[1]
+    # 再次执行没有可删除的分区
+    assert db.apply_retention(days=90) == []
+
+
+def test_migrate_legacy_table_to_partitions(db):
+    conn = db.get_connection()
+    now = datetime.now()
+    with db.ddl_transaction(conn):
+        conn.execute('DROP VIEW market_data')
+        for name in db.list_partitions(conn):
+            conn.execute(f'DROP TABLE {name}')
+        conn.execute('''
+            CREATE TABLE market_data (
+                data_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                symbol_id INTEGER NOT NULL,
+                market_time TIMESTAMP NOT NULL,
+                local_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                price REAL NOT NULL,
+                volume REAL,
+                source_api TEXT NOT NULL
+            )
+        ''')
+        conn.executemany(
+            "INSERT INTO market_data (symbol_id, market_time, price, source_api) VALUES (1, ?, ?, 'binance')",
+            [(db.encode_time(now - timedelta(days=days)), float(days)) for days in (70, 35, 0)]
+        )
+
+    assert db.migrate_to_partitions() == 3
+
+    counts = partition_counts(db)
+    assert sum(counts.values()) == 3
+    assert {db.partition_for((now - timedelta(days=days)).timestamp()) for days in (70, 35, 0)} <= set(counts)
+    assert conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'market_data_unpartitioned'").fetchone() is None
+    assert sorted(row[0] for row in conn.execute('SELECT price FROM market_data')) == [0.0, 35.0, 70.0]
+    # 再次调用无事可做
+    assert db.migrate_to_partitions() == 0
@@ -0,0 +1,54 @@
+import re
+from datetime import datetime, timedelta
+
+from config.database import partition_for
+from models.market_data import MarketDataRepository
+from models.price_cache import price_cache
+
+
+def save(symbol_id, market_time, price):
+    MarketDataRepository.save_many([{
+        'symbol_id': symbol_id, 'market_time': market_time, 'price': price,
+        'volume': None, 'source_api': 'binance_backfill',
+    }])
+
+
+def test_warm_reads_recent_partitions_and_falls_back_for_missing(db):
+    btc = MarketDataRepository.get_symbol_by_code('BTCUSDT').symbol_id
+    eth = MarketDataRepository.get_symbol_by_code('ETHUSDT').symbol_id
+    now = datetime.now()
+    old = now - timedelta(days=120)
+    save(btc, now - timedelta(minutes=10), 100.0)
+    save(btc, now - timedelta(hours=5), 95.0)
+    save(btc, now - timedelta(days=35), 94.0)
+    save(btc, now - timedelta(days=65), 93.0)
+    save(btc, now - timedelta(days=200), 90.0)
+    # ETH 最近几个月没有行情，只能在更早的分区找到 as-of
+    save(eth, old, 3000.0)
+
+    statements = []
+    conn = db.get_connection()
+    conn.set_trace_callback(statements.append)
+    try:
+        price_cache.warm()
+    finally:
+        conn.set_trace_callback(None)
+
+    assert price_cache.lookup(btc, now - timedelta(minutes=5)) == (True, 100.0)
+    assert price_cache.lookup(btc, now - timedelta(minutes=140)) == (True, 95.0)
+    assert price_cache.lookup(eth, now - timedelta(minutes=5)) == (True, 3000.0)
+
+    queries = [s for s in statements if 'SELECT symbol_id' in s]
+    # 不扫描 market_data 视图
+    assert not any(re.search(r'FROM market_data\b(?!_p)', s) for s in queries)
+    # 更早的分区只查仍缺失的标的：ETH 在其 as-of 所在分区找到后不再往前查
+    fallback = {}
+    for statement in queries:
+        match = re.search(r'FROM (market_data_p\d+)\s+WHERE symbol_id IN \(([\d,]+)\)', statement)
+        if match:
+            fallback[match.group(1)] = {int(i) for i in match.group(2).split(',')}
+    old_partition = partition_for(old.timestamp())
+    assert btc not in set().union(*fallback.values())
+    assert eth in fallback[old_partition]
+    older = [ids for name, ids in fallback.items() if name < old_partition]
+    assert older and all(eth not in ids for ids in older)
@@ -0,0 +1,99 @@
+import threading
+import time
+
+import pytest
+
+from scheduler import Scheduler, OVERRUN_CATCH_UP, OVERRUN_SKIP, POOL_MAINTENANCE
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def blocking_job(release):
+    calls = []
+
+    def func():
+        calls.append(threading.current_thread().name)
+        release.wait(5)
+    return func, calls
+
+
+def wait_idle(job, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while job.running:
+        assert time.monotonic() < deadline, f"{job.name} still running"
+        time.sleep(0.01)
+
+
+@pytest.mark.parametrize('policy, runs, skipped', [(OVERRUN_CATCH_UP, 2, 1), (OVERRUN_SKIP, 1, 2)])
+def test_overrun_policy(policy, runs, skipped):
+    clock = FakeClock()
+    scheduler = Scheduler(time_func=clock)
+    release = threading.Event()
+    func, calls = blocking_job(release)
+    job = scheduler.add_job('fetch', 10, func, policy=policy, max_catch_up=1)
+    try:
+        # 对齐到下一个 10 秒整点
+        assert job.next_run == 1010.0
+        for now in (1010.0, 1020.0, 1030.0):
+            clock.now = now
+            scheduler.run_pending()
+        release.set()
+        wait_idle(job)
+    finally:
+        scheduler.stop()
+
+    assert len(calls) == runs
+    assert job.stats['overruns'] == 2
+    assert job.stats['skipped'] == skipped
+    assert job.next_run == 1040.0
+
+
+def test_catch_up_after_scheduler_falls_behind():
+    clock = FakeClock()
+    scheduler = Scheduler(time_func=clock)
+    calls = []
+    job = scheduler.add_job('fetch', 10, lambda: calls.append(clock.now),
+                            policy=OVERRUN_CATCH_UP, max_catch_up=2)
+    try:
+        # 休眠 35 秒后醒来：错过 1020 / 1030 / 1040 三个触发点，最多补跑 2 次
+        clock.now = 1045.0
+        scheduler.run_pending()
+        wait_idle(job)
+    finally:
+        scheduler.stop()
+
+    assert len(calls) == 3
+    assert job.next_run == 1050.0
+
+
+def test_maintenance_jobs_do_not_delay_fetch_jobs():
+    clock = FakeClock()
+    scheduler = Scheduler(max_workers=1, maintenance_workers=1, time_func=clock)
+    release = threading.Event()
+    maintenance, _ = blocking_job(release)
+    fetched = threading.Event()
+    scheduler.add_job('retention', 10, maintenance, pool=POOL_MAINTENANCE, run_immediately=True)
+    scheduler.add_job('calibration', 10, maintenance, pool=POOL_MAINTENANCE, run_immediately=True)
+    scheduler.add_job('fetch', 10, fetched.set, run_immediately=True)
+    try:
+        scheduler.run_pending()
+        # 两个维护任务占满维护线程池（一个运行、一个排队），行情任务照常执行
+        assert fetched.wait(2)
+    finally:
+        release.set()
+        scheduler.stop()
+
+
+def test_unknown_pool_rejected():
+    scheduler = Scheduler()
+    try:
+        with pytest.raises(ValueError):
+            scheduler.add_job('fetch', 10, lambda: None, pool='nope')
+    finally:
+        scheduler.stop()
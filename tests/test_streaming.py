@@ -0,0 +1,260 @@
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip('websocket')
+ws_server = pytest.importorskip('websockets.sync.server')
+
+import streaming
+from models.market_data import MarketDataRepository
+from streaming import BinanceStreamIngestor
+
+
+def mini_ticker(code, price, volume, ts_ms):
+    return json.dumps({
+        'stream': f"{code.lower()}@miniTicker",
+        'data': {'e': '24hrMiniTicker', 'E': ts_ms, 's': code, 'c': str(price), 'v': str(volume)},
+    })
+
+
+def kline(code, price, volume, ts_ms):
+    return json.dumps({
+        'stream': f"{code.lower()}@kline_1m",
+        'data': {'e': 'kline', 'E': ts_ms, 's': code, 'k': {'c': str(price), 'v': str(volume)}},
+    })
+
+
+class FakeStreamServer:
+    """
+    本地组合流替身：每个连接依次取一个脚本 (messages, drop)，
+    发送 messages 后 drop 为 True 时断开，否则保持连接直到测试结束
+    """
+
+    def __init__(self, scripts):
+        self.scripts = list(scripts)
+        self.connections = []
+        self._closed = threading.Event()
+        self._server = ws_server.serve(self._handle, '127.0.0.1', 0)
+        self.port = self._server.socket.getsockname()[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"ws://127.0.0.1:{self.port}/stream"
+
+    def _handle(self, conn):
+        self.connections.append((time.monotonic(), conn.request.path))
+        messages, drop = self.scripts.pop(0) if self.scripts else ([], False)
+        for message in messages:
+            conn.send(message)
+        if not drop:
+            self._closed.wait()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._closed.set()
+        self._server.shutdown()
+        self._thread.join(5)
+
+
+def wait_until(predicate, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return predicate()
+
+
+def stored_rows(db):
+    return db.get_connection().execute(
+        'SELECT s.symbol_code, d.price, d.volume, d.source_api FROM market_data d '
+        'JOIN symbols s ON s.symbol_id = d.symbol_id ORDER BY s.symbol_code, d.price'
+    ).fetchall()
+
+
+def make_ingestor(db, **kwargs):
+    alerts = []
+    kwargs.setdefault('persist_interval', 0)
+    ingestor = BinanceStreamIngestor(on_alerts=lambda batch, message: alerts.extend(batch), **kwargs)
+    return ingestor, alerts
+
+
+def test_handle_message_mini_ticker_and_kline(db):
+    ingestor, _ = make_ingestor(db, url='ws://127.0.0.1:1/stream')
+    now_ms = int(time.time() * 1000)
+
+    ingestor.handle_message(mini_ticker('BTCUSDT', 50000.5, 123.4, now_ms))
+    ingestor.handle_message(kline('ETHUSDT', 3000.25, 5.5, now_ms))
+    # 未订阅的标的和其他事件忽略
+    ingestor.handle_message(mini_ticker('DOGEUSDT', 0.1, 1, now_ms))
+    ingestor.handle_message(json.dumps({'data': {'e': 'aggTrade', 's': 'BTCUSDT', 'E': now_ms}}))
+
+    assert ingestor.stats['messages'] == 2
+    assert len(ingestor.writer) == 2
+    ingestor.flush()
+    assert len(ingestor.writer) == 0
+    assert stored_rows(db) == [
+        ('BTCUSDT', 50000.5, 123.4, 'binance_ws'),
+        ('ETHUSDT', 3000.25, 5.5, 'binance_ws'),
+    ]
+
+
+def test_detection_runs_every_check_interval(db, monkeypatch):
+    ingestor, _ = make_ingestor(db, url='ws://127.0.0.1:1/stream', check_interval=0.2)
+    checked = []
+    monkeypatch.setattr(ingestor.detector, 'check_symbol',
+                        lambda symbol, price: checked.append((symbol.symbol_code, price)))
+    now_ms = int(time.time() * 1000)
+
+    ingestor.handle_message(mini_ticker('BTCUSDT', 50000, 1, now_ms))
+    ingestor.handle_message(mini_ticker('BTCUSDT', 50001, 1, now_ms + 100))
+    time.sleep(0.25)
+    ingestor.handle_message(mini_ticker('BTCUSDT', 50002, 1, now_ms + 300))
+
+    assert checked == [('BTCUSDT', 50000.0), ('BTCUSDT', 50002.0)]
+    assert len(ingestor.writer) == 3
+
+
+def seed_btc_move(db):
+    """BTCUSDT 阈值 2%，10 分钟前价格 100"""
+    conn = db.get_connection()
+    conn.execute("UPDATE symbols SET alert_threshold = 0.02 WHERE symbol_code = 'BTCUSDT'")
+    conn.commit()
+    MarketDataRepository.save_many([{
+        'symbol_id': MarketDataRepository.get_symbol_by_code('BTCUSDT').symbol_id,
+        'market_time': datetime.now() - timedelta(minutes=10),
+        'price': 100.0, 'volume': None, 'source_api': 'binance_backfill',
+    }])
+
+
+@pytest.mark.parametrize('cooldown, expected', [(300.0, 1), (0.0, 5)])
+def test_repeated_checks_alert_once_per_cooldown(db, cooldown, expected):
+    seed_btc_move(db)
+    ingestor, alerts = make_ingestor(db, url='ws://127.0.0.1:1/stream',
+                                     check_interval=0, alert_cooldown=cooldown)
+    now_ms = int(time.time() * 1000)
+
+    # 同一段 10% 的上涨在每条消息都检测
+    for i in range(5):
+        ingestor.handle_message(mini_ticker('BTCUSDT', 110, 1, now_ms + i * 1000))
+    ingestor.flush()
+
+    assert len(alerts) == expected
+    assert all(alert.triggered_5m and alert.direction == 'up' for alert in alerts)
+
+
+def test_reconnects_with_backoff_after_server_drops(db):
+    now_ms = int(time.time() * 1000)
+    scripts = [
+        ([mini_ticker('BTCUSDT', 50000, 1, now_ms)], True),
+        ([mini_ticker('BTCUSDT', 50100, 1, now_ms + 1000)], False),
+    ]
+    with FakeStreamServer(scripts) as server:
+        ingestor, _ = make_ingestor(db, url=server.url)
+        ingestor.start()
+        try:
+            assert wait_until(lambda: ingestor.stats['messages'] == 2)
+        finally:
+            ingestor.stop()
+
+    assert ingestor.stats['reconnects'] == 1
+    assert len(server.connections) == 2
+    (first, path), (second, _) = server.connections
+    assert path == '/stream?streams=btcusdt@miniTicker/ethusdt@miniTicker'
+    # 首次重连前退避 1 秒
+    assert second - first >= 0.9
+    # stop 时写入缓冲中的行情
+    assert [row[1] for row in stored_rows(db)] == [50000.0, 50100.0]
+
+
+def test_writer_flushes_batches_while_streaming(db, monkeypatch):
+    batches = []
+    save_many = MarketDataRepository.save_many
+
+    def recording_save_many(rows):
+        if rows:
+            batches.append(len(rows))
+        return save_many(rows)
+
+    monkeypatch.setattr(MarketDataRepository, 'save_many', staticmethod(recording_save_many))
+    now_ms = int(time.time() * 1000)
+    messages = [
+        mini_ticker('BTCUSDT', 50000, 1, now_ms),
+        kline('ETHUSDT', 3000, 2, now_ms),
+        mini_ticker('BTCUSDT', 50001, 1, now_ms + 1000),
+    ]
+    with FakeStreamServer([(messages, False)]) as server:
+        ingestor, _ = make_ingestor(db, url=server.url)
+        ingestor.writer.flush_interval = 1.0
+        ingestor.start()
+        try:
+            # 三条消息在一个写入间隔内到达，由接收循环的 maybe_flush 一次写入
+            assert wait_until(lambda: len(stored_rows(db)) == 3)
+            assert batches == [3]
+            assert len(ingestor.writer) == 0
+        finally:
+            ingestor.stop()
+
+    assert ingestor.stats == {'messages': 3, 'reconnects': 0, 'alerts': 0}
+
+
+def test_stream_url_subscribes_all_symbols(db):
+    ingestor, _ = make_ingestor(db, url=streaming.BINANCE_STREAM_URL)
+    assert ingestor.stream_url() == (
+        'wss://stream.binance.com:9443/stream?streams=btcusdt@miniTicker/ethusdt@miniTicker'
+    )
+
+
+def test_resubscribes_when_binance_symbols_change(db, monkeypatch):
+    monkeypatch.setattr(streaming, 'SYMBOL_REFRESH_INTERVAL', 0.2)
+    with FakeStreamServer([([], False), ([], False)]) as server:
+        ingestor, _ = make_ingestor(db, url=server.url)
+        ingestor.start()
+        try:
+            assert wait_until(lambda: len(server.connections) == 1)
+            conn = db.get_connection()
+            conn.execute('''
+                INSERT INTO symbols (symbol_code, symbol_name, symbol_type, data_source, update_interval)
+                VALUES ('SOLUSDT', 'Solana', 'crypto', 'binance', 5)
+            ''')
+            conn.commit()
+            assert wait_until(lambda: len(server.connections) == 2)
+        finally:
+            ingestor.stop()
+
+    assert server.connections[1][1].endswith('/ethusdt@miniTicker/solusdt@miniTicker')
+    assert ingestor.subscribed_codes() == {'BTCUSDT', 'ETHUSDT', 'SOLUSDT'}
+    # 按新订阅重连不计入断线
+    assert ingestor.stats['reconnects'] == 0
+
+
+def test_fetcher_polls_binance_symbols_not_subscribed(db, monkeypatch):
+    from api_clients import APIClientFactory
+    from config import clock
+    from fetcher import MarketDataFetcher
+
+    polled = []
+
+    class FakeClient:
+        supports_batch = False
+
+        def get_price(self, code):
+            polled.append(code)
+            return {'price': 1.0, 'market_time': clock.now(), 'source_api': 'binance'}
+
+    monkeypatch.setattr(APIClientFactory, 'get_client', staticmethod(lambda source: FakeClient()))
+    monkeypatch.setattr(APIClientFactory, 'is_available', staticmethod(lambda source: True))
+    btc = MarketDataRepository.get_symbol_by_code('BTCUSDT')
+    ingestor, _ = make_ingestor(db, url='ws://127.0.0.1:1/stream', symbols=[btc])
+
+    fetcher = MarketDataFetcher(exclude_symbols=ingestor.subscribed_codes())
+    fetcher.fetch_all(symbols=MarketDataRepository.get_active_symbols_by_source('binance'))
+
+    assert polled == ['ETHUSDT']
@@ -0,0 +1,39 @@
+from datetime import datetime, timedelta
+
+from models.alert_state import AlertRepository
+from models.market_data import MarketDataRepository
+
+
+def test_migrate_iso_text_to_epoch_ms(db):
+    assert db.get_time_format() == db.TIME_FORMAT_ISO
+    AlertRepository.init_table()
+    btc = MarketDataRepository.get_symbol_by_code('BTCUSDT').symbol_id
+    now = datetime.now().replace(microsecond=0)
+    # 分批阶段迁移的历史行情（跨两个分区）和收尾迁移的近期行情
+    times = ([now - timedelta(days=days) for days in (40, 3, 2)]
+             + [now - timedelta(minutes=minutes) for minutes in (30, 5)])
+    MarketDataRepository.save_many([
+        {'symbol_id': btc, 'market_time': t, 'price': float(i), 'volume': None, 'source_api': 'binance'}
+        for i, t in enumerate(times)
+    ])
+    triggered = now - timedelta(minutes=20)
+    conn = db.get_connection()
+    with conn:
+        conn.execute('INSERT INTO alert_states (symbol_id, last_trigger_time_30m) VALUES (?, ?)',
+                     (btc, db.encode_time(triggered)))
+
+    assert db.migrate_time_format(batch_size=2) == len(times) + 1
+
+    assert db.get_meta('time_format') == db.TIME_FORMAT_EPOCH_MS
+    assert db.get_time_format() == db.TIME_FORMAT_EPOCH_MS
+    rows = conn.execute('SELECT market_time, local_time, price FROM market_data ORDER BY market_time').fetchall()
+    assert [row[0] for row in rows] == [int(t.timestamp() * 1000) for t in times]
+    assert all(isinstance(row[1], int) for row in rows)
+    assert conn.execute('SELECT last_trigger_time_30m FROM alert_states').fetchone()[0] == \
+        int(triggered.timestamp() * 1000)
+
+    # 迁移后按新格式写入和查询
+    assert MarketDataRepository.get_price_at(btc, now - timedelta(minutes=10)) == 3.0
+    assert MarketDataRepository.get_price_at(btc, now - timedelta(days=1)) == 2.0
+    # 已迁移时直接返回
+    assert db.migrate_time_format() == 0
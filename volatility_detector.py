@@ -4,15 +4,46 @@
 """
 
 import sys
+import threading
+import time
 from datetime import datetime, timedelta
-from typing import Dict, Any, List, Optional, Tuple
+from typing import Dict, Any, Iterable, List, Optional, Set, Tuple
 from dataclasses import dataclass
 
 sys.path.insert(0, '/Users/yuchao/.openclaw/workspace/market_monitor')
 
-from models.symbol import Symbol
+from models.symbol import Symbol, DEFAULT_ALERT_THRESHOLD
 from models.market_data import MarketDataRepository
-from models.alert_state import AlertState, AlertRepository
+from models.alert_state import AlertState, AlertRepository, alert_store
+from models.price_cache import price_cache
+from config import clock
+from config.metrics import DETECTION_SECONDS, DETECTION_SYMBOL_SECONDS, ALERTS_TOTAL
+
+try:
+    import numpy as np
+except ImportError:  # 未安装 numpy 时 check_all 只能逐个检测
+    np = None
+
+# 检测窗口（分钟）
+WINDOWS = (5, 30, 120)
+
+# 暂停检测的标的：后台 backfill 补齐停机期间的数据之前，N 分钟前的价格会取到停机前的旧价，
+# 整段停机期间的涨跌会被当成一次 5m / 30m / 2h 波动触发预警并推高计数器
+_suspended: Set[int] = set()
+_suspended_lock = threading.Lock()
+
+def suspend_detection(symbol_ids: Iterable[int]):
+    """暂停这些标的的波动检测（行情照常写入）"""
+    with _suspended_lock:
+        _suspended.update(symbol_ids)
+
+def resume_detection(symbol_ids: Iterable[int]):
+    """恢复这些标的的波动检测"""
+    with _suspended_lock:
+        _suspended.difference_update(symbol_ids)
+
+def is_detection_suspended(symbol_id: int) -> bool:
+    return symbol_id in _suspended
 
 @dataclass
 class AlertResult:
@@ -31,30 +62,33 @@ class AlertResult:
 class VolatilityDetector:
     """波动检测器"""
     
-    def __init__(self):
+    def __init__(self, cooldown_seconds: float = 0.0):
+        """
+        cooldown_seconds: 同一标的同一规则同方向两次触发的最小间隔，冷却期内再次越过阈值不预警、计数器不升级。
+            5m / 30m / 2h 规则和 (1+n)*x 计数器按轮询节奏设计，实时流等高频检测时设为轮询间隔；
+            轮询时检测间隔本身就是冷却，默认不启用
+        """
+        self.cooldown_seconds = cooldown_seconds
+        # 5m 规则没有持久化的预警状态，上次触发 (时间, 方向) 只保存在内存中
+        self._last_5m: Dict[int, Tuple[datetime, str]] = {}
         self.repo = MarketDataRepository()
         AlertRepository.init_table()
+        # 首次使用时在后台预热价格缓存，预热完成前 get_price_at 查询数据库
+        price_cache.warm_in_background()
     
     def get_price_at(self, symbol_id: int, minutes_ago: int) -> Optional[float]:
-        """获取N分钟前的价格"""
-        from datetime import datetime, timedelta
-        import sqlite3
-        from config.database import get_connection
-        
-        target_time = datetime.now() - timedelta(minutes=minutes_ago)
-        
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT price FROM market_data 
-            WHERE symbol_id = ? AND market_time <= ?
-            ORDER BY market_time DESC
-            LIMIT 1
-        ''', (symbol_id, target_time))
-        row = cursor.fetchone()
-        conn.close()
-        
-        return row[0] if row else None
+        """获取N分钟前的价格，优先查内存缓存"""
+        target_time = clock.now() - timedelta(minutes=minutes_ago)
+        hit, price = price_cache.lookup(symbol_id, target_time)
+        if hit:
+            return price
+        return self.repo.get_price_at(symbol_id, target_time)
+    
+    def _in_cooldown(self, last_time: Optional[datetime], last_direction: Optional[str],
+                     direction: str, now: datetime) -> bool:
+        """距上次同方向触发不足 cooldown_seconds"""
+        return (self.cooldown_seconds > 0 and last_time is not None and last_direction == direction
+                and (now - last_time).total_seconds() < self.cooldown_seconds)
     
     def calculate_change(self, current_price: float, past_price: Optional[float]) -> float:
         """计算涨跌幅"""
@@ -63,6 +97,17 @@ class VolatilityDetector:
         return (current_price - past_price) / past_price
     
     def check_symbol(self, symbol: Symbol, current_price: float) -> Optional[AlertResult]:
+        """检测单个标的的波动（记录单标的检测耗时和预警次数；暂停检测的标的直接返回 None）"""
+        if is_detection_suspended(symbol.symbol_id):
+            return None
+        started = time.perf_counter()
+        alert = self._check_symbol(symbol, current_price)
+        DETECTION_SYMBOL_SECONDS.observe(time.perf_counter() - started)
+        if alert:
+            ALERTS_TOTAL.inc(symbol=symbol.symbol_code, direction=alert.direction)
+        return alert
+    
+    def _check_symbol(self, symbol: Symbol, current_price: float) -> Optional[AlertResult]:
         """检测单个标的的波动"""
         
         # 获取历史价格
@@ -77,11 +122,11 @@ class VolatilityDetector:
         
         threshold = symbol.alert_threshold
         if threshold is None:
-            threshold = 1.0
+            threshold = DEFAULT_ALERT_THRESHOLD
         
-        # 获取预警状态
-        state = AlertRepository.get_or_create(symbol.symbol_id)
-        now = datetime.now()
+        # 获取预警状态（内存中，flush_states 时统一写回）
+        state = alert_store.get(symbol.symbol_id)
+        now = clock.now()
         
         # 检查30分钟计数器是否过期
         if state.last_trigger_time_30m:
@@ -95,26 +140,34 @@ class VolatilityDetector:
                 state.m1 = 0
                 state.m2 = 0
         
+        # 确定方向
+        direction = 'up' if change_5m >= 0 else 'down'
+        
         # 检测5分钟波动（固定阈值）
-        triggered_5m = abs(change_5m) >= threshold
+        triggered_5m = (abs(change_5m) >= threshold
+                        and not self._in_cooldown(*self._last_5m.get(symbol.symbol_id, (None, None)),
+                                                  direction, now))
+        if triggered_5m and self.cooldown_seconds > 0:
+            self._last_5m[symbol.symbol_id] = (now, direction)
         
         # 检测30分钟波动（动态阈值）
         threshold_30m_up = (1 + state.n1) * threshold
         threshold_30m_down = (1 + state.n2) * threshold
-        triggered_30m_up = change_30m >= threshold_30m_up
-        triggered_30m_down = abs(change_30m) >= threshold_30m_down and change_30m < 0
+        triggered_30m_up = (change_30m >= threshold_30m_up and not self._in_cooldown(
+            state.last_trigger_time_30m, state.last_trigger_direction_30m, 'up', now))
+        triggered_30m_down = (abs(change_30m) >= threshold_30m_down and change_30m < 0 and not self._in_cooldown(
+            state.last_trigger_time_30m, state.last_trigger_direction_30m, 'down', now))
         triggered_30m = triggered_30m_up or triggered_30m_down
         
         # 检测2小时波动（动态阈值）
         threshold_2h_up = (1 + state.m1) * threshold
         threshold_2h_down = (1 + state.m2) * threshold
-        triggered_2h_up = change_2h >= threshold_2h_up
-        triggered_2h_down = abs(change_2h) >= threshold_2h_down and change_2h < 0
+        triggered_2h_up = (change_2h >= threshold_2h_up and not self._in_cooldown(
+            state.last_trigger_time_2h, state.last_trigger_direction_2h, 'up', now))
+        triggered_2h_down = (abs(change_2h) >= threshold_2h_down and change_2h < 0 and not self._in_cooldown(
+            state.last_trigger_time_2h, state.last_trigger_direction_2h, 'down', now))
         triggered_2h = triggered_2h_up or triggered_2h_down
         
-        # 确定方向
-        direction = 'up' if change_5m >= 0 else 'down'
-        
         # 更新计数器
         if triggered_30m_up:
             state.n1 += 1
@@ -138,9 +191,6 @@ class VolatilityDetector:
             state.last_trigger_time_2h = now
             state.last_trigger_direction_2h = 'down'
         
-        # 保存状态
-        AlertRepository.save(state)
-        
         # 判断是否触发预警
         if triggered_5m or triggered_30m or triggered_2h:
             return AlertResult(
@@ -158,17 +208,166 @@ class VolatilityDetector:
         
         return None
     
-    def check_all(self) -> List[AlertResult]:
-        """检测所有标的"""
-        symbols = self.repo.get_active_symbols()
-        alerts = []
+    def flush_states(self) -> int:
+        """把本轮变化的预警状态写回数据库"""
+        return alert_store.flush()
+    
+    def check_all(self, batch: bool = False) -> List[AlertResult]:
+        """
+        检测所有标的
+        batch: 为 True 且安装了 numpy 时，一次查询取出所有标的各窗口价格，
+        向量化计算涨跌幅、动态阈值和触发结果，结果与逐个检测一致
+        """
+        symbols = [s for s in self.repo.get_active_symbols() if not is_detection_suspended(s.symbol_id)]
+        
+        started = time.perf_counter()
+        if batch and np is not None:
+            alerts = self._check_all_batch(symbols)
+            for alert in alerts:
+                ALERTS_TOTAL.inc(symbol=alert.symbol_code, direction=alert.direction)
+            DETECTION_SECONDS.observe(time.perf_counter() - started, mode='batch')
+        else:
+            alerts = []
+            for symbol in symbols:
+                # 获取最新价格
+                latest = self.repo.get_latest_price(symbol.symbol_id)
+                if latest:
+                    alert = self.check_symbol(symbol, latest['price'])
+                    if alert:
+                        alerts.append(alert)
+            DETECTION_SECONDS.observe(time.perf_counter() - started, mode='scalar')
+        
+        self.flush_states()
+        return alerts
+    
+    def _check_all_batch(self, symbols: List[Symbol]) -> List[AlertResult]:
+        """check_symbol 的向量化版本，逐标的语义见 check_symbol"""
+        now = clock.now()
+        prices = self.repo.get_asof_prices([now - timedelta(minutes=m) for m in WINDOWS])
+        
+        # 只检测有最新价格的标的
+        symbols = [s for s in symbols if prices.get(s.symbol_id, (None,))[0] is not None]
+        if not symbols:
+            return []
         
-        for symbol in symbols:
-            # 获取最新价格
-            latest = self.repo.get_latest_price(symbol.symbol_id)
-            if latest:
-                alert = self.check_symbol(symbol, latest['price'])
-                if alert:
-                    alerts.append(alert)
+        def to_array(values) -> 'np.ndarray':
+            return np.array([np.nan if v is None else v for v in values], dtype=float)
         
+        rows = [prices[s.symbol_id] for s in symbols]
+        current = to_array(row[0] for row in rows)
+        
+        # 计算涨跌幅（没有历史价格或历史价格为 0 时为 0）
+        changes = []
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for i in range(1, len(WINDOWS) + 1):
+                past = to_array(row[i] for row in rows)
+                valid = ~np.isnan(past) & (past != 0)
+                changes.append(np.where(valid, (current - past) / past, 0.0))
+        change_5m, change_30m, change_2h = changes
+        
+        thresholds = np.array(
+            [DEFAULT_ALERT_THRESHOLD if s.alert_threshold is None else s.alert_threshold for s in symbols], dtype=float
+        )
+        
+        # 预警状态
+        states = [alert_store.get(s.symbol_id) for s in symbols]
+        n1 = np.array([st.n1 for st in states])
+        n2 = np.array([st.n2 for st in states])
+        m1 = np.array([st.m1 for st in states])
+        m2 = np.array([st.m2 for st in states])
+        now_ts = now.timestamp()
+        elapsed_30m = to_array(
+            None if st.last_trigger_time_30m is None else now_ts - st.last_trigger_time_30m.timestamp()
+            for st in states
+        )
+        elapsed_2h = to_array(
+            None if st.last_trigger_time_2h is None else now_ts - st.last_trigger_time_2h.timestamp()
+            for st in states
+        )
+        
+        # 检查计数器是否过期（NaN 比较结果为 False，即从未触发）
+        expired_30m = elapsed_30m > timedelta(minutes=30).total_seconds()
+        expired_2h = elapsed_2h > timedelta(hours=2).total_seconds()
+        n1 = np.where(expired_30m, 0, n1)
+        n2 = np.where(expired_30m, 0, n2)
+        m1 = np.where(expired_2h, 0, m1)
+        m2 = np.where(expired_2h, 0, m2)
+        
+        # 冷却期内同方向不再触发（未启用冷却时全为 False）
+        directions = ['up' if change >= 0 else 'down' for change in change_5m]
+        
+        def cooling(last: List[Tuple[Optional[datetime], Optional[str]]], wanted: List[str]) -> 'np.ndarray':
+            return np.array([
+                self._in_cooldown(last_time, last_direction, direction, now)
+                for (last_time, last_direction), direction in zip(last, wanted)
+            ], dtype=bool)
+        
+        last_5m = [self._last_5m.get(s.symbol_id, (None, None)) for s in symbols]
+        last_30m = [(st.last_trigger_time_30m, st.last_trigger_direction_30m) for st in states]
+        last_2h = [(st.last_trigger_time_2h, st.last_trigger_direction_2h) for st in states]
+        ups, downs = ['up'] * len(symbols), ['down'] * len(symbols)
+        cooling_5m = cooling(last_5m, directions)
+        cooling_30m_up, cooling_30m_down = cooling(last_30m, ups), cooling(last_30m, downs)
+        cooling_2h_up, cooling_2h_down = cooling(last_2h, ups), cooling(last_2h, downs)
+        
+        # 5分钟固定阈值，30分钟 / 2小时动态阈值 (1+n)*x
+        triggered_5m = (np.abs(change_5m) >= thresholds) & ~cooling_5m
+        triggered_30m_up = (change_30m >= (1 + n1) * thresholds) & ~cooling_30m_up
+        triggered_30m_down = (np.abs(change_30m) >= (1 + n2) * thresholds) & (change_30m < 0) & ~cooling_30m_down
+        triggered_30m = triggered_30m_up | triggered_30m_down
+        triggered_2h_up = (change_2h >= (1 + m1) * thresholds) & ~cooling_2h_up
+        triggered_2h_down = (np.abs(change_2h) >= (1 + m2) * thresholds) & (change_2h < 0) & ~cooling_2h_down
+        triggered_2h = triggered_2h_up | triggered_2h_down
+        if self.cooldown_seconds > 0:
+            for i in np.flatnonzero(triggered_5m):
+                self._last_5m[symbols[i].symbol_id] = (now, directions[i])
+        
+        # 只回写状态有变化的标的
+        changed = expired_30m | expired_2h | triggered_30m | triggered_2h
+        for i in np.flatnonzero(changed):
+            state = states[i]
+            if expired_30m[i]:
+                state.n1 = 0
+                state.n2 = 0
+            if expired_2h[i]:
+                state.m1 = 0
+                state.m2 = 0
+            
+            if triggered_30m_up[i]:
+                state.n1 += 1
+                state.n2 = 0
+                state.last_trigger_time_30m = now
+                state.last_trigger_direction_30m = 'up'
+            elif triggered_30m_down[i]:
+                state.n1 = 0
+                state.n2 += 1
+                state.last_trigger_time_30m = now
+                state.last_trigger_direction_30m = 'down'
+            
+            if triggered_2h_up[i]:
+                state.m1 += 1
+                state.m2 = 0
+                state.last_trigger_time_2h = now
+                state.last_trigger_direction_2h = 'up'
+            elif triggered_2h_down[i]:
+                state.m1 = 0
+                state.m2 += 1
+                state.last_trigger_time_2h = now
+                state.last_trigger_direction_2h = 'down'
+        
+        alerts = []
+        for i in np.flatnonzero(triggered_5m | triggered_30m | triggered_2h):
+            symbol = symbols[i]
+            alerts.append(AlertResult(
+                symbol_code=symbol.symbol_code,
+                symbol_name=symbol.symbol_name,
+                threshold=DEFAULT_ALERT_THRESHOLD if symbol.alert_threshold is None else symbol.alert_threshold,
+                change_5m=float(change_5m[i]),
+                change_30m=float(change_30m[i]),
+                change_2h=float(change_2h[i]),
+                triggered_5m=bool(triggered_5m[i]),
+                triggered_30m=bool(triggered_30m[i]),
+                triggered_2h=bool(triggered_2h[i]),
+                direction='up' if change_5m[i] >= 0 else 'down'
+            ))
         return alerts